@@ -213,8 +213,7 @@ class TestSagittalFocusing(object):
         print(_headstr.format('#', 'X', 'Y', 'Z'))
         for aN in range(6):
             chi = self.rc.get_chi2(aN=aN)
-            axoff = self.rc.get_axoff(chi)
-            axyz = self.rc.get_ana_pos(aXoff=axoff)
+            axyz = self.rc.get_ana_pos(chi)
             if aN == 0: xyz0 -= axyz #output relative to the cen ana
             pxyz = [i+j for i,j in zip(axyz, xyz0)]
             print(_outstr.format(aN, *pxyz))
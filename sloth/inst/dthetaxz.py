@@ -32,6 +32,19 @@ INSB_2D111 = 7.480 # from SG
 
 #
 DEBUG = False
+CHUNK_POINTS = 100000 # mesh points evaluated at once by getDthetaDats
+
+# (R1, R1p, R2, R2p) for each case number (see dThetaXZ docstring),
+# None stands for sin^2(thetab)
+CASE_RADII = {1 : (1., 1., np.inf, np.inf),
+              2 : (0.5, 1., np.inf, np.inf),
+              3 : (1., 1., 1., 1.),
+              4 : (0.5, 1., 0.5, 1.),
+              5 : (0.5, 1., 1., 1.),
+              6 : (0.5, 1., 0.5, 0.5),
+              7 : (0.5, 1., None, None),
+              8 : (np.inf, 1., None, None),
+              9 : (1., 1., None, None)}
 
 def mapCase2Num(case):
     dc2n = {'Johann' : 1,
@@ -85,6 +98,63 @@ def mapNum2Case(case, mode='label'):
     except:
         return 'Unknown'
 
+def getCaseNum(case):
+    """case number from int or str (see dThetaXZ), NameError if unknown"""
+    if case in CASE_RADII:
+        return case
+    ncase = mapCase2Num(case)
+    if ncase == 0:
+        raise NameError("case '{0}' unknown".format(case))
+    return ncase
+
+def getCaseRadii(cases, thetab):
+    """radii table for given cases and Bragg angles
+
+    Parameters
+    ----------
+    cases : int/str or list of, see dThetaXZ()
+    thetab : float or array of floats, Bragg angles [deg]
+
+    Returns
+    -------
+    R1, R1p, R2, R2p : arrays of shape (len(cases), len(thetab)) (or
+                       scalars for scalar inputs)
+    """
+    _scalar = (np.ndim(thetab) == 0) and isinstance(cases, (int, str))
+    ncases = [getCaseNum(cs) for cs in np.atleast_1d(np.array(cases, dtype=object))]
+    sin2 = np.sin(np.deg2rad(np.atleast_1d(np.asarray(thetab, dtype=float))))**2
+    radii = np.empty((4, len(ncases), sin2.size))
+    for ic, ncase in enumerate(ncases):
+        for ir, rad in enumerate(CASE_RADII[ncase]):
+            radii[ir, ic] = sin2 if rad is None else rad
+    if _scalar:
+        return tuple(radii[:, 0, 0])
+    return tuple(radii)
+
+def getCoeffs(thetab, cases):
+    """A1, A2, A3, A4 coefficients of dThetaXZ for all (case, angle)
+
+    Parameters
+    ----------
+    thetab : float or array of floats, Bragg angles [deg]
+    cases : int/str or list of, see dThetaXZ()
+
+    Returns
+    -------
+    A1, A2, A3, A4 : arrays of shape (len(cases), len(thetab)) (or
+                     scalars for scalar inputs)
+    """
+    R1, R1p, R2, R2p = [np.asarray(_r) for _r in getCaseRadii(cases, thetab)]
+    rthetab = np.deg2rad(np.asarray(thetab, dtype=float))
+    if R1.ndim == 2:
+        rthetab = np.atleast_1d(rthetab)[None, :]
+    cot = 1./np.tan(rthetab)
+    A1 = cot * (1. - 1./(2.*R1))
+    A2 = cot**2 * (1. - 1./(2.*R1))
+    A3 = (np.tan(rthetab)/2.) * ( (1./R2) - (1./(R2p**2)) ) + ( 1./(2.*np.sin(rthetab)*np.cos(rthetab)) ) * ( (2./R2p) - (1./R2) - 1.)
+    A4 = (1./(2.*R2)) + (1./(2.*R2p)) - (1/(2.*R2p**2)) + (1./(np.sin(rthetab)**2)) * ((1./R2p) - (1./(2*R2)) - 1.)
+    return A1, A2, A3, A4
+
 def dThetaXZ(x, z, thetab, case=None):
     """Analytical espression of the angular deviation from Bragg
     reflection over a diffractor in conventional point-to-point
@@ -163,80 +233,42 @@ def dThetaXZ(x, z, thetab, case=None):
     planes. This is crucial for converting to real dimensions (mm).
 
     """
-    rthetab = np.deg2rad(thetab)
-    # CASES
-    if (case == 1 or case == 'Johann' or case == 'Jn'):
-        R1 = 1.
-        R1p = 1.
-        R2 = np.inf
-        R2p = np.inf
-    elif (case == 2 or case == 'Johansson' or case == 'Js'):
-        R1 = 0.5
-        R1p = 1.
-        R2 = np.inf
-        R2p = np.inf
-    elif (case == 3 or case == 'Spherical plate' or case == 'Spherical Jn' or case == 'SphJn'):
-        R1 = 1.
-        R1p = 1.
-        R2 = 1.
-        R2p = 1.
-    elif (case == 4 or case == 'Spherical Johansson' or case == 'Spherical Js' or case == 'SphJs'):
-        R1 = 0.5
-        R1p = 1.
-        R2 = 0.5
-        R2p = 1.
-    elif (case == 5 or case == 'Wittry' or case == 'Toroidal Js' or case == 'TorJs'):
-        R1 = 0.5
-        R1p = 1.
-        R2 = 1.
-        R2p = 1.
-    elif (case == 6 or case == 'Js 45 deg focusing' or case == 'Js45focus'):
-        R1 = 0.5
-        R1p = 1.
-        R2 = 0.5
-        R2p = 0.5
-    elif (case == 7 or case == 'Js focusing' or case == 'JsFocus'):
-        R1 = 0.5
-        R1p = 1.
-        R2 = math.sin(rthetab)**2
-        R2p = math.sin(rthetab)**2
-    elif (case == 8 or case == 'Berreman'):
-        R1 = np.inf
-        R1p = 1.
-        R2 = math.sin(rthetab)**2
-        R2p = math.sin(rthetab)**2
-    elif (case == 9 or case == 'Jn focusing' or case == 'JnFocus'):
-        R1 = 1.
-        R1p = 1.
-        R2 = math.sin(rthetab)**2
-        R2p = math.sin(rthetab)**2
-    else:
-        raise NameError("case '{0}' unknown".format(case))
-
-    # COEFFICIENTS
-    if (R2p == 1. or R2p == np.inf):
-        A4p = 0.
-    else:
-        A4p = (1. - R2p) / (R2p**2) 
-    A1 = (1./math.tan(rthetab)) * (1. - 1./(2.*R1))
-    A2 = (1./math.tan(rthetab))**2 * (1. - 1./(2.*R1))
-    A3 = (math.tan(rthetab)/2.) * ( (1./R2) - (1./(R2p**2)) ) + ( 1./(2.*math.sin(rthetab)*math.cos(rthetab)) ) * ( (2./R2p) - (1./R2) - 1.)
-    #A4 = (1./(2.*R2)) - (1./(4.*R2p)) + (1/(4.*R2p**2)) + (1./(math.sin(rthetab)**2)) * ((1./R2p) - (1./(2*R2)) - 1.)
-    A4 = (1./(2.*R2)) + (1./(2.*R2p)) - (1/(2.*R2p**2)) + (1./(math.sin(rthetab)**2)) * ((1./R2p) - (1./(2*R2)) - 1.)
+    ncase = getCaseNum(case)
+    A1, A2, A3, A4 = [float(_a) for _a in getCoeffs(thetab, ncase)]
 
     if DEBUG:
+        R1, R1p, R2, R2p = [float(_r) for _r in getCaseRadii(ncase, thetab)]
         print('Analytical DeltaTheta(x,z) for {0}'.format(case))
         print('Radii: R1={0}, R1p={1}, R2={2}, R2p={3}'.format(R1, R1p, R2, R2p))
         print('Coefficients:')
         print('A1 = {0}'.format(A1))
         print('A2 = {0}'.format(A2))
         print('A3 = {0}'.format(A3))
-        print('A4p = {0}'.format(A4p))
         print('A4 = {0}'.format(A4))
     
     return A1 * x**2 + A2 * x**3 + A3 * z**2 + A4 * x * z**2
 
-def getMeshMasked(mask='circular', r1p=1000., cryst_x=50., cryst_z=10., csteps=1000j):
+def dThetaXZs(x, z, thetab, cases):
+    """dThetaXZ for all the combinations of cases and Bragg angles
+
+    Parameters
+    ----------
+    x, z : arrays of floats (same shape)
+    thetab : float or array of floats, Bragg angles [deg]
+    cases : int/str or list of, see dThetaXZ()
+
+    Returns
+    -------
+    dth : array of shape (len(cases), len(thetab)) + x.shape
+    """
+    x, z = np.asarray(x), np.asarray(z)
+    A1, A2, A3, A4 = [np.atleast_2d(_a) for _a in getCoeffs(np.atleast_1d(thetab), np.atleast_1d(cases))]
+    _sh = A1.shape + (1,) * x.ndim
+    A1, A2, A3, A4 = [_a.reshape(_sh) for _a in (A1, A2, A3, A4)]
+    x2, z2 = x**2, z**2
+    return A1 * x2 + A2 * x2 * x + A3 * z2 + A4 * x * z2
+
+def getMeshMasked(mask='circular', r1p=1000., cryst_x=50., cryst_z=10., csteps=1000j, dtype=None):
     """ returns two 2D masked arrays representing a (flat) grid of the crystal surface
     
     Parameters
@@ -247,41 +279,127 @@ def getMeshMasked(mask='circular', r1p=1000., cryst_x=50., cryst_z=10., csteps=1
               (for rectangular mask, this is half side in meridional/dispersive x-direction) [50.]
     cryst_z : half side in sagittal/focusing z-direction of the rectangular analyzer in mm [10.]
     csteps  : grid steps (given as imaginary number!) [1000j]
+    dtype   : data type of the grid, e.g. np.float32 to halve memory [None -> float64]
+
+    Notes
+    -----
+    Only the requested shape is built: circular meshes have rows along
+    z and columns along x (np.meshgrid layout), rectangular ones rows
+    along x and columns along z (np.mgrid layout). The two masked
+    arrays share the same mask. For large 'csteps' see MeshSpans.
     """
-    zmin, zmax =  -1*cryst_x/r1p, cryst_x/r1p
-    xmin, xmax = -1.*cryst_x/r1p, cryst_x/r1p
-    x0 = np.linspace(xmin, xmax, csteps.imag)
-    z0 = np.linspace(zmin, zmax, csteps.imag)
-    xx0, zz0 = np.meshgrid(x0, z0)
-    # using a circular crystal of given 'cryst_x'
-    xx1, zz1 = np.mgrid[xmin:xmax:csteps, zmin:zmax:csteps]
-    cmask = xx1**2 + zz1**2 >= (cryst_x/r1p)**2
-    mxx1 = ma.array(xx0, mask=cmask)
-    mzz1 = ma.array(zz0, mask=cmask)
-    # using a rectangular crystal of given ('cryst_x', 'cryst_z')
-    rmask1 = zz1 <= -cryst_z/r1p
-    rmask2 = zz1 >= cryst_z/r1p
-    mxx2 = ma.array(xx1, mask=ma.mask_or(rmask1, rmask2))
-    mzz2 = ma.array(zz1, mask=ma.mask_or(rmask1, rmask2))
-    # returns
+    x0 = np.linspace(-1.*cryst_x/r1p, cryst_x/r1p, int(csteps.imag))
+    if dtype is not None:
+        x0 = x0.astype(dtype)
+    nx = x0.size
     if ('circ' in mask.lower()):
-        return mxx1, mzz1
+        # using a circular crystal of given 'cryst_x'
+        cmask = np.add.outer(x0**2, x0**2) >= (cryst_x/r1p)**2
+        xx = np.empty((nx, nx), dtype=x0.dtype)
+        zz = np.empty((nx, nx), dtype=x0.dtype)
+        xx[:] = x0[None, :]
+        zz[:] = x0[:, None]
     elif ('rect' in mask.lower()):
-        return mxx2, mzz2
+        # using a rectangular crystal of given ('cryst_x', 'cryst_z')
+        cmask = np.empty((nx, nx), dtype=bool)
+        cmask[:] = ((x0 <= -cryst_z/r1p) | (x0 >= cryst_z/r1p))[None, :]
+        xx = np.empty((nx, nx), dtype=x0.dtype)
+        zz = np.empty((nx, nx), dtype=x0.dtype)
+        xx[:] = x0[:, None]
+        zz[:] = x0[None, :]
     else:
         return 0
+    return ma.array(xx, mask=cmask), ma.array(zz, mask=cmask)
+
+class MeshSpans(object):
+    """crystal aperture on a regular (x, z) grid as row spans
+
+    Same grid and aperture of getMeshMasked() but, instead of 2D
+    arrays and a boolean mask, only the first and last+1 valid column
+    of each row are stored (rows along z, columns along x). The valid
+    points are generated on demand by chunks of rows (iterChunks()),
+    thus memory scales with the grid side, not with its area.
+    """
+
+    def __init__(self, mask='circular', r1p=1000., cryst_x=50., cryst_z=10., csteps=1000j, dtype=None):
+        """same parameters of getMeshMasked()"""
+        x0 = np.linspace(-1.*cryst_x/r1p, cryst_x/r1p, int(csteps.imag))
+        if dtype is not None:
+            x0 = x0.astype(dtype)
+        self.mask = mask
+        self.x0 = x0
+        self.z0 = x0
+        if ('circ' in mask.lower()):
+            # |x| < sqrt(rc**2 - z**2): valid columns are contiguous,
+            # found by blocks of rows with the same comparison of
+            # getMeshMasked()
+            x2 = x0**2
+            nvalid = np.empty(x0.size, dtype=int)
+            self.start = np.empty(x0.size, dtype=int)
+            for i in range(0, x0.size, 256):
+                valid = np.add.outer(x2[i:i+256], x2) < (cryst_x/r1p)**2
+                nvalid[i:i+256] = np.count_nonzero(valid, axis=1)
+                self.start[i:i+256] = np.argmax(valid, axis=1)
+        elif ('rect' in mask.lower()):
+            # all x, rows with |z| < cryst_z
+            zval = (x0 > -cryst_z/r1p) & (x0 < cryst_z/r1p)
+            nvalid = np.where(zval, x0.size, 0)
+            self.start = np.zeros(x0.size, dtype=int)
+        else:
+            raise NameError("mask '{0}' unknown".format(mask))
+        self.stop = self.start + nvalid
+        self.cell = float(x0[1] - x0[0])**2
+
+    @property
+    def npoints(self):
+        """number of valid points"""
+        return int(np.sum(self.stop - self.start))
+
+    def iterChunks(self, chunk=CHUNK_POINTS):
+        """iterate over the valid (x, z) points in 1D arrays of
+        (about, whole rows) 'chunk' points"""
+        lens = self.stop - self.start
+        rows = np.flatnonzero(lens)
+        cum = np.cumsum(lens[rows])
+        i0, n0 = 0, 0
+        while i0 < rows.size:
+            i1 = max(np.searchsorted(cum, n0 + chunk, side='right'), i0 + 1)
+            _rows, _lens = rows[i0:i1], lens[rows[i0:i1]]
+            # column index of each point of the rows block
+            offs = np.repeat(np.cumsum(_lens) - _lens, _lens)
+            cols = np.arange(offs.size) - offs + np.repeat(self.start[_rows], _lens)
+            yield self.x0[cols], np.repeat(self.z0[_rows], _lens)
+            n0 = cum[i1-1]
+            i0 = i1
+
+    def getMeshMasked(self):
+        """(mxx, mzz) masked arrays (meshgrid layout) e.g. for plots"""
+        cols = np.arange(self.x0.size)
+        cmask = (cols[None, :] < self.start[:, None]) | (cols[None, :] >= self.stop[:, None])
+        xx, zz = np.meshgrid(self.x0, self.z0)
+        return ma.array(xx, mask=cmask), ma.array(zz, mask=cmask)
+
+def _iterPoints(mxx, mzz, chunk=CHUNK_POINTS):
+    """iterate over the not masked (x, z) points in 1D chunks"""
+    mxx, mzz = ma.asarray(mxx), ma.asarray(mzz)
+    valid = ~(ma.getmaskarray(mxx) | ma.getmaskarray(mzz))
+    xv, zv = mxx.data[valid], mzz.data[valid]
+    for i in range(0, xv.size, chunk):
+        yield xv[i:i+chunk], zv[i:i+chunk]
 
 def getDthetaDats(mxx, mzz, wrc=1.25E-4,
                   cases=['Johann', 'Johansson', 'Spherical plate', 'Wittry'],
-                  angles=[15, 45, 75]):
+                  angles=[15, 45, 75], chunk=CHUNK_POINTS):
     """calculates data (see returns for details) in given loops
     
     Parameters
     ----------
-    mxx, mzz : 2D masked meshgrids, (X,Z) mapping of the analyzer
+    mxx, mzz : 2D masked meshgrids, (X,Z) mapping of the analyzer,
+               or MeshSpans object and None
     wrc : width of the analyzer rocking curve in rad [1.25E-4]
     cases : list of str, see cases in dThetaXZ()
     angles : list of int/floats, Bragg angles 
+    chunk : int, number of mesh points evaluated at once [CHUNK_POINTS]
 
     Returns
     -------
@@ -293,45 +411,152 @@ def getDthetaDats(mxx, mzz, wrc=1.25E-4,
         dd[case]['sa'] : solid angle
         dd[case]['eres'] : energy resolution
 
-    NOTE: dth, mdth not stored (too much space in memory!)
+    NOTE: dth, mdth not stored (too much space in memory!); all
+          cases and angles are evaluated together on chunks of the
+          valid mesh points, see getCoeffs()
     """
     dd = {} #container dictonary to store results
-    for cs in cases:
+    if isinstance(mxx, MeshSpans):
+        cell = mxx.cell
+        points = mxx.iterChunks(chunk=chunk)
+    else:
+        gridSizeXX = (mxx.data[0][1]-mxx.data[0][0])**2
+        gridSizeZZ = (mzz.data[0][1]-mzz.data[0][0])**2
+        cell = gridSizeXX if (not gridSizeXX == 0.) else gridSizeZZ
+        points = _iterPoints(mxx, mzz, chunk=chunk)
+    #: all (case, angle) evaluated at once, on chunks of valid points
+    A1, A2, A3, A4 = [_a.ravel()[:, None] for _a in getCoeffs(np.atleast_1d(angles), cases)]
+    ncomb = A1.shape[0]
+    count = np.zeros(ncomb)
+    dmin = np.empty(ncomb)
+    dmin.fill(np.inf)
+    dmax = -dmin
+    for x, z in points:
+        # monomials shared by all the cases and angles
+        x2, z2 = x**2, z**2
+        dth = A1 * x2 + A2 * (x2 * x) + A3 * z2 + A4 * (x * z2)
+        count += np.count_nonzero(np.abs(dth) <= wrc, axis=1)
+        dmin = np.minimum(dmin, dth.min(axis=1))
+        dmax = np.maximum(dmax, dth.max(axis=1))
+    count, dmin, dmax = [_a.reshape(len(cases), len(angles)) for _a in (count, dmin, dmax)]
+    for ic, cs in enumerate(cases):
         dd[cs] = {}
         dd[cs]['thetaB'] = angles
-        #dd[cs]['dth'] = []
-        #dd[cs]['mdth'] = []
         dd[cs]['sa'] = []
         dd[cs]['eres'] = []
-        print('Angle loop for {0}...'.format(cs))
-        for th in angles:
-            dth = dThetaXZ(mxx, mzz, th, case=cs)
-            # calc effective (< wrc) solid angle and energy resolution
-            mdth = ma.masked_where(np.abs(dth) > wrc, dth)
-            gridSizeXX = (mxx.data[0][1]-mxx.data[0][0])**2
-            gridSizeZZ = (mzz.data[0][1]-mzz.data[0][0])**2
-            if not (gridSizeXX == 0.):
-                mm = ma.ones(mxx.shape)
-                mm = mm * gridSizeXX
-            elif not (gridSizeZZ == 0.):
-                mm = ma.ones(mzz.shape)
-                mm = mm * gridSizeZZ
-            else:
+        if DEBUG: print('Angle loop for {0}...'.format(cs))
+        for ith, th in enumerate(angles):
+            if (cell == 0.):
                 print('Error: 0 grid size in solid angle for {0} at {1} deg'.format(cs, th))
                 continue
-            mm.mask = mdth.mask
-            #eff_area = (mm.sum()/(mm.shape[0]*mm.shape[1]))*(np.pi*(r_cryst**2))
-            eff_sa = mm.sum()/math.sin(np.deg2rad(th))
-            #eres = math.sqrt((mdth.max()-mdth.min())**2 + wrc**2)/math.tan(np.deg2rad(th))
-            eres = math.sqrt((dth.max()-dth.min())**2 + wrc**2)/math.tan(np.deg2rad(th))
-            # append to output
-            #dd[cs]['dth'].append(dth)
-            #dd[cs]['mdth'].append(mdth)
+            eff_sa = count[ic, ith]*cell/math.sin(np.deg2rad(th))
+            eres = math.sqrt((dmax[ic, ith]-dmin[ic, ith])**2 + wrc**2)/math.tan(np.deg2rad(th))
             dd[cs]['sa'].append(eff_sa)
             dd[cs]['eres'].append(eres)
     #
     return dd
 
+def _zAccepted(a, b, zmax, wrc):
+    """length of the z interval in [-zmax, zmax] where |a + b*z**2| <= wrc
+
+    a, b, zmax : arrays of the same shape (one value per row x)
+    """
+    u2 = zmax**2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ulo = np.where(b > 0, (-wrc-a)/b, (wrc-a)/b)
+        uhi = np.where(b > 0, (wrc-a)/b, (-wrc-a)/b)
+    # b == 0: all or nothing
+    b0 = (b == 0)
+    ulo = np.where(b0, np.where(np.abs(a) <= wrc, 0., np.inf), ulo)
+    uhi = np.where(b0, np.where(np.abs(a) <= wrc, u2, -np.inf), uhi)
+    ulo = np.clip(ulo, 0., u2)
+    uhi = np.clip(uhi, 0., u2)
+    return 2. * np.where(uhi > ulo, np.sqrt(uhi) - np.sqrt(ulo), 0.)
+
+def _realRoots(coeffs, xmax):
+    """real roots in (-xmax, xmax) of a polynomial (highest power first)"""
+    coeffs = np.trim_zeros(np.asarray(coeffs, dtype=float), 'f')
+    if coeffs.size < 2:
+        return []
+    rts = np.roots(coeffs)
+    rts = rts.real[np.abs(rts.imag) <= 1E-12*max(xmax, 1.)]
+    return list(rts[np.abs(rts) < xmax])
+
+def getDthetaDatsAnalytic(mask='circular', r1p=1000., cryst_x=50., cryst_z=10.,
+                          wrc=1.25E-4,
+                          cases=['Johann', 'Johansson', 'Spherical plate', 'Wittry'],
+                          angles=[15, 45, 75],
+                          epsabs=1E-12, epsrel=1E-8, nx=4001):
+    """as getDthetaDats() but without meshes
+
+    Being dThetaXZ = a(x) + b(x)*z**2 (a = A1*x**2 + A2*x**3, b = A3 +
+    A4*x), the accepted z length of each row, |dThetaXZ| < wrc, is
+    analytic and the accepted area is integrated over x with adaptive
+    quadrature (scipy.integrate.quad). The energy resolution is
+    obtained from the extremes of each row, a(x) and a(x) +
+    b(x)*zmax(x)**2, on 'nx' rows.
+
+    Parameters
+    ----------
+    mask, r1p, cryst_x, cryst_z : as in getMeshMasked()
+    wrc, cases, angles : as in getDthetaDats()
+    epsabs, epsrel : tolerances of the quadrature [1E-12, 1E-8]
+    nx : int, number of rows for the energy resolution [4001]
+
+    Returns
+    -------
+    dd : as getDthetaDats() with, in addition
+         dd[case]['sa_err'] : error estimate on the solid angle
+    """
+    from scipy.integrate import quad
+    xmax = cryst_x/r1p
+    if ('circ' in mask.lower()):
+        def _zmax(x):
+            return np.sqrt(np.clip(xmax**2 - x**2, 0., None))
+    elif ('rect' in mask.lower()):
+        def _zmax(x):
+            return np.ones_like(x) * (cryst_z/r1p)
+    else:
+        raise NameError("mask '{0}' unknown".format(mask))
+    A1, A2, A3, A4 = getCoeffs(np.atleast_1d(angles), cases)
+    xr = np.linspace(-xmax, xmax, nx)
+    zr = _zmax(xr)
+    dd = {}
+    for ic, cs in enumerate(cases):
+        dd[cs] = {}
+        dd[cs]['thetaB'] = angles
+        dd[cs]['sa'] = []
+        dd[cs]['sa_err'] = []
+        dd[cs]['eres'] = []
+        for ith, th in enumerate(angles):
+            a1, a2, a3, a4 = A1[ic, ith], A2[ic, ith], A3[ic, ith], A4[ic, ith]
+            def _lz(x):
+                x = np.asarray(x, dtype=float)
+                return _zAccepted(a1*x**2 + a2*x**3, a3 + a4*x, _zmax(x), wrc)
+            # x where the accepted z interval changes form (a(x) = +/-wrc
+            # and a(x) + b(x)*zmax(x)**2 = +/-wrc, cubics in x) as
+            # break points for the quadrature
+            kinks = []
+            for sw in (-wrc, wrc):
+                kinks += _realRoots([a2, a1, 0., sw], xmax)
+                if ('circ' in mask.lower()):
+                    kinks += _realRoots([a2-a4, a1-a3, a4*xmax**2, a3*xmax**2+sw], xmax)
+                else:
+                    zm2 = (cryst_z/r1p)**2
+                    kinks += _realRoots([a2, a1, a4*zm2, a3*zm2+sw], xmax)
+            area, err = quad(_lz, -xmax, xmax, epsabs=epsabs, epsrel=epsrel,
+                             limit=500, points=sorted(set(kinks)) or None)
+            # row extremes
+            ar = a1*xr**2 + a2*xr**3
+            er = ar + (a3 + a4*xr)*zr**2
+            dmin = min(ar.min(), er.min())
+            dmax = max(ar.max(), er.max())
+            rsin = math.sin(np.deg2rad(th))
+            dd[cs]['sa'].append(area/rsin)
+            dd[cs]['sa_err'].append(err/rsin)
+            dd[cs]['eres'].append(math.sqrt((dmax-dmin)**2 + wrc**2)/math.tan(np.deg2rad(th)))
+    return dd
+
 def writeScanDats(dd, fname, scanLabel=None, motpos=None):
     """ writes 1D scan data to SPEC file (refer to 'getMeshMasked' and 'getDthetaDats """
     mots = ['case', 'r1p', 'mask', 'cryst_x', 'cryst_z', 'wrc', 'csteps']
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Parameter sweeps of analyser geometries with dthetaxz
+
+A sweep is a list of points, each one a combination of the parameters
+in PARAMS (as in getMeshMasked() and getDthetaDats()). The points are
+grouped by mesh (MESH_PARAMS): each group is a task, thus the mesh is
+built once (as MeshSpans) and all its (case, angle) points are
+evaluated together. The tasks run over a process pool and each result row is appended to
+a columnar ASCII table (one line per point, COLUMNS) as soon as the
+task is done. Running again a sweep on the same table skips the
+points already there, i.e. an interrupted sweep is resumed.
+
+Usage
+-----
+>>> sw = DthetaxzSweep('sweep.dat', nproc=4)
+>>> sw.run({'r1p' : [500., 1000.],
+...         'mask' : ['circular', 'rectangular'],
+...         'cryst_x' : [50.], 'cryst_z' : [12.5, 25.],
+...         'case' : ['Js', 'SphJn', 'TorJs'],
+...         'angle' : range(15, 90, 5)})
+>>> res = sw.load() # dictionary of columns
+
+"""
+from __future__ import print_function, division
+
+import os, sys
+import time
+import itertools
+import multiprocessing
+import numpy as np
+
+from .dthetaxz import MeshSpans, getDthetaDats, getDthetaDatsAnalytic, getCaseNum
+from ..io.columnfile_reader import load_columns
+
+MESH_PARAMS = ['mask', 'r1p', 'cryst_x', 'cryst_z', 'csteps']
+PARAMS = MESH_PARAMS + ['wrc', 'case', 'angle']
+COLUMNS = PARAMS + ['sa', 'eres']
+DEFAULTS = {'mask' : 'circular',
+            'r1p' : 1000.,
+            'cryst_x' : 50.,
+            'cryst_z' : 10.,
+            'csteps' : 1000,
+            'wrc' : 1.25E-4}
+MASKS = {1 : 'circular',
+         2 : 'rectangular'}
+
+def getMaskNum(mask):
+    """mask number from int or str"""
+    if mask in MASKS:
+        return mask
+    for num, name in MASKS.items():
+        if name.startswith(str(mask).lower()[:4]):
+            return num
+    raise NameError("mask '{0}' unknown".format(mask))
+
+def _get_points(grid):
+    """list of points (tuples ordered as PARAMS, numbers only) from a
+    dictionary of lists (all the combinations) or a list of dictionaries"""
+    if isinstance(grid, dict):
+        keys = [key for key in grid.keys()]
+        grid = [dict(zip(keys, vals)) for vals in
+                itertools.product(*[list(grid[key]) for key in keys])]
+    points = []
+    for pt in grid:
+        for key in pt.keys():
+            if key not in PARAMS:
+                raise NameError("parameter '{0}' unknown".format(key))
+        _pt = dict(DEFAULTS)
+        _pt.update(pt)
+        _pt['mask'] = getMaskNum(_pt['mask'])
+        _pt['case'] = getCaseNum(_pt['case'])
+        points.append(tuple(float(_pt[key]) for key in PARAMS))
+    return points
+
+def _point_key(point):
+    """hashable key of a point, robust to the text formatting"""
+    return tuple(float('{0:.8e}'.format(val)) for val in point)
+
+def _sweep_task(task):
+    """evaluate all the points sharing one mesh, returns a list of rows
+    (tuples ordered as COLUMNS)"""
+    mask, r1p, cryst_x, cryst_z, csteps = task['mesh']
+    pars = {'mask' : MASKS[int(mask)], 'r1p' : r1p,
+            'cryst_x' : cryst_x, 'cryst_z' : cryst_z}
+    if task['method'] == 'mesh':
+        mxx, mzz = MeshSpans(csteps=complex(0, csteps), **pars), None
+    rows = []
+    for wrc in sorted(set(pt[5] for pt in task['points'])):
+        points = [pt for pt in task['points'] if pt[5] == wrc]
+        cases = sorted(set(int(pt[6]) for pt in points))
+        angles = sorted(set(pt[7] for pt in points))
+        if task['method'] == 'mesh':
+            dd = getDthetaDats(mxx, mzz, wrc=wrc, cases=cases, angles=angles)
+        else:
+            dd = getDthetaDatsAnalytic(wrc=wrc, cases=cases, angles=angles, **pars)
+        for pt in points:
+            ith = angles.index(pt[7])
+            rows.append(tuple(pt) + (dd[int(pt[6])]['sa'][ith],
+                                     dd[int(pt[6])]['eres'][ith]))
+    return rows
+
+class DthetaxzSweep(object):
+    """parallel parameter sweep streamed to a columnar ASCII table"""
+
+    def __init__(self, fname, nproc=None, method='mesh'):
+        """
+        Parameters
+        ----------
+        fname : str, file name of the results table (appended)
+        nproc : int, [None -> multiprocessing.cpu_count()]
+                number of parallel processes (1 -> serial run)
+        method : str, ['mesh'] getDthetaDats() or 'analytic'
+                 getDthetaDatsAnalytic() ('csteps' ignored)
+        """
+        if method not in ('mesh', 'analytic'):
+            raise NameError("method '{0}' unknown".format(method))
+        self.fname = os.path.abspath(fname)
+        if nproc is None:
+            nproc = multiprocessing.cpu_count()
+        self.nproc = max(1, int(nproc))
+        self.method = method
+
+    def _complete_size(self, block=4096):
+        """size of the table up to its last newline (smaller than the
+        file size if the last line is truncated, e.g. a run interrupted
+        while writing)"""
+        with open(self.fname, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            while pos > 0:
+                nread = min(block, pos)
+                f.seek(pos - nread)
+                chunk = f.read(nread)
+                ieol = chunk.rfind(b'\n')
+                if ieol >= 0:
+                    return pos - nread + ieol + 1
+                pos -= nread
+        return 0
+
+    def _load_rows(self):
+        """complete rows of the table, parsed line by line (lines
+        without newline or with a wrong number of values are skipped)"""
+        rows = []
+        with open(self.fname, 'r') as f:
+            for line in f:
+                if (not line.strip()) or line.lstrip().startswith('#'):
+                    continue
+                if not line.endswith('\n'):
+                    continue
+                try:
+                    row = [float(val) for val in line.split()]
+                except ValueError:
+                    continue
+                if len(row) == len(COLUMNS):
+                    rows.append(row)
+        return np.array(rows, dtype=float).reshape(-1, len(COLUMNS))
+
+    def load(self):
+        """results table as dictionary of 1D arrays (COLUMNS keys),
+        incomplete rows are skipped"""
+        if not os.path.isfile(self.fname):
+            return dict((col, np.zeros(0)) for col in COLUMNS)
+        if self._complete_size() < os.path.getsize(self.fname):
+            # truncated last line: even if it parses, its values are wrong
+            dat = self._load_rows()
+        else:
+            try:
+                dat = load_columns(self.fname, cache=False)
+            except ValueError:
+                dat = self._load_rows()
+        if dat.size == 0:
+            dat = np.zeros((0, len(COLUMNS)))
+        # NaN: short rows
+        dat = dat[np.all(np.isfinite(dat), axis=1)]
+        return dict((col, dat[:, icol]) for icol, col in enumerate(COLUMNS))
+
+    def done(self):
+        """set of keys of the points already in the table"""
+        res = self.load()
+        pts = np.column_stack([res[key] for key in PARAMS])
+        return set(_point_key(pt) for pt in pts)
+
+    def get_tasks(self, grid):
+        """tasks (one per mesh) of the points not yet computed"""
+        done = self.done()
+        tasks = {}
+        for pt in _get_points(grid):
+            if _point_key(pt) in done:
+                continue
+            done.add(_point_key(pt))
+            mesh = pt[:len(MESH_PARAMS)]
+            if self.method == 'analytic':
+                # csteps is not used
+                mesh = mesh[:-1] + (0.,)
+            tasks.setdefault(mesh, []).append(pt)
+        return [{'mesh' : mesh, 'points' : pts, 'method' : self.method}
+                for mesh, pts in tasks.items()]
+
+    def _write_rows(self, rows):
+        """append rows to the table (a truncated last line is removed
+        first), one write per task"""
+        _new = not os.path.isfile(self.fname)
+        if not _new:
+            size = self._complete_size()
+            if size < os.path.getsize(self.fname):
+                with open(self.fname, 'r+b') as f:
+                    f.truncate(size)
+        lines = [' '.join(['{0:.8e}'.format(val) for val in row]) + '\n' for row in rows]
+        if _new:
+            lines.insert(0, '# {0}\n'.format(' '.join(COLUMNS)))
+        with open(self.fname, 'a') as f:
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, grid, showInfos=True):
+        """run the sweep
+
+        Parameters
+        ----------
+        grid : dictionary of lists of values (all the combinations are
+               computed) or list of dictionaries (single points); the
+               keys are in PARAMS, missing ones take the DEFAULTS;
+               'mask' and 'case' can be given as names or numbers
+        showInfos : boolean, [True] print progress
+
+        Returns
+        -------
+        npts : int, number of computed points
+        """
+        t0 = time.time()
+        tasks = self.get_tasks(grid)
+        npts = sum([len(task['points']) for task in tasks])
+        if showInfos:
+            print('{0} points to compute in {1} tasks'.format(npts, len(tasks)))
+        nproc = min(self.nproc, len(tasks))
+        if nproc <= 1:
+            for task in tasks:
+                self._write_rows(_sweep_task(task))
+        else:
+            pool = multiprocessing.Pool(nproc)
+            try:
+                for itask, rows in enumerate(pool.imap_unordered(_sweep_task, tasks)):
+                    self._write_rows(rows)
+                    if showInfos:
+                        print('task {0}/{1} done'.format(itask+1, len(tasks)))
+            finally:
+                pool.close()
+                pool.join()
+        if showInfos:
+            print('{0} points in {1:.2f} s with {2} processes'.format(npts, time.time()-t0, max(nproc, 1)))
+        return npts
+
+if __name__ == '__main__':
+    pass
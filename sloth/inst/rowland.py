@@ -76,7 +76,8 @@ __license__ = "BSD license <http://opensource.org/licenses/BSD-3-Clause>"
 import sys, os, math
 import numpy as np
 
-from ..math.rotmatrix import rotate
+from ..math.rotmatrix import rotate_points
+from ..io.specfile_writer import SpecfileDataWriter
 
 DEBUG = 0
 
@@ -84,6 +85,9 @@ DEBUG = 0
 HC = 1.2398418743309972e-06 # eV * m
 ED0 = 1e-4 # minimum energy step (eV) considered as 0 
 AZ0 = 1e-4 # minimum Z step (mm) considered as 0
+# inverse lookup tables, see RowlandCircle.get_lut()
+_LUT_CACHE = {}
+LUT_MOTORS = ('sd', 'p', 'q', 'Rs', 'dx', 'dy', 'dz', 'ax', 'ay', 'az')
 
 ### UTILITIES ###
 def cs_h(c, R):
@@ -136,7 +140,182 @@ def det_pos_rotated(dxyz, drot=35.):
     dpar = dr * math.cos(alpha)
     dper = dr * math.sin(alpha)
     return np.array([dpar, dper])
-    
+
+### VECTORIZED GEOMETRY ###
+# pure functions of (energy/angle, d, Rm, alpha) accepting numpy
+# arrays, the RowlandCircle methods are wrappers of these
+
+def theta_from_ene(ene, d, isDeg=True):
+    r"""Bragg angle (deg or rad) for given energies (eV) and d-spacing
+    (\AA), NaN where not reachable"""
+    wlen = ( HC / np.asarray(ene, dtype=float) ) * 1e10
+    with np.errstate(invalid='ignore', divide='ignore'):
+        theta = np.arcsin( wlen / (2*d) )
+    if isDeg: theta = np.degrees(theta)
+    return theta
+
+def ene_from_theta(theta, d, isDeg=True):
+    r"""energy (eV) for given Bragg angles (deg or rad) and d-spacing (\AA)"""
+    rtheta = np.asarray(theta, dtype=float)
+    if isDeg: rtheta = np.radians(rtheta)
+    wlen = 2 * d * np.sin(rtheta)
+    return ( HC / wlen ) * 1e10
+
+def dth_from_ene(eDelta, rtheta0, d):
+    r"""Delta\theta (rad) for energy deltas (eV) from the differential
+    Bragg law at rtheta0 (rad), 0 where abs(eDelta) <= ED0"""
+    eDelta = np.asarray(eDelta, dtype=float)
+    ene = ene_from_theta(rtheta0, d, isDeg=False)
+    _dth = -1 * ( eDelta / ene ) * np.tan(rtheta0)
+    return np.where(np.abs(eDelta) <= ED0, 0., _dth)
+
+def az_off_from_ene(eDelta, rtheta0, d, Rm):
+    """analyser Z offset for energy deltas (eV)"""
+    _dth = dth_from_ene(eDelta, rtheta0, d)
+    return 2 * Rm * np.sin(rtheta0) * np.tan(_dth)
+
+def ay_off_from_ene(eDelta, rtheta0, d, Rm):
+    """analyser Y offset for energy deltas (eV)"""
+    _dth = dth_from_ene(eDelta, rtheta0, d)
+    return 2 * Rm * np.tan(rtheta0) * np.tan(_dth)
+
+def ene_off_from_az(aZoff, rtheta0, d, Rm):
+    """analyser energy delta (eV) for Z offsets, 0 where abs(aZoff) <= AZ0"""
+    aZoff = np.asarray(aZoff, dtype=float)
+    _dth = np.arctan( aZoff / (2 * Rm * np.sin(rtheta0)) )
+    _ene = ene_from_theta(rtheta0, d, isDeg=False)
+    _de = _ene * _dth / np.tan(rtheta0)
+    return np.where(np.abs(aZoff) <= AZ0, 0., _de)
+
+def rc_dists(rtheta0, Rm, ralpha=0.):
+    """Rowland circle distances for Bragg angles rtheta0 (rad)
+
+    Returns
+    -------
+    sd, p, q, Rs : sample-detector, sample-analyser,
+                   analyser-detector distances and sagittal radius
+                   (analyser center) with miscut ralpha (rad)
+    """
+    rtheta0 = np.asarray(rtheta0, dtype=float)
+    sd = 2. * Rm * np.sin(2. * rtheta0)
+    p = 2. * Rm * np.sin(rtheta0 - ralpha)
+    q = 2. * Rm * np.sin(rtheta0 + ralpha)
+    Rs = 2 * Rm * np.sin(rtheta0 - ralpha) * np.sin(rtheta0 + ralpha)
+    return sd, p, q, Rs
+
+def chi_from_axoff(aXoff, Rs, aL=0.):
+    r"""\chi (rad) in sagittal focusing from the offset of the pivot
+    point from the centre analyser (aXoff), see get_chi"""
+    Rs2 = np.asarray(Rs, dtype=float) + aL
+    return np.arctan( aXoff / np.sqrt(Rs2**2 - np.asarray(aXoff, dtype=float)**2) )
+
+def chi2_from_n(aN, aWext, Rs, rSext=0.):
+    r"""\chi (rad) of the n-th touching analyser, see get_chi2"""
+    Rsp = np.asarray(Rs, dtype=float) + rSext
+    return ( 2 * np.arctan( aWext / (2 * Rsp) ) ) * aN
+
+def axoff_from_chi(rchi, Rs, aL=0.):
+    r"""aXoff of the pivot point from \chi (rad), see get_axoff"""
+    return (np.asarray(Rs, dtype=float) + aL) * np.sin(rchi)
+
+def sag_off_from_axoff(aXoff, Rs, aL=0.):
+    """sagittal offsets from the pivot point offset aXoff, see get_sag_off
+
+    Returns
+    -------
+    rchi, SagOff, rchi0, aXoff0, SagOff0 : arrays, the 0 is referred
+                                           to the analyser surface (aL=0)
+    """
+    aXoff = np.asarray(aXoff, dtype=float)
+    Rs = np.asarray(Rs, dtype=float)
+    rchi = chi_from_axoff(aXoff, Rs, aL=aL)
+    aXoff0 = aXoff - aL*np.sin(rchi)
+    rchi0 = chi_from_axoff(aXoff0, Rs, aL=0.)
+    # cs_h(aXoff0*2, Rs), the radius where the chord exceeds the diameter
+    SagOff0 = Rs - np.sqrt(np.clip(Rs**2 - aXoff0**2, 0., None))
+    SagOff = SagOff0 - aL*np.cos(rchi) + aL
+    return rchi, SagOff, rchi0, aXoff0, SagOff0
+
+def _spec_nscans(fname):
+    """number of scans ('#S' lines) in a SPEC file (0 if missing)"""
+    if not os.path.isfile(fname):
+        return 0
+    with open(fname, 'r') as f:
+        return sum(1 for line in f if line.startswith('#S '))
+
+def write_trajectory(fname, cols, tab, title=None, motnames=None, motpos=None):
+    """append a trajectory table (see RowlandCircle.get_trajectory) to
+    a SPEC file as a scan, numbered after the scans already there
+
+    Returns
+    -------
+    scan : int, number of the written scan
+    """
+    sfw = SpecfileDataWriter(fname)
+    nscans = _spec_nscans(sfw.fn)
+    if not os.path.isfile(sfw.fn):
+        sfw.write_header(title='trajectories from rowland.py', motnames=motnames)
+    # the writer counts the scans only with PyMca
+    sfw.scan = nscans + 1
+    scan = sfw.scan
+    sfw.write_scan(cols, [tab[:, icol] for icol in range(tab.shape[1])],
+                   title=title, motpos=motpos)
+    return scan
+
+class LayoutError(ValueError):
+    """analysers layout not feasible
+
+    Attributes
+    ----------
+    mask : boolean array, True for the failing (analyser, angle)
+    """
+    def __init__(self, msg, mask=None):
+        ValueError.__init__(self, msg)
+        self.mask = mask
+
+def bender_pos_arr(aN, Rs, aWext, rSext=0., aL=0., bender=(0., 0., 0.)):
+    """position (aXoff, SagOff) of the bender point of the aN-th
+    analyser, see RowlandCircle.get_bender_pos (NaN where not feasible)
+
+    aN and Rs are broadcasted (e.g. analysers along rows and angles
+    along columns)
+    """
+    aN = np.asarray(aN, dtype=float)
+    Rs = np.asarray(Rs, dtype=float)
+    #map 3 pivot points positions (NOTE: rSext is added twice, as in
+    #get_bender_pos: get_chi2 adds it to Rs+rSext)
+    _Rc2 = Rs + rSext
+    _c2 = [np.degrees(chi2_from_n(aN + _dn, aWext, _Rc2, rSext=rSext)) for _dn in (-2, -1, 0)]
+    dchi = _c2[2] - _c2[0]
+    _p2axoff = axoff_from_chi(np.radians(_c2[2]), Rs, aL=aL)
+    _p2sagoff = sag_off_from_axoff(_p2axoff, Rs, aL=aL)[1]
+    #angle between the last pivot point and the bender point (B)
+    #using the position of the end point of bender[1] (C)
+    _R = Rs + aL
+    rdch = np.radians(dchi/2.)
+    h = _R * (1 - np.cos(rdch)) #chord pivots 0 and -2
+    chalf = _R * np.sin(rdch)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ra = np.arccos(chalf/bender[1])
+        dc = bender[1] * np.sin(ra) - h
+        sc = axoff_from_chi(np.radians(_c2[1]), Rs+dc, aL=aL)
+        rb = np.arccos( (_p2axoff - sc) / bender[1])
+    rc = np.pi - np.radians(bender[2]) - rb
+    pb_axoff = _p2axoff + bender[0] * np.cos(rc)
+    pb_sagoff = _p2sagoff - bender[0] * np.sin(rc)
+    bad = (aN < 3) | np.isnan(pb_axoff)
+    return np.where(bad, np.nan, pb_axoff), np.where(bad, np.nan, pb_sagoff)
+
+def clear_lut_cache():
+    """clear the cached inverse lookup tables"""
+    _LUT_CACHE.clear()
+
+def _scalar(arr):
+    """float for 0-d results (scalar API), the array otherwise"""
+    if np.ndim(arr) == 0:
+        return float(arr)
+    return arr
+
 ### CLASS ###
 class RowlandCircle(object):
     """Rowland circle geometry"""
@@ -278,20 +457,21 @@ class RowlandCircle(object):
         if showInfos is None: showInfos = self.showInfos
         self.theta0 = theta0
         self.rtheta0 = math.radians(self.theta0)       
-        self.sd = 2. * self.Rm * math.sin(2. * self.rtheta0)
-        self.p0 = 2. * self.Rm * math.sin(self.rtheta0 - self.ralpha)
+        sd, p0, q0, Rs = [float(_v) for _v in rc_dists(self.rtheta0, self.Rm, self.ralpha)]
+        self.sd = sd
+        self.p0 = p0
         #self.p = self.p0 - self.sampPos[1] #not fully tested yet
         self.p = self.p0
-        self.q0 = 2. * self.Rm * math.sin(self.rtheta0 + self.ralpha)
+        self.q0 = q0
         self.q = self.q0 # TODO: generic case!
         if self.p == self.p0:
             if self.alpha == 0:
                 if self.showInfos: print('INFO: sagittal focusing, symmetric formula')
-                self.Rs = 2 * self.Rm * (math.sin(self.rtheta0))**2 # no miscut
             else :
                 print('WARNING: sagittal focusing with miscut (CHECK FORMULA!)')
                 #self.Rs = self.Rm * (math.cos(2*self.ralpha) - math.cos(2*self.theta0)) # TODO: check this
-                self.Rs = 2 * self.Rm * math.sin(self.rtheta0 - self.ralpha) * math.sin(self.rtheta0 + self.ralpha) #this one should be correct: TO TEST!
+            # 2 * Rm * sin(theta0)**2 without miscut
+            self.Rs = Rs #this one should be correct with miscut: TO TEST!
         else :
             # generic sagittal focusing # TODO: check this!!!
             print('WARNING: sagittal focusing generic (CHECK FORMULA!)')
@@ -339,50 +519,45 @@ class RowlandCircle(object):
 
     def get_theta(self, ene=None, d=None, isDeg=True):
         """get theta angle (deg or rad, controlled by isDeg var) for a
-        given energy (eV) and d-spacing"""
+        given energy (eV) and d-spacing (ene can be an array, see
+        theta_from_ene)"""
         if d is None:
             d = self.d
         if ene is None:
             ene = self.get_ene(theta=None, d=d, isDeg=isDeg)
-        if (d is not None) and not (self.d == 0) and not (ene == 0):
-            wlen = ( HC / ene ) * 1e10
-            theta = math.asin( wlen / (2*d) )
-            if isDeg: theta = math.degrees(theta)
-            return theta
+        if (d is not None) and not (self.d == 0) and np.all(np.asarray(ene) != 0):
+            theta = theta_from_ene(ene, d, isDeg=isDeg)
+            if np.ndim(theta) == 0 and np.isnan(theta):
+                raise NameError("wrong d-spacing or energy")
+            return _scalar(theta)
         else:
             raise NameError("wrong d-spacing or energy")
             
     def get_ene(self, theta=None, d=None, isDeg=True):
-        """get energy (eV) for a given angle (deg) and d-spacing"""
+        """get energy (eV) for a given angle (deg) and d-spacing (theta
+        can be an array, see ene_from_theta)"""
         if theta is None:
             theta = self.rtheta0
             isDeg = False
         if d is None:
             d = self.d
-        if isDeg:
-            rtheta = math.radians(theta)
-        else:
-            rtheta = theta
         if d is not None:
-            wlen = 2 * d * math.sin(rtheta)
-            return ( HC / wlen ) * 1e10
+            return _scalar(ene_from_theta(theta, d, isDeg=isDeg))
         else:
             raise NameError("give d-spacing (\AA)")
 
     def get_dth(self, eDelta):
-        """Delta\theta using differential Bragg law"""
-        if abs(eDelta) <= ED0:
+        """Delta\theta using differential Bragg law (see dth_from_ene)"""
+        if np.ndim(eDelta) == 0 and abs(eDelta) <= ED0:
             return 0
-        ene = self.get_ene(theta=self.rtheta0, isDeg=False)
-        return -1 * ( eDelta / ene ) * math.tan(self.rtheta0)
+        return _scalar(dth_from_ene(eDelta, self.rtheta0, self.d))
             
     def get_chi(self, aXoff, Rs=None, aL=None, inDeg=True):
         """get \chi angle in sagittal focusing using offset from
         centre analyser (aXoff)"""
         if Rs is None: Rs = self.Rs
         if aL is None: aL = self.aL
-        Rs2 = Rs + aL
-        rchi = math.atan( aXoff / math.sqrt(Rs2**2 - aXoff**2) )
+        rchi = _scalar(chi_from_axoff(aXoff, Rs, aL=aL))
         if (inDeg is True):
             return np.rad2deg(rchi)
         else:
@@ -400,10 +575,9 @@ class RowlandCircle(object):
         if aWext is None: aWext = self.aWext
         if Rs is None: Rs = self.Rs
         if rSext is None: rSext = self.rSext
-        Rsp = Rs + rSext
-        rchi = ( 2 * math.atan( aWext / (2 * Rsp) ) ) * aN
+        rchi = _scalar(chi2_from_n(aN, aWext, Rs, rSext=rSext))
         if (inDeg is True):
-            return math.degrees(rchi)
+            return np.degrees(rchi)
         else:
             return rchi
 
@@ -426,7 +600,7 @@ class RowlandCircle(object):
         """get aXoff for the pivot point when chi is known (simple case)"""
         if Rs is None: Rs = self.Rs
         if aL is None: aL = self.aL
-        return (Rs + aL) * math.sin(math.radians(chi))
+        return _scalar(axoff_from_chi(np.radians(chi), Rs, aL=aL))
 
     def get_axoff0(self, chi, Rs=None):
         """get aXoff at the surface of the analyser"""
@@ -540,12 +714,11 @@ class RowlandCircle(object):
         """
         if Rs is None: Rs = self.Rs
         if aL is None: aL = self.aL
-        rchi = self.get_chi(aXoff, Rs=Rs, aL=aL, inDeg=False)
-        aXoff0 = aXoff - aL*math.sin(rchi)
-        rchi0 = self.get_chi(aXoff0, Rs=Rs, aL=0, inDeg=False) #to check this is equal to rchi!
-        SagOff0 = cs_h(aXoff0*2, Rs)
-        SagOff = SagOff0 - aL*math.cos(rchi) + aL
-        if self.showInfos:
+        rchi, SagOff, rchi0, aXoff0, SagOff0 = [_scalar(_v) for _v in sag_off_from_axoff(aXoff, Rs, aL=aL)]
+        if np.ndim(aXoff) == 0 and (aXoff0*2 >= 2*Rs):
+            print('WARNING: the chord is greater than the diameter!')
+            print('WARNING: returning maximum height, the radius')
+        if self.showInfos and np.ndim(aXoff) == 0:
             print("INFO: === surface (0) vs pivot (aL={0:.0f}) ===".format(aL))
             _tmpl_ihead = "INFO: {0:=^10} {1:=^12} {2:=^13}"
             _tmpl_idata = "INFO: {0:^ 10.5f} {1:^ 12.5f} {2:^ 13.5f}"
@@ -554,7 +727,7 @@ class RowlandCircle(object):
             print(_tmpl_ihead.format('Chi0', 'aXoff0', 'SagOff0'))
             print(_tmpl_idata.format(math.degrees(rchi0), aXoff0, SagOff0))
         if retAll:
-            return [math.degrees(rchi), aXoff, SagOff, math.degrees(rchi0), aXoff0, SagOff0]
+            return [np.degrees(rchi), aXoff, SagOff, np.degrees(rchi0), aXoff0, SagOff0]
         else:
             return SagOff
 
@@ -590,34 +763,72 @@ class RowlandCircle(object):
         if rSext is None: rSext = self.rSext
 
         #map 3 pivot points positions
-        _Rc2 = Rs + rSext
-        _c2 = [self.get_chi2(_n, Rs=_Rc2) for _n in xrange( int(aN-2), int(aN+1) )]
-        dchi = _c2[2]-_c2[0]
         if self.showInfos:
+            _Rc2 = Rs + rSext
+            dchi = self.get_chi2(aN, Rs=_Rc2) - self.get_chi2(aN-2, Rs=_Rc2)
             print('INFO: \Delta \chi {0}-{1} = {2:.5f} deg'.format(aN+1, aN-2, dchi))
-        _p = [self.get_sag_off(self.get_axoff(_cn), retAll=True) for _cn in _c2]
-
-        #find the angle between the last pivot point _p[-1] and the bender point (B)
-        #we use for this the position of the end point of bender[1] (C)
-        _R = Rs + aL
-        rdch = math.radians(dchi/2.)
-        h = _R * (1 - math.cos(rdch)) #chord pivots 0 and -2
-        chalf = _R * math.sin(rdch)
-        try:
-            ra = math.acos(chalf/bender[1])
-            dc = bender[1] * math.sin(ra) - h
-            sc = self.get_axoff(_c2[1], Rs=Rs+dc)
-            pc = self.get_sag_off(sc, retAll=True)
-            rb = math.acos( (_p[2][1]-pc[1]) / bender[1])
-            rc = math.pi - math.radians(bender[2]) - rb
-            if self.showInfos:
-                print('INFO: Angle last pivot point and bender = {0:.6f} deg'.format(math.degrees(rc)))
-            pb_axoff = _p[2][1] + bender[0] * math.cos(rc)
-            pb_sagoff = _p[2][2] - bender[0] * math.sin(rc)
-            return (pb_axoff, pb_sagoff)
-        except:
+        pb_axoff, pb_sagoff = [float(_v) for _v in bender_pos_arr(aN, Rs, self.aWext, rSext=rSext,
+                                                                  aL=aL, bender=bender)]
+        if np.isnan(pb_axoff):
             print('ERROR with bender arm position')
             return (0., 0.)
+        return (pb_axoff, pb_sagoff)
+
+    def get_layout(self, aN, theta=None, aW=None, aWext=None, rSext=None,
+                   aL=None, bender=None, errors='raise'):
+        """layout of touching analysers (Thales, see get_chi2) for all
+        analysers at all Bragg angles in one pass
+
+        Parameters
+        ----------
+        aN : list of ints, analysers numbers (0 is the central one)
+        theta : list of floats, [None -> self.theta0] Bragg angles (deg)
+        aW, aWext, rSext, aL, bender : [None -> self.*]
+        errors : str, ['raise'] raise LayoutError where the layout is
+                 not feasible, or 'nan' to fill with NaN
+
+        Returns
+        -------
+        lay : dictionary of 2D arrays (len(aN), len(theta)):
+              'chi' (deg), 'axoff', 'sagoff' : pivot point
+              'chi0' (deg), 'axoff0', 'sagoff0' : analyser surface
+              'ana_dist' : edge-to-edge distance from analyser aN-1
+              'bender_axoff', 'bender_sagoff' : bender point (if
+              bender arms are given, only for aN >= 3)
+              plus 'theta' and 'Rs' (1D arrays)
+        """
+        if aW is None: aW = self.aW
+        if aWext is None: aWext = self.aWext
+        if rSext is None: rSext = self.rSext
+        if aL is None: aL = self.aL
+        if bender is None: bender = self.bender
+        if theta is None: theta = self.theta0
+        if errors not in ('raise', 'nan'):
+            raise NameError("errors is 'raise' or 'nan'")
+        theta = np.atleast_1d(np.asarray(theta, dtype=float))
+        aN = np.atleast_1d(np.asarray(aN, dtype=float))[:, None]
+        Rs = rc_dists(np.radians(theta), self.Rm, self.ralpha)[3][None, :]
+        chi = np.degrees(chi2_from_n(aN, aWext, Rs, rSext=rSext))
+        axoff = axoff_from_chi(np.radians(chi), Rs, aL=aL)
+        rchi, sagoff, rchi0, axoff0, sagoff0 = sag_off_from_axoff(axoff, Rs, aL=aL)
+        # get_ana_dist
+        chihalf = np.radians(np.where(aN == 0, chi, chi/np.where(aN == 0, 1., aN))/2.)
+        ana_dist = 2 * Rs * np.sin(chihalf) - aW * np.cos(chihalf)
+        lay = {'theta' : theta, 'Rs' : Rs[0],
+               'chi' : chi, 'axoff' : axoff, 'sagoff' : sagoff,
+               'chi0' : np.degrees(rchi0), 'axoff0' : axoff0, 'sagoff0' : sagoff0,
+               'ana_dist' : ana_dist}
+        bad = np.isnan(sagoff)
+        if np.any(np.asarray(bender[:2]) != 0):
+            bax, bsag = bender_pos_arr(aN, Rs, aWext, rSext=rSext, aL=aL, bender=bender)
+            lay.update({'bender_axoff' : bax, 'bender_sagoff' : bsag})
+            bad = bad | np.isnan(bax)
+            if (errors == 'raise') and np.any(aN < 3):
+                raise LayoutError('bender position works only for aN>=3', mask=np.broadcast_to(aN < 3, bad.shape))
+        if (errors == 'raise') and np.any(bad):
+            _ia, _it = np.nonzero(bad)
+            raise LayoutError('layout not feasible for analyser {0} at {1} deg ({2} cases)'.format(aN[_ia[0], 0], theta[_it[0]], _ia.size), mask=bad)
+        return lay
 
     def get_bender_mot(self, bender_pos, actuator=None):
         """get the motor position of the bender, given its point
@@ -641,10 +852,146 @@ class RowlandCircle(object):
             print('ERROR with bender actuator position')
             return 0.
 
-    def get_az_off(self, eDelta, rtheta0=None, d=None, Rm=None):
-        """get analyser Z offset for a given energy delta (eV)"""
-        if abs(eDelta) <= ED0:
-            return 0.
+    def _check_frame(self):
+        """the XYZ positions are given by the frames (RcVert, RcHoriz)
+        via _get_ana_pos_arr(rtheta, p, q, rchi) and
+        _get_det_pos_arr(rtheta, p, q), arrays of positions (..., 3)"""
+        if not (hasattr(self, '_get_ana_pos_arr') and hasattr(self, '_get_det_pos_arr')):
+            raise NameError('XYZ positions require a frame: use RcVert or RcHoriz')
+
+    def get_trajectory(self, enes, aN=0, aXoff=None, aWext=None, rSext=None, aL=None, d=None):
+        r"""motors positions of all the analysers for an energy scan
+
+        Parameters
+        ----------
+        enes : array of floats, emission energies (eV)
+        aN : int or list of ints, [0] analysers numbers (0 is the
+             central one, negative on the left side)
+        aXoff : list of floats, [None] fixed pivot offsets of the
+                analysers (e.g. acenx(aN)), thus \chi changes with
+                energy; if None, touching analysers (get_chi2 with
+                aWext, rSext)
+        aWext, rSext, aL, d : [None -> self.*]
+
+        Returns
+        -------
+        cols : list of str, columns labels: 'ene', 'theta', 'p', 'q',
+               'Rs', 'dx', 'dy', 'dz' (detector) then, for each
+               analyser n, 'chi{n}', 'axoff{n}', 'sagoff{n}', 'ax{n}',
+               'ay{n}', 'az{n}'
+        tab : 2D array (len(enes), len(cols))
+        """
+        if aWext is None: aWext = self.aWext
+        if rSext is None: rSext = self.rSext
+        if aL is None: aL = self.aL
+        if d is None: d = self.d
+        if d is None:
+            raise NameError("give d-spacing")
+        aN = np.atleast_1d(aN)
+        rtheta = theta_from_ene(np.atleast_1d(enes), d, isDeg=False)
+        sd, p, q, Rs = rc_dists(rtheta, self.Rm, self.ralpha)
+        _Rs = Rs[:, None]
+        if aXoff is None:
+            rchi = chi2_from_n(aN[None, :], aWext, _Rs, rSext=rSext)
+            axoff = axoff_from_chi(rchi, _Rs, aL=aL)
+        else:
+            axoff = np.broadcast_to(np.atleast_1d(aXoff)[None, :], (rtheta.size, aN.size))
+            rchi = chi_from_axoff(axoff, _Rs, aL=aL)
+        sagoff = sag_off_from_axoff(axoff, _Rs, aL=aL)[1]
+        self._check_frame()
+        apos = self._get_ana_pos_arr(rtheta[:, None], p[:, None], q[:, None], rchi)
+        dpos = self._get_det_pos_arr(rtheta, p, q)
+        cols = ['ene', 'theta', 'p', 'q', 'Rs', 'dx', 'dy', 'dz']
+        dats = [np.atleast_1d(enes), np.degrees(rtheta), p, q, Rs,
+                dpos[:, 0], dpos[:, 1], dpos[:, 2]]
+        for ia, n in enumerate(aN):
+            cols.extend(['{0}{1}'.format(_c, int(n)) for _c in
+                         ('chi', 'axoff', 'sagoff', 'ax', 'ay', 'az')])
+            dats.extend([np.degrees(rchi[:, ia]), axoff[:, ia], sagoff[:, ia],
+                         apos[:, ia, 0], apos[:, ia, 1], apos[:, ia, 2]])
+        return cols, np.column_stack(dats)
+
+    def get_motor(self, motor, rtheta):
+        """positions of a motor (see LUT_MOTORS: distances, detector
+        and central analyser XYZ) for an array of angles (rad)"""
+        rtheta = np.asarray(rtheta, dtype=float)
+        sd, p, q, Rs = rc_dists(rtheta, self.Rm, self.ralpha)
+        if motor in ('sd', 'p', 'q', 'Rs'):
+            return {'sd' : sd, 'p' : p, 'q' : q, 'Rs' : Rs}[motor]
+        self._check_frame()
+        if motor in ('dx', 'dy', 'dz'):
+            return self._get_det_pos_arr(rtheta, p, q)[..., 'xyz'.index(motor[1])]
+        elif motor in ('ax', 'ay', 'az'):
+            return self._get_ana_pos_arr(rtheta, p, q, np.zeros_like(rtheta))[..., 'xyz'.index(motor[1])]
+        else:
+            raise NameError("motor '{0}' unknown".format(motor))
+
+    def _lut_key(self, motor, thrange, tol):
+        """cache key of a lookup table: geometry configuration"""
+        return (self.__class__.__name__, getattr(self, 'rotHor', False),
+                self.Rm, self.alpha, tuple(self.sampPos), motor,
+                tuple(thrange), tol)
+
+    def get_lut(self, motor, thrange=(15., 85.), tol=1e-5, maxiter=20):
+        """monotonic lookup table motor -> theta, cached per geometry
+
+        The table is built on a uniform grid of angles refined where
+        linear interpolation of theta misses the midpoints by more
+        than tol
+
+        Parameters
+        ----------
+        motor : str, see LUT_MOTORS
+        thrange : tuple of floats, [(15., 85.)] working range of the
+                  Bragg angle (deg), where the motor has to be monotonic
+        tol : float, [1e-5] maximum interpolation error on theta (deg)
+
+        Returns
+        -------
+        mot, theta : 1D arrays, motor positions (increasing) and
+                     Bragg angles (deg)
+        """
+        key = self._lut_key(motor, thrange, tol)
+        if key in _LUT_CACHE:
+            return _LUT_CACHE[key]
+        th = np.linspace(thrange[0], thrange[1], 65)
+        mot = self.get_motor(motor, np.radians(th))
+        for it in range(maxiter):
+            dmot = np.diff(mot)
+            if not (np.all(dmot > 0) or np.all(dmot < 0)):
+                raise NameError("motor '{0}' not monotonic in {1} deg".format(motor, thrange))
+            thmid = (th[1:] + th[:-1]) / 2.
+            motmid = self.get_motor(motor, np.radians(thmid))
+            _s = slice(None) if dmot[0] > 0 else slice(None, None, -1)
+            err = np.abs(np.interp(motmid, mot[_s], th[_s]) - thmid)
+            bad = (err > tol)
+            if not np.any(bad):
+                break
+            th = np.sort(np.concatenate((th, thmid[bad])))
+            mot = self.get_motor(motor, np.radians(th))
+        else:
+            print('WARNING: lookup table for {0} not converged to tol={1}'.format(motor, tol))
+        if mot[-1] < mot[0]:
+            mot, th = mot[::-1], th[::-1]
+        _LUT_CACHE[key] = (mot, th)
+        return mot, th
+
+    def get_theta_from_motor(self, motor, pos, thrange=(15., 85.), tol=1e-5):
+        """Bragg angles (deg) for motor positions via get_lut (NaN
+        outside the table)"""
+        mot, th = self.get_lut(motor, thrange=thrange, tol=tol)
+        return _scalar(np.interp(pos, mot, th, left=np.nan, right=np.nan))
+
+    def get_ene_from_motor(self, motor, pos, d=None, thrange=(15., 85.), tol=1e-5):
+        """energies (eV) for motor positions via get_lut"""
+        if d is None: d = self.d
+        if d is None:
+            raise NameError("give d-spacing")
+        th = self.get_theta_from_motor(motor, pos, thrange=thrange, tol=tol)
+        return _scalar(ene_from_theta(th, d, isDeg=True))
+
+    def _get_off_pars(self, rtheta0=None, d=None, Rm=None):
+        """defaults of (rtheta0, d, Rm) for the offsets methods"""
         if rtheta0 is None:
             rtheta0 = self.rtheta0
         if d is None:
@@ -653,49 +1000,42 @@ class RowlandCircle(object):
             raise NameError("give d-spacing")
         if Rm is None:
             Rm = self.Rm
-        _dth = self.get_dth(eDelta)
-        if self.showInfos:
+        return rtheta0, d, Rm
+
+    def get_az_off(self, eDelta, rtheta0=None, d=None, Rm=None):
+        """get analyser Z offset for a given energy delta (eV) (eDelta
+        can be an array, see az_off_from_ene)"""
+        if np.ndim(eDelta) == 0 and abs(eDelta) <= ED0:
+            return 0.
+        rtheta0, d, Rm = self._get_off_pars(rtheta0, d, Rm)
+        if self.showInfos and np.ndim(eDelta) == 0:
+            _dth = _scalar(dth_from_ene(eDelta, rtheta0, d))
             print('INFO: dth = {0:.1f} urad ({1:.5f} deg)'.format(_dth*1e6, math.degrees(_dth)))
             print('INFO: daz [tan(dth) ~ dth] = {0}'.format(_dth * 2 * Rm * math.sin(rtheta0) ))
             print('INFO: daz [tan(dth) ~ dth and sin(th) ~ 1 = {0}'.format(_dth * 2 * Rm) )
-        return 2 * Rm * math.sin(rtheta0) * math.tan(_dth)
+        return _scalar(az_off_from_ene(eDelta, rtheta0, d, Rm))
 
     def get_ay_off(self, eDelta, rtheta0=None, d=None, Rm=None):
-        """get analyser Y offset for a given energy delta (eV)"""
-        if abs(eDelta) <= ED0:
+        """get analyser Y offset for a given energy delta (eV) (eDelta
+        can be an array, see ay_off_from_ene)"""
+        if np.ndim(eDelta) == 0 and abs(eDelta) <= ED0:
             return 0.
-        if rtheta0 is None:
-            rtheta0 = self.rtheta0
-        if d is None:
-            d = self.d
-        if d is None:
-            raise NameError("give d-spacing")
-        if Rm is None:
-            Rm = self.Rm
-        _dth = self.get_dth(eDelta)
-        if self.showInfos:
+        rtheta0, d, Rm = self._get_off_pars(rtheta0, d, Rm)
+        if self.showInfos and np.ndim(eDelta) == 0:
+            _dth = _scalar(dth_from_ene(eDelta, rtheta0, d))
             print('INFO: dth = {0:.1f} urad ({1:.5f} deg)'.format(_dth*1e6, math.degrees(_dth)))
-        return 2 * Rm * math.tan(rtheta0) * math.tan(_dth)
+        return _scalar(ay_off_from_ene(eDelta, rtheta0, d, Rm))
         
     def get_ene_off(self, aZoff, rtheta0=None, d=None, Rm=None):
-        """get analyser delta E for a given Z offset """
-        if abs(aZoff) <= AZ0:
+        """get analyser delta E for a given Z offset (aZoff can be an
+        array, see ene_off_from_az)"""
+        if np.ndim(aZoff) == 0 and abs(aZoff) <= AZ0:
             return 0.
-        if rtheta0 is None:
-            rtheta0 = self.rtheta0
-        if d is None:
-            d = self.d
-        if d is None:
-            raise NameError("give d-spacing")
-        if Rm is None:
-            Rm = self.Rm
-        #
-        _dth = math.atan( aZoff /  (2 * Rm * math.sin(rtheta0)) )
-        if self.showInfos:
+        rtheta0, d, Rm = self._get_off_pars(rtheta0, d, Rm)
+        if self.showInfos and np.ndim(aZoff) == 0:
+            _dth = math.atan( aZoff /  (2 * Rm * math.sin(rtheta0)) )
             print('INFO: dth = {0:.1f} urad ({1:.5f} deg)'.format(_dth*1e6, math.degrees(_dth)))
-        _ene = self.get_ene(theta=rtheta0, d=d, isDeg=False)
-        _de = _ene * _dth / math.tan(rtheta0)
-        return _de
+        return _scalar(ene_off_from_az(aZoff, rtheta0, d, Rm))
 
             
 class RcVert(RowlandCircle):
@@ -718,9 +1058,10 @@ class RcVert(RowlandCircle):
         RowlandCircle.__init__(self, *args, **kws)
 
     def get_pos(self, vect):
-        """utility method: return 'vect' or its rotated form if self.rotHor"""
+        """utility method: return 'vect' (or array of vectors (N, 3)) or
+        its rotated form if self.rotHor"""
         if self.rotHor:
-            return rotate(vect, np.array([1,0,0]), (math.pi/2.-self.rtheta0))
+            return rotate_points(vect, np.array([1,0,0]), (math.pi/2.-self.rtheta0))
         else:
             return vect
 
@@ -730,25 +1071,47 @@ class RcVert(RowlandCircle):
         vDet = np.array([0, 0, zDet])
         return self.get_pos(vDet)
 
-    def get_ana_pos(self, aXoff=0.):
+    def get_ana_pos(self, chi=0.):
         """analyser XYZ center position for a given chi
 
         Parameters
         ==========
         
-        chi : float, 0. [deg]
-              rotation angle on the sagittal plane (hor plane here)
+        chi : float or array, 0. [deg]
+              rotation angle on the sagittal plane (hor plane here),
+              for an array of N angles the positions are (N, 3)
 
         """
         yAcen = 2 * self.Rm * math.sin(self.rtheta0)**2
         zAcen = 2 * self.Rm * math.sin(self.rtheta0) * math.cos(self.rtheta0)
         Acen = np.array([0, yAcen, zAcen])
-        if (chi == 0.):
+        if np.ndim(chi) == 0 and (chi == 0.):
             return self.get_pos(Acen)
         else:
-            Aside = rotate(Acen, np.array([0,0,1]), math.radians(chi))
+            Aside = rotate_points(Acen, np.array([0,0,1]), np.radians(chi))
             return self.get_pos(Aside)
 
+    def _get_pos_arr(self, vects, rtheta):
+        """get_pos for arrays of vectors (..., 3) and angles (rad)"""
+        if self.rotHor:
+            rtheta = np.broadcast_to(rtheta, vects.shape[:-1])
+            return rotate_points(vects, np.array([1., 0, 0]), math.pi/2.-rtheta)
+        else:
+            return vects
+
+    def _get_ana_pos_arr(self, rtheta, p, q, rchi):
+        rtheta, rchi = np.broadcast_arrays(rtheta, rchi)
+        yAcen = 2 * self.Rm * np.sin(rtheta)**2
+        zAcen = 2 * self.Rm * np.sin(rtheta) * np.cos(rtheta)
+        # Acen rotated around Z by chi
+        apos = np.stack((np.sin(rchi) * yAcen, np.cos(rchi) * yAcen, zAcen), axis=-1)
+        return self._get_pos_arr(apos, rtheta)
+
+    def _get_det_pos_arr(self, rtheta, p, q):
+        zDet = 4 * self.Rm * np.sin(rtheta) * np.cos(rtheta)
+        dpos = np.stack((np.zeros_like(zDet), np.zeros_like(zDet), zDet), axis=-1)
+        return self._get_pos_arr(dpos, rtheta)
+
     def get_miscut_off(self, alpha=None, Rm=None):
         """returns horizontal and vertical offsets for a given miscut angle
         TODO: NOT CORRECT, CHECK THIS!
@@ -780,18 +1143,29 @@ Y axis
         Parameters
         ==========
         
-        chi : float, 0. [deg]
-              rotation angle on the sagittal plane (around sample-detector axis)
+        chi : float or array, 0. [deg]
+              rotation angle on the sagittal plane (around sample-detector axis),
+              for an array of N angles the positions are (N, 3)
         
         """
         Acen = np.array([0, self.q, 0])
-        if (chi == 0.):
+        if np.ndim(chi) == 0 and (chi == 0.):
             return Acen
         else:
             SDax = self.get_det_pos() - self.sampPos
-            Aside = rotate(Acen, SDax, math.radians(chi))
+            Aside = rotate_points(Acen, SDax, np.radians(chi))
             return Aside
         
+    def _get_det_pos_arr(self, rtheta, p, q):
+        return np.stack((np.zeros_like(rtheta), p + q * np.cos(2 * rtheta),
+                         q * np.sin(2 * rtheta)), axis=-1)
+
+    def _get_ana_pos_arr(self, rtheta, p, q, rchi):
+        rtheta, p, q, rchi = np.broadcast_arrays(rtheta, p, q, rchi)
+        Acen = np.stack((np.zeros_like(q), q, np.zeros_like(q)), axis=-1)
+        SDax = self._get_det_pos_arr(rtheta, p, q) - self.sampPos
+        return rotate_points(Acen, SDax, rchi)
+
     def get_miscut_off(self, alpha=None, p=None):
         """returns horizontal and vertical offsets for a given miscut angle
         TODO: NOT CORRECT CHECK THIS!
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Single-file containers of named arrays plus a JSON header
+
+Two formats are supported:
+
+- NPZ (numpy, default): one .npy member per array plus a '__attrs__'
+  member with the JSON string
+- HDF5 (if h5py is available, file extension .h5/.hdf5): one dataset
+  per array, the JSON string in the file attributes
+
+Reading is lazy: `ArrayContainer` opens the file and loads an array
+only at first access. Arrays stored without compression are returned
+as read-only memory-maps of the file, the compressed ones are read in
+memory.
+
+"""
+
+from __future__ import print_function, division
+
+import os, sys
+import json
+import zipfile
+import numpy as np
+
+HAS_H5PY = False
+try:
+    import h5py
+    HAS_H5PY = True
+except ImportError:
+    pass
+
+DEBUG = False
+ATTRS_KEY = '__attrs__'
+
+def _get_fmt(fname, fmt=None):
+    """container format from the file extension"""
+    if fmt is None:
+        ext = os.path.splitext(fname)[1].lower()
+        fmt = 'h5' if ext in ('.h5', '.hdf5') else 'npz'
+    fmt = fmt.lower()
+    if fmt not in ('npz', 'h5'):
+        raise NameError('wrong container format: {0}'.format(fmt))
+    if (fmt == 'h5') and (not HAS_H5PY):
+        raise NameError('h5py not found')
+    return fmt
+
+def write_arrays(fname, arrs, attrs=None, fmt=None, compress=True):
+    """write a dictionary of arrays to a single file
+
+    Parameters
+    ----------
+    fname : str, file name (.npz or .h5/.hdf5)
+    arrs : dict, {name : array}
+    attrs : dict, [None] JSON-serializable metadata
+    fmt : str, [None -> from extension] 'npz' or 'h5'
+    compress : boolean, [True] compressed arrays (not memory-mappable)
+    """
+    fmt = _get_fmt(fname, fmt)
+    sattrs = json.dumps(attrs or {})
+    if fmt == 'h5':
+        with h5py.File(fname, 'w') as f:
+            for key, arr in arrs.items():
+                arr = np.asarray(arr)
+                if compress and (arr.ndim > 0) and (arr.size > 0):
+                    f.create_dataset(key, data=arr, compression='gzip')
+                else:
+                    f.create_dataset(key, data=arr)
+            f.attrs[ATTRS_KEY] = sattrs
+        return
+    _arrs = dict((key, np.asarray(arr)) for key, arr in arrs.items())
+    _arrs[ATTRS_KEY] = np.array(sattrs)
+    # np.savez adds '.npz' to names without extension
+    with open(fname, 'wb') as f:
+        if compress:
+            np.savez_compressed(f, **_arrs)
+        else:
+            np.savez(f, **_arrs)
+
+def _npz_memmap(fname, info):
+    """memory-map of a not compressed .npy member of a .npz file"""
+    with open(fname, 'rb') as f:
+        # local file header: 30 bytes + file name + extra field
+        f.seek(info.header_offset + 26)
+        nlen, nextra = np.frombuffer(f.read(4), dtype='<u2')
+        f.seek(info.header_offset + 30 + int(nlen) + int(nextra))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    if dtype.hasobject or (len(shape) == 0) or (np.prod(shape) == 0):
+        return None
+    order = 'F' if fortran else 'C'
+    return np.memmap(fname, dtype=dtype, mode='r', shape=shape,
+                     order=order, offset=offset)
+
+class ArrayContainer(object):
+    """lazy reader of a file written by write_arrays()"""
+
+    def __init__(self, fname, fmt=None):
+        self.fname = os.path.abspath(fname)
+        self.fmt = _get_fmt(fname, fmt)
+        if self.fmt == 'h5':
+            self._h5 = h5py.File(self.fname, 'r')
+            self._keys = [key for key in self._h5.keys()]
+            self.attrs = json.loads(self._h5.attrs.get(ATTRS_KEY, '{}'))
+        else:
+            self._npz = np.load(self.fname)
+            with zipfile.ZipFile(self.fname) as zf:
+                self._infos = dict((info.filename[:-4], info) for info in
+                                   zf.infolist())
+            self._keys = [key for key in self._npz.files if key != ATTRS_KEY]
+            self.attrs = {}
+            if ATTRS_KEY in self._npz.files:
+                self.attrs = json.loads(str(self._npz[ATTRS_KEY]))
+
+    def keys(self):
+        return list(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __getitem__(self, key):
+        """array 'key', memory-mapped if stored without compression"""
+        if key not in self._keys:
+            raise KeyError(key)
+        if self.fmt == 'h5':
+            ds = self._h5[key]
+            offset = ds.id.get_offset()
+            if (offset is not None) and (ds.chunks is None) and (ds.size > 0):
+                if DEBUG: print('memmap {0}:{1}'.format(self.fname, key))
+                return np.memmap(self.fname, dtype=ds.dtype, mode='r',
+                                 shape=ds.shape, offset=offset)
+            return ds[()]
+        info = self._infos.get(key)
+        if (info is not None) and (info.compress_type == zipfile.ZIP_STORED):
+            arr = _npz_memmap(self.fname, info)
+            if arr is not None:
+                if DEBUG: print('memmap {0}:{1}'.format(self.fname, key))
+                return arr
+        return self._npz[key]
+
+    def close(self):
+        if self.fmt == 'h5':
+            self._h5.close()
+        else:
+            self._npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+if __name__ == '__main__':
+    pass
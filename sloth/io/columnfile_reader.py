@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Fast reader for (large) ASCII files with columns of numbers
+
+The text is parsed once with a bulk tokenizer (pandas if available,
+the C reader of numpy.loadtxt for numpy >= 1.23, otherwise chunks of
+lines given to numpy.fromstring) and the array is cached in a
+binary .npy sidecar file next to the original one. The sidecar is
+given the same modification time of the ASCII file: as long as the
+two match, the next load is simply a memory-map of the sidecar.
+
+All the backends raise ValueError for rows with a different number of
+columns and return an empty (0, 0) array for files without data.
+
+"""
+import os, sys
+import itertools
+import warnings
+import numpy as np
+
+HAS_PANDAS = False
+try:
+    import pandas
+    HAS_PANDAS = True
+except ImportError:
+    pass
+
+DEBUG = False
+CHUNK_LINES = 500000 # lines parsed at once by _parse_chunks
+
+try:
+    _NPVER = tuple(int(v) for v in np.__version__.split('.')[:2])
+except ValueError:
+    _NPVER = (0, 0)
+HAS_NPCREADER = (_NPVER >= (1, 23))
+
+def _sidecar_name(fname):
+    """name of the .npy cache file"""
+    return '{0}.npy'.format(fname)
+
+def _parse_chunks(fname, comments='#'):
+    """parse chunks of lines with numpy.fromstring"""
+    ncols = None
+    chunks = []
+    with open(fname, 'r') as f:
+        while True:
+            lines = list(itertools.islice(f, CHUNK_LINES))
+            if not lines:
+                break
+            lines = [line for line in lines
+                     if line.strip() and not line.lstrip().startswith(comments)]
+            if not lines:
+                continue
+            nvals = [len(line.split()) for line in lines]
+            if ncols is None:
+                ncols = nvals[0]
+            if any(nval != ncols for nval in nvals):
+                raise ValueError('wrong number of columns in {0}'.format(fname))
+            chunks.append(np.fromstring(' '.join(lines), sep=' '))
+    if ncols is None:
+        return np.empty((0, 0))
+    dat = np.concatenate(chunks)
+    if not (dat.size % ncols == 0):
+        raise ValueError('wrong number of values in {0}'.format(fname))
+    return dat.reshape(-1, ncols)
+
+def _parse_numpy(fname, comments='#'):
+    """parse with numpy.loadtxt (C reader)"""
+    with warnings.catch_warnings():
+        # 'input contained no data'
+        warnings.simplefilter('ignore', UserWarning)
+        dat = np.loadtxt(fname, comments=comments, ndmin=2)
+    if dat.size == 0:
+        return np.empty((0, 0))
+    return dat
+
+def _parse_pandas(fname, comments='#'):
+    """parse with the C tokenizer of pandas"""
+    try:
+        df = pandas.read_csv(fname, sep=r'\s+', comment=comments, header=None)
+    except pandas.errors.EmptyDataError:
+        return np.empty((0, 0))
+    dat = df.values.astype(np.float64)
+    if np.isnan(dat).any():
+        # short rows are filled with NaN by pandas: parse again strictly
+        # to tell them from 'nan' values in the file
+        if DEBUG: print('NaN in {0}, parsing again'.format(fname))
+        if HAS_NPCREADER:
+            return _parse_numpy(fname, comments=comments)
+        return _parse_chunks(fname, comments=comments)
+    return dat
+
+def load_columns(fname, comments='#', cache=True):
+    """load a 2D array from an ASCII file of columns (as np.loadtxt)
+
+    Parameters
+    ----------
+    fname : str, file name
+    comments : str, ['#'] lines starting with this are skipped
+    cache : boolean, [True] read from/write to the .npy sidecar file
+            (fname + '.npy'), the returned array is then a read-only
+            memory-map
+
+    Returns
+    -------
+    dat : 2D array (rows, columns), (0, 0) if no data (not cached)
+    """
+    fname = os.path.abspath(fname)
+    fcache = _sidecar_name(fname)
+    mtime = os.path.getmtime(fname)
+    if cache and os.path.isfile(fcache) and (os.path.getmtime(fcache) == mtime):
+        if DEBUG: print('loading {0}'.format(fcache))
+        return np.load(fcache, mmap_mode='r')
+    if HAS_PANDAS:
+        dat = _parse_pandas(fname, comments=comments)
+    elif HAS_NPCREADER:
+        dat = _parse_numpy(fname, comments=comments)
+    else:
+        dat = _parse_chunks(fname, comments=comments)
+    if (not cache) or (dat.size == 0):
+        return dat
+    try:
+        ftmp = '{0}.{1}.tmp'.format(fcache, os.getpid())
+        with open(ftmp, 'wb') as f:
+            np.save(f, dat)
+        os.utime(ftmp, (mtime, mtime))
+        os.rename(ftmp, fcache)
+        return np.load(fcache, mmap_mode='r')
+    except (IOError, OSError):
+        if DEBUG: print('cannot write {0}'.format(fcache))
+        return dat
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+r"""Reader for the crystal structures file (XOP format, data/crystals.dat)
+
+The file is a SPEC-like sequence of scans, one per crystal:
+
+- '#S num name' starts a crystal
+- '#UCELL a b c alpha beta gamma' (\AA, deg), '#USYSTEM', '#ULATTICE',
+  '#USTRUCTURE', '#UTEMP' its properties
+- data lines 'AtomicNumber Fraction X Y Z [Biso]' the atoms in the cell
+
+The whole file is parsed once into an index {name : crystal dict} and
+kept in memory: the next lookups are dictionary hits (the file is not
+checked again unless reloaded). For user files, the index is also
+cached in a binary pickle sidecar file (fname + '.pkl') with the same
+modification time of the ASCII file (as for the .npy sidecars of
+columnfile_reader); nothing is written next to the packaged
+CRYSTALS_DAT.
+
+"""
+from __future__ import print_function, division
+
+import os, sys
+import numpy as np
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+DEBUG = False
+
+# ../../data
+_pardir = os.path.realpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.path.pardir))
+_parpardir = os.path.realpath(os.path.join(_pardir, os.path.pardir))
+CRYSTALS_DAT = os.path.join(_parpardir, 'data', 'crystals.dat')
+
+ATOMS_DTYPE = [('Z', 'i4'), ('frac', 'f8'),
+               ('x', 'f8'), ('y', 'f8'), ('z', 'f8'), ('biso', 'f8')]
+
+_INDEX = {} # {fname : (mtime, index, {lower case name : name})}
+_PKL_VERSION = 1
+
+def _sidecar_name(fname):
+    """name of the pickle cache file"""
+    return '{0}.pkl'.format(fname)
+
+def _new_crystal(line):
+    """crystal dict from the '#S num name' line"""
+    items = line.split(None, 2)
+    return {'num' : int(items[1]), 'name' : items[2].strip(),
+            'cell' : None, 'system' : None, 'lattice' : None,
+            'structure' : None, 'temp' : None, 'atoms' : []}
+
+def parse_crystals(fname=None):
+    """parse the crystals file
+
+    Parameters
+    ----------
+    fname : str, [None -> CRYSTALS_DAT] file name
+
+    Returns
+    -------
+    index : dict, {name : crystal}, crystal is a dict with keys
+            'num', 'name', 'cell' (a, b, c, alpha, beta, gamma),
+            'system' (lower case), 'lattice', 'structure', 'temp' and
+            'atoms' (structured array ATOMS_DTYPE, biso is NaN if
+            not given)
+    """
+    if fname is None: fname = CRYSTALS_DAT
+    index = {}
+    crys = None
+    with open(fname, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('#'):
+                key = line.split(None, 1)[0]
+                val = line[len(key):].strip()
+                if key == '#S':
+                    crys = _new_crystal(line)
+                    index[crys['name']] = crys
+                elif crys is None:
+                    continue
+                elif key == '#UCELL':
+                    crys['cell'] = tuple(float(v) for v in val.split()[:6])
+                elif key == '#USYSTEM':
+                    crys['system'] = val.lower()
+                elif key == '#ULATTICE':
+                    crys['lattice'] = val
+                elif key == '#USTRUCTURE':
+                    crys['structure'] = val
+                elif key == '#UTEMP':
+                    crys['temp'] = float(val)
+                elif key == '#EOF':
+                    break
+                continue
+            if crys is not None:
+                vals = [float(v) for v in line.split()]
+                crys['atoms'].append(tuple(vals[:6]) + (np.nan,) * (6 - len(vals)))
+    for crys in index.values():
+        crys['atoms'] = np.array(crys['atoms'], dtype=ATOMS_DTYPE)
+    if DEBUG: print('DEBUG: {0} crystals in {1}'.format(len(index), fname))
+    return index
+
+def _read_sidecar(fcache, fname, mtime, size):
+    """index from the pickle sidecar file, None if missing or not
+    written for this version of fname"""
+    if not (os.path.isfile(fcache) and (os.path.getmtime(fcache) == mtime)):
+        return None
+    if DEBUG: print('loading {0}'.format(fcache))
+    try:
+        with open(fcache, 'rb') as f:
+            dat = pickle.load(f)
+    except Exception:
+        return None
+    if not (isinstance(dat, dict) and (dat.get('version') == _PKL_VERSION) and
+            (dat.get('fname') == fname) and (dat.get('mtime') == mtime) and
+            (dat.get('size') == size) and isinstance(dat.get('index'), dict)):
+        return None
+    return dat['index']
+
+def _write_sidecar(fcache, fname, mtime, size, index):
+    """write the pickle sidecar file (same modification time of fname)"""
+    dat = {'version' : _PKL_VERSION, 'fname' : fname, 'mtime' : mtime,
+           'size' : size, 'index' : index}
+    try:
+        ftmp = '{0}.{1}.tmp'.format(fcache, os.getpid())
+        with open(ftmp, 'wb') as f:
+            pickle.dump(dat, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.utime(ftmp, (mtime, mtime))
+        os.rename(ftmp, fcache)
+    except (IOError, OSError):
+        if DEBUG: print('cannot write {0}'.format(fcache))
+
+def load_crystals(fname=None, cache=None, reload=False):
+    """index of the crystals file, parsed once (see parse_crystals)
+
+    Parameters
+    ----------
+    fname : str, [None -> CRYSTALS_DAT] file name
+    cache : boolean, [None -> True for user files, False for
+            CRYSTALS_DAT] read from/write to the pickle sidecar file
+            (fname + '.pkl')
+    reload : boolean, [False] check the modification time of the file
+             and parse it again if changed, otherwise an index already
+             in memory is returned as is
+    """
+    if fname is None: fname = CRYSTALS_DAT
+    fname = os.path.abspath(fname)
+    if (fname in _INDEX) and (not reload):
+        return _INDEX[fname][1]
+    if cache is None:
+        cache = (fname != os.path.abspath(CRYSTALS_DAT))
+    mtime = os.path.getmtime(fname)
+    if (fname in _INDEX) and (_INDEX[fname][0] == mtime):
+        return _INDEX[fname][1]
+    size = os.path.getsize(fname)
+    fcache = _sidecar_name(fname)
+    index = None
+    if cache:
+        index = _read_sidecar(fcache, fname, mtime, size)
+    if index is None:
+        index = parse_crystals(fname)
+        if cache:
+            _write_sidecar(fcache, fname, mtime, size, index)
+    _INDEX[fname] = (mtime, index, dict((key.lower(), key) for key in index.keys()))
+    return index
+
+def get_crystal(name, fname=None):
+    """crystal dict by name (case insensitive), see parse_crystals"""
+    index = load_crystals(fname)
+    if name in index:
+        return index[name]
+    names = _INDEX[os.path.abspath(fname or CRYSTALS_DAT)][2]
+    if name.lower() in names:
+        return index[names[name.lower()]]
+    raise NameError("crystal '{0}' not found".format(name))
+
+if __name__ == '__main__':
+    pass
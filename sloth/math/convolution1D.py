@@ -29,7 +29,13 @@ MODNAME = '_math'
 DEBUG = 0
 
 import os, sys, math
+import copy
+import shlex
+import shutil
 import subprocess
+import tempfile
+import time
+import multiprocessing
 from optparse import OptionParser
 from datetime import date
 from string import Template
@@ -197,6 +203,54 @@ def conv(e, mu, kernel='gaussian', fwhm_e=None, efermi=None):
         z[n] = zn
     return z
 
+def conv_operator(e, fwhm_e, kernel='gaussian', kwidth=1.5):
+    """ linear broadening as (sparse) matrix operator, K
+
+    The convolution of mu(e) is then simply K.dot(mu). Differently
+    from conv(), the kernel is truncated at the borders and
+    re-normalized (no extrapolation of mu), but it is built once and
+    can be applied to many spectra, e.g. all the rows of a 2D map.
+
+    Parameters
+    ----------
+    e : x-axis (energy), monotonically increasing
+    fwhm_e : the full width half maximum in eV for the kernel
+             broadening, float or array of size 'e' (see conv())
+    kernel : convolution kernel, g(x)
+             'gaussian'
+             'lorentzian'
+    kwidth : [1.5] the kernel is evaluated in the range
+             e[n] +/- kwidth*fwhm_e[n] (as in conv())
+
+    Returns
+    -------
+    K : scipy.sparse.csr_matrix of shape (len(e), len(e)), normalized
+        rows
+    """
+    from scipy import sparse
+    e = np.asarray(e, dtype=float)
+    fwhm_e = np.broadcast_to(np.asarray(fwhm_e, dtype=float), e.shape)
+    ne = e.size
+    # kernel window [imin, imax) for each convolution point
+    imin = np.searchsorted(e, e - kwidth*fwhm_e, side='left')
+    imax = np.searchsorted(e, e + kwidth*fwhm_e, side='right')
+    nk = imax - imin
+    rows = np.repeat(np.arange(ne), nk)
+    cols = np.arange(nk.sum()) - np.repeat(np.cumsum(nk) - nk, nk) + np.repeat(imin, nk)
+    kx = e[cols] - e[rows]
+    hwhm = fwhm_e[rows]/2.0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if ('gauss' in kernel.lower()):
+            ky = gaussian(kx, cen=0, sigma=hwhm, peak=1.)
+        elif ('lor' in kernel.lower()):
+            ky = lorentzian(kx, cen=0, gamma=hwhm, peak=1.)
+        else:
+            raise ValueError("convolution kernel '{0}' not implemented".format(kernel))
+    # zero width: identity
+    ky = np.where(hwhm == 0, (kx == 0).astype(float), ky)
+    ky /= np.bincount(rows, weights=ky, minlength=ne)[rows] # normalize
+    return sparse.csr_matrix((ky, (rows, cols)), shape=(ne, ne))
+
 def glinbroad(e, mu, fwhm_e=None, efermi=None, _larch=None):
     """gaussian linear convolution in Larch """
     if _larch is None:
@@ -297,14 +351,25 @@ class FdmnesConv(object):
         self.opts[opt] = value
         self.checkopts()
 
-    def wfdmfile(self):
+    def wfdmfile(self, wdir=None, backup=True):
         """ write a simple fdmfile.txt to enable the convolution
-        first makes a copy of previous fdmfile.txt if not already done """
-        if os.path.exists('fdmfile.bak'):
-            print('fdmfile.bak exists, good')
-        else:
-            subprocess.call('cp fdmfile.txt fdmfile.bak', shell=True)
-            print('copied fdmfile.txt to fmdfile.bak')
+        first makes a copy of previous fdmfile.txt if not already done
+
+        Parameters
+        ----------
+        wdir : directory where fdmfile.txt is written [None -> os.getcwd()]
+        backup : [True] copy an existing fdmfile.txt to fdmfile.bak
+        """
+        if wdir is None:
+            wdir = os.getcwd()
+        fdmfile = os.path.join(wdir, 'fdmfile.txt')
+        fdmbak = os.path.join(wdir, 'fdmfile.bak')
+        if backup:
+            if os.path.exists(fdmbak):
+                print('fdmfile.bak exists, good')
+            elif os.path.exists(fdmfile):
+                shutil.copyfile(fdmfile, fdmbak)
+                print('copied fdmfile.txt to fmdfile.bak')
         #
         s = Template('!fdmfile.txt automatically created by ${creator} on ${today} (for convolution)\n\
 !--------------------------------------------------------------------!\n\
@@ -315,11 +380,14 @@ convfile.txt\n\
 !--------------------------------------------------------------------!\n\
 ')
         outstr = s.substitute(self.opts)
-        f = open('fdmfile.txt', 'w')
+        f = open(fdmfile, 'w')
         f.write(outstr)
         f.close()
 
-    def wconvfile(self):
+    def wconvfile(self, wdir=None):
+        """ write convfile.txt in 'wdir' [None -> os.getcwd()] """
+        if wdir is None:
+            wdir = os.getcwd()
         s = Template("""
 !FDMNES convolution file\n\
 !created by ${creator} on ${today}\n\
@@ -343,18 +411,178 @@ ${gauss_sel}Gaussian\n\
 ${gauss_sel}${gaussian} !Gaussian conv for experimental res\n\
 """)
         outstr = s.substitute(self.opts)
-        f = open('convfile.txt', 'w')
+        f = open(os.path.join(wdir, 'convfile.txt'), 'w')
         f.write(outstr)
         f.close()
         
-    def run(self):
-        """ runs fdmnes """
-        self.wfdmfile()  # write fdmfile.txt
-        self.wconvfile() # write convfile.txt
+    def run(self, exe='fdmnes', wdir=None):
+        """ runs fdmnes (in 'wdir', if given) """
+        self.wfdmfile(wdir=wdir)  # write fdmfile.txt
+        self.wconvfile(wdir=wdir) # write convfile.txt
         try:
-            subprocess.call('fdmnes', shell=True) 
+            subprocess.call(exe, shell=True, cwd=wdir)
         except OSError:
-            print("check 'fdmnes' executable exists!")
+            print("check '{0}' executable exists!".format(exe))
+
+def _fdmnes_conv_job(job):
+    """run a single convolution job of FdmnesConvRunner
+
+    The job is executed in its own temporary directory: the input
+    calculation file is copied there, fdmfile.txt/convfile.txt are
+    rendered and the executable is called with that directory as
+    working directory. The convolved output is then moved to
+    job['outdir'].
+
+    Parameters
+    ----------
+    job : dictionary with keys
+          'opts' : FdmnesConv options
+          'exe' : list of str, command line of the executable
+          'outdir' : directory where the output file is collected
+          'keep' : if True, the temporary directory is not removed
+
+    Returns
+    -------
+    res : dictionary with keys
+          'calcroot', 'fn_in', 'fn_out' (None if failed), 'wdir',
+          'returncode', 'time' (s), 'error' (None if succeeded)
+    """
+    t0 = time.time()
+    opts = job['opts']
+    res = {'calcroot' : opts['calcroot'],
+           'fn_in' : opts['fn_in'],
+           'fn_out' : None,
+           'wdir' : None,
+           'returncode' : None,
+           'time' : 0.,
+           'error' : None}
+    wdir = tempfile.mkdtemp(prefix='fdmconv_')
+    res['wdir'] = wdir
+    try:
+        fn_in = os.path.basename(opts['fn_in'])
+        shutil.copyfile(opts['fn_in'], os.path.join(wdir, fn_in))
+        fc = FdmnesConv(opts=copy.deepcopy(opts))
+        fc.opts['calcroot'] = os.path.splitext(fn_in)[0]
+        fc.opts['fn_in'] = fn_in
+        fc.checkopts()
+        fc.wfdmfile(wdir=wdir, backup=False)
+        fc.wconvfile(wdir=wdir)
+        with open(os.path.join(wdir, 'fdmnes.log'), 'w') as flog:
+            res['returncode'] = subprocess.call(job['exe'], cwd=wdir,
+                                                stdout=flog, stderr=flog)
+        fn_out = os.path.join(wdir, fc.opts['fn_out'])
+        if not (res['returncode'] == 0):
+            res['error'] = "'{0}' exited with code {1}".format(' '.join(job['exe']), res['returncode'])
+        elif not os.path.isfile(fn_out):
+            res['error'] = "output file '{0}' not found".format(fc.opts['fn_out'])
+        else:
+            res['fn_out'] = os.path.join(job['outdir'], fc.opts['fn_out'])
+            shutil.move(fn_out, res['fn_out'])
+    except Exception as err:
+        res['error'] = '{0}: {1}'.format(type(err).__name__, err)
+    if not job['keep']:
+        shutil.rmtree(wdir, ignore_errors=True)
+        res['wdir'] = None
+    res['time'] = time.time() - t0
+    return res
+
+class FdmnesConvRunner(object):
+    """ Runs many FdmnesConv jobs concurrently
+
+    Each job is executed in an isolated temporary directory (see
+    _fdmnes_conv_job), thus the current working directory is never
+    touched and the jobs can be distributed over a process pool.
+
+    Usage
+    -----
+    >>> runner = FdmnesConvRunner(nproc=4, outdir='conv')
+    >>> for fn in glob.glob('calc*.txt'):
+    ...     runner.add(FdmnesConv(fn_in=fn))
+    >>> results = runner.run()
+    """
+    def __init__(self, exe='fdmnes', nproc=None, outdir=None, keep=False):
+        """
+        Parameters
+        ----------
+        exe : str or list of str, ['fdmnes']
+              command line of the FDMNES executable (or a stand-in
+              script); a string is split as a shell would do
+        nproc : int, [None -> multiprocessing.cpu_count()]
+                number of parallel processes (1 -> serial run)
+        outdir : str, [None -> os.getcwd()]
+                 directory where the convolved files are collected
+        keep : boolean, [False]
+               keep the temporary directories (for debugging)
+        """
+        if isinstance(exe, str):
+            exe = shlex.split(exe)
+        self.exe = list(exe)
+        if nproc is None:
+            nproc = multiprocessing.cpu_count()
+        self.nproc = max(1, int(nproc))
+        if outdir is None:
+            outdir = os.getcwd()
+        self.outdir = os.path.abspath(outdir)
+        self.keep = keep
+        self.jobs = []
+        self.results = []
+
+    def _out_name(self, opts):
+        """name of the convolved file of a job in self.outdir (as set
+        by FdmnesConv.checkopts() in _fdmnes_conv_job)"""
+        calcroot = os.path.splitext(os.path.basename(opts['fn_in']))[0]
+        return '{0}_conv{1}.{2}'.format(calcroot, opts['spin'], opts['fn_ext'])
+
+    def add(self, fc):
+        """add a job given as FdmnesConv object or input file name
+
+        The outputs are collected by name in self.outdir: a job with
+        the same output name of a previous one (e.g. same input file
+        name in another directory) raises ValueError
+        """
+        if not isinstance(fc, FdmnesConv):
+            fc = FdmnesConv(fn_in=fc)
+        opts = copy.deepcopy(fc.opts)
+        opts['fn_in'] = os.path.abspath(opts['fn_in'])
+        fn_out = self._out_name(opts)
+        for job in self.jobs:
+            if self._out_name(job['opts']) == fn_out:
+                raise ValueError("output '{0}' of '{1}' already given by '{2}'".format(
+                    fn_out, opts['fn_in'], job['opts']['fn_in']))
+        self.jobs.append({'opts' : opts,
+                          'exe' : self.exe,
+                          'outdir' : self.outdir,
+                          'keep' : self.keep})
+
+    def run(self, showInfos=True):
+        """run all the jobs, returns a list of results dictionaries (same
+        order of the jobs, see _fdmnes_conv_job)"""
+        if not os.path.isdir(self.outdir):
+            os.makedirs(self.outdir)
+        t0 = time.time()
+        nproc = min(self.nproc, len(self.jobs))
+        if nproc <= 1:
+            self.results = [_fdmnes_conv_job(job) for job in self.jobs]
+        else:
+            pool = multiprocessing.Pool(nproc)
+            try:
+                self.results = pool.map(_fdmnes_conv_job, self.jobs, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        if showInfos:
+            for res in self.results:
+                if res['error'] is None:
+                    print('{0}: done in {1:.2f} s'.format(res['calcroot'], res['time']))
+                else:
+                    print('{0}: FAILED ({1})'.format(res['calcroot'], res['error']))
+            nerr = len(self.get_failed())
+            print('{0} jobs ({1} failed) in {2:.2f} s with {3} processes'.format(len(self.results), nerr, time.time()-t0, max(nproc, 1)))
+        return self.results
+
+    def get_failed(self):
+        """list of results of the failed jobs"""
+        return [res for res in self.results if res['error'] is not None]
 
 ### LARCH ###    
 def registerLarchPlugin():
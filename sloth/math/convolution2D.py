@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Separable 2D convolution (broadening of RIXS planes)
+
+Description
+-----------
+
+ A gridded plane, zz[y, x], is broadened along both axes with
+ energy-dependent kernels as
+
+ .. math::
+
+    Z_{conv} = K_y Z K_x^T
+
+ where K_x and K_y are the (sparse) 1D convolution operators built by
+ conv_operator() in convolution1D. The operators depend only on the
+ grid and the broadening, not on the intensity: they are built once
+ and then the broadening of a plane costs a pair of matrix products,
+ instead of a 1D conv() for each row and each column.
+
+"""
+MODNAME = '_math'
+DEBUG = 0
+
+import numpy as np
+
+from .convolution1D import conv_operator
+
+def conv2d_ops(x, y, fwhm_x, fwhm_y, kernel='gaussian', kwidth=1.5):
+    """ build the 1D convolution operators for the two axes
+
+    Parameters
+    ----------
+    x, y : 1D arrays, grid of the plane (e.g. RixsData.x, RixsData.y)
+    fwhm_x, fwhm_y : float or array of size 'x'/'y', full width half
+                     maximum of the kernel along each axis (e.g. from
+                     'lin_gamma()' or 'atan_gamma()')
+    kernel : str or (str, str), 'gaussian' or 'lorentzian' for both
+             axes or for (x, y), respectively
+    kwidth : see conv_operator()
+
+    Returns
+    -------
+    kx, ky : scipy.sparse.csr_matrix
+    """
+    if isinstance(kernel, str):
+        kernel = (kernel, kernel)
+    kx = conv_operator(x, fwhm_x, kernel=kernel[0], kwidth=kwidth)
+    ky = conv_operator(y, fwhm_y, kernel=kernel[1], kwidth=kwidth)
+    return kx, ky
+
+def conv2d(zz, kx, ky, nan=0.):
+    """ separable 2D convolution of a gridded plane
+
+    Parameters
+    ----------
+    zz : 2D array, shape (len(y), len(x))
+    kx, ky : 1D convolution operators (see conv2d_ops())
+    nan : [0.] value replacing NaNs in zz (e.g. outside the convex
+          hull of gridded data); if None, NaNs are propagated
+
+    Returns
+    -------
+    zconv : 2D array, K_y zz K_x^T
+    """
+    zz = np.asarray(zz, dtype=float)
+    if (zz.shape != (ky.shape[0], kx.shape[0])):
+        raise ValueError("'zz' shape {0} does not match the operators {1}".format(zz.shape, (ky.shape[0], kx.shape[0])))
+    if nan is not None:
+        zz = np.where(np.isnan(zz), nan, zz)
+    return kx.dot(ky.dot(zz).T).T
+
+def conv2d_xyz(x, y, zz, fwhm_x, fwhm_y, kernel='gaussian', kwidth=1.5, nan=0.):
+    """ one-shot 2D broadening, see conv2d_ops() and conv2d() """
+    kx, ky = conv2d_ops(x, y, fwhm_x, fwhm_y, kernel=kernel, kwidth=kwidth)
+    return conv2d(zz, kx, ky, nan=nan)
+
+if __name__ == '__main__':
+    pass
@@ -29,25 +29,35 @@ import numpy as np
 
 epsilon = 1.E-10 # Default epsilon for equality testing of points and vectors
 
+def _scalar(arr):
+    """float for 0-d results, the array otherwise"""
+    if np.ndim(arr) == 0:
+        return float(arr)
+    return arr
+
 #############################
 ### dot/cross/length/unit ###
 #############################
 
+# NOTE: all the functions accept single points/vectors (3,) or arrays
+# of them (..., 3), broadcasted together, and return (...) results
+
 def dot(v1, v2):
     """Dot product of two vectors"""
-    return v1.dot(v2)
+    return _scalar(np.einsum('...i,...i->...', np.asarray(v1, dtype=float),
+                             np.asarray(v2, dtype=float)))
 
 def cross(v1, v2):
     """Cross product of two vectors"""
-    return v1.cross(v2)
+    return np.cross(v1, v2)
 
 def length(v):
     """Length of vector"""
-    return math.sqrt(v.dot(v))
+    return _scalar(np.sqrt(dot(v, v)))
 
 def unit(v):
     """A unit vector in the direction of v"""
-    return v / length(v)
+    return np.asarray(v, dtype=float) / np.asarray(length(v))[..., None]
 
 ########################
 ### SIMPLE FUNCTIONS ###
@@ -55,32 +65,31 @@ def unit(v):
 
 def circle_3p(A, B, C):
     """get center and radius of a circle given 3 points in space"""
-    a = np.linalg.norm(C - B)
-    b = np.linalg.norm(C - A)
-    c = np.linalg.norm(B - A)
+    A, B, C = [np.asarray(_p, dtype=float) for _p in (A, B, C)]
+    a = np.asarray(length(C - B))
+    b = np.asarray(length(C - A))
+    c = np.asarray(length(B - A))
     s = (a + b + c) / 2
     R = a*b*c / 4 / np.sqrt(s * (s - a) * (s - b) * (s - c))
     b1 = a*a * (b*b + c*c - a*a)
     b2 = b*b * (a*a + c*c - b*b)
     b3 = c*c * (a*a + b*b - c*c)
-    P = np.column_stack((A, B, C)).dot(np.hstack((b1, b2, b3)))
-    P /= b1 + b2 + b3
-    return R, P
+    P = (b1[..., None] * A + b2[..., None] * B + b3[..., None] * C)
+    P /= (b1 + b2 + b3)[..., None]
+    return _scalar(R), P
 
 def plane_3p(p1, p2, p3):
     """get the plane ax+by+cz+d=0 given 3 points, p1, p2, p3"""
+    p1, p2, p3 = [np.asarray(_p, dtype=float) for _p in (p1, p2, p3)]
     v1 = p3 - p1
     v2 = p2 - p1
     cp = np.cross(v1, v2)
-    a, b, c = cp
-    d = - np.dot(cp, p3)
-    return np.array([a, b, c, d])
+    d = - np.asarray(dot(cp, p3))
+    return np.concatenate((cp, d[..., None]), axis=-1)
     
 def circle_radius(point, center):
     """get circle radius given a point and center as 3D arrays"""
-    x, y, z = point[:]
-    x0, y0, z0 = center[:]
-    return math.sqrt((x-x0)**2 + (y-y0)**2 + (z-z0)**2)
+    return length(np.asarray(point, dtype=float) - np.asarray(center, dtype=float))
 
 def lines2_intersect(p10, p11, p20, p21):
     """get intesection point, assuming line1 and line2 intersect and
@@ -88,14 +97,23 @@ def lines2_intersect(p10, p11, p20, p21):
     and (p20, p21)
 
     """
+    p10, p11, p20, p21 = [np.asarray(_p, dtype=float) for _p in (p10, p11, p20, p21)]
     t = (p20 - p10) / (p11 - p10 - p21 + p20)
     return p10 + t * (p11 - p10)
 
 def angle_3p(p0, p1, p2):
     """get the angle between three 3D points, p0 is the intersection point"""
+    p0, p1, p2 = [np.asarray(_p, dtype=float) for _p in (p0, p1, p2)]
     u, v = p1-p0, p2-p0
-    costheta = u.dot(v) / math.sqrt(u.dot(u) * v.dot(v))
-    return math.degrees(math.acos(costheta))
+    costheta = np.asarray(dot(u, v)) / np.sqrt(np.asarray(dot(u, u)) * dot(v, v))
+    return _scalar(np.degrees(np.arccos(np.clip(costheta, -1., 1.))))
+
+def point_plane_distance(point, plane):
+    """get the signed distance of 3d point(s) from plane(s), see
+    point_on_plane_projection()"""
+    point, plane = np.asarray(point, dtype=float), np.asarray(plane, dtype=float)
+    norm = plane[..., :-1]
+    return _scalar((dot(point, norm) + plane[..., -1]) / length(norm))
 
 def point_on_plane_projection(point, plane, test=False):
     """get the orthogonal projection of a 3d point on plane
@@ -103,29 +121,104 @@ def point_on_plane_projection(point, plane, test=False):
     Parameters
     ----------
     
-    point : 3d P(x,y,z) => np.array([x,y,z])
+    point : 3d P(x,y,z) => np.array([x,y,z]) or array of points (N, 3)
     
     plane : Ax+By+Cz+d=0, norm = (A,B,C)
-            => np.array([norm_x, norm_y, norm_z, d])
+            => np.array([norm_x, norm_y, norm_z, d]) or array of planes (N, 4)
     
     Returns
     -------
 
     proj_pt : projected point = point - norm * offset
-              => np.array([proj_x, proj_y, proj_z])
+              => np.array([proj_x, proj_y, proj_z]) or (N, 3)
         
     """
     try:
-        norm = plane[:-1]
-        d = plane[-1]
-        offset = (point.dot(norm) + d) / norm.dot(norm)
+        point, plane = np.asarray(point, dtype=float), np.asarray(plane, dtype=float)
+        norm = plane[..., :-1]
+        d = plane[..., -1]
+        offset = (dot(point, norm) + d) / dot(norm, norm)
     except:
         raise NameError('something wrong in point_on_plane_projection')
-    proj_pt = point - norm * offset
+    proj_pt = point - norm * np.asarray(offset)[..., None]
     if test:
-        assert (norm.dot(proj_pt) + d <= epsilon)
+        assert np.all(dot(norm, proj_pt) + d <= epsilon)
     return proj_pt
 
+###########################
+### LEAST-SQUARES FITS ###
+###########################
+
+def fit_plane(points, retAll=False):
+    """least-squares (orthogonal distances) plane through many points
+
+    Parameters
+    ----------
+    points : array (N, 3), N >= 3
+    retAll : boolean, [False] return also the distances of the points
+
+    Returns
+    -------
+    plane : np.array([norm_x, norm_y, norm_z, d]), Ax+By+Cz+d=0 with
+            unit normal
+    if retAll: (plane, dists), dists (N) are the signed distances
+    """
+    points = np.asarray(points, dtype=float)
+    if (points.ndim != 2) or (points.shape[0] < 3) or (points.shape[1] != 3):
+        raise NameError('fit_plane requires an array of N>=3 points (N, 3)')
+    cen = points.mean(axis=0)
+    # normal: right singular vector of the smallest singular value
+    norm = np.linalg.svd(points - cen, full_matrices=False)[2][-1]
+    plane = np.append(norm, -dot(norm, cen))
+    if retAll:
+        return plane, point_plane_distance(points, plane)
+    return plane
+
+def fit_circle(points, niter=20, retAll=False):
+    """least-squares circle through many points in space
+
+    The points are projected on the fitted plane (fit_plane), an
+    algebraic fit gives the initial circle, refined by Gauss-Newton
+    iterations on the geometric distances
+
+    Parameters
+    ----------
+    points : array (N, 3), N >= 3
+    niter : int, [20] maximum number of Gauss-Newton iterations
+    retAll : boolean, [False] return also the plane and the residuals
+
+    Returns
+    -------
+    R, P : radius and center, as circle_3p()
+    if retAll: (R, P, plane, res), res (N) are the in-plane distances
+               of the points from the circle
+    """
+    plane = fit_plane(points)
+    points = np.asarray(points, dtype=float)
+    cen = points.mean(axis=0)
+    # orthonormal basis (u, v) of the plane
+    norm = plane[:-1]
+    u = unit(np.cross(norm, np.eye(3)[np.argmin(np.abs(norm))]))
+    v = np.cross(norm, u)
+    rel = points - cen
+    x, y = rel.dot(u), rel.dot(v)
+    # algebraic (Kasa) fit: x^2+y^2 = 2*a*x + 2*b*y + c
+    mat = np.column_stack((2*x, 2*y, np.ones_like(x)))
+    a, b, c = np.linalg.lstsq(mat, x**2+y**2, rcond=None)[0]
+    R = math.sqrt(c + a**2 + b**2)
+    for _ in range(niter):
+        dx, dy = x - a, y - b
+        di = np.sqrt(dx**2 + dy**2)
+        jac = np.column_stack((-dx/di, -dy/di, -np.ones_like(di)))
+        step = np.linalg.lstsq(jac, -(di - R), rcond=None)[0]
+        a, b, R = a + step[0], b + step[1], R + step[2]
+        if np.all(np.abs(step) <= epsilon * max(1., abs(R))):
+            break
+    P = cen + a * u + b * v
+    if retAll:
+        res = np.sqrt((x-a)**2 + (y-b)**2) - R
+        return float(R), P, plane, res
+    return float(R), P
 
 if __name__ == '__main__':
     pass
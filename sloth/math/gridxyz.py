@@ -6,12 +6,161 @@ Utilities to work with 2D grids and interpolation
 from __future__ import division, print_function
 
 import warnings
+import hashlib
+from collections import OrderedDict
 import numpy as np
 
 ### GLOBAL VARIABLES ###
 MODNAME = '_math'
 
-def gridxyz(xcol, ycol, zcol, xystep=None, lib='scipy', method='cubic'):
+def _get_xygrid(xcol, ycol, xystep):
+    """regular XY grid (1D arrays) covering the given columns (NaN
+    are ignored)"""
+    xmin, xmax = np.nanmin(xcol), np.nanmax(xcol)
+    ymin, ymax = np.nanmin(ycol), np.nanmax(ycol)
+    xgrid = np.linspace(xmin, xmax, int((xmax-xmin)/xystep))
+    ygrid = np.linspace(ymin, ymax, int((ymax-ymin)/xystep))
+    return xgrid, ygrid
+
+def _grid_index(col, grid):
+    """index of the nearest node of a regular 1D grid"""
+    if (grid.size < 2):
+        return np.zeros(col.shape, dtype=np.intp)
+    step = (grid[-1] - grid[0]) / (grid.size - 1)
+    idx = np.rint((col - grid[0]) / step).astype(np.intp)
+    return np.clip(idx, 0, grid.size - 1)
+
+def _grid_binning(xcol, ycol, zcol, xgrid, ygrid):
+    """average of the points falling in each bin centered at the grid
+    nodes (empty bins are NaN), points with NaN are skipped"""
+    ok = np.isfinite(xcol) & np.isfinite(ycol) & np.isfinite(zcol)
+    if not np.all(ok):
+        xcol, ycol, zcol = xcol[ok], ycol[ok], zcol[ok]
+    ix = _grid_index(xcol, xgrid)
+    iy = _grid_index(ycol, ygrid)
+    ibin = iy * xgrid.size + ix
+    nbins = xgrid.size * ygrid.size
+    zsum = np.bincount(ibin, weights=zcol, minlength=nbins)
+    npts = np.bincount(ibin, minlength=nbins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        zz = zsum / npts
+    return zz.reshape(ygrid.size, xgrid.size)
+
+def _grid_kdtree(xcol, ycol, zcol, xgrid, ygrid, method='idw',
+                 knn=4, radius=None, power=2.):
+    """nearest neighbor or inverse distance weighted interpolation of
+    the 'knn' points within 'radius' (using a KD-tree); nodes without
+    neighbors are NaN"""
+    from scipy.spatial import cKDTree
+    if ('near' in method.lower()) or (method.lower() == 'nn'):
+        knn = 1
+    if radius is None:
+        radius = np.inf
+    tree = cKDTree(np.column_stack((xcol, ycol)))
+    xx, yy = np.meshgrid(xgrid, ygrid)
+    dist, idx = tree.query(np.column_stack((xx.ravel(), yy.ravel())),
+                           k=knn, distance_upper_bound=radius)
+    if (knn == 1):
+        dist, idx = dist[:, None], idx[:, None]
+    found = np.isfinite(dist)
+    zpts = np.append(zcol, np.nan)[idx] # idx == len(zcol) if not found
+    with np.errstate(divide='ignore'):
+        wgts = np.where(found, 1. / dist**power, 0.)
+    # exact matches take the value of the data point
+    exact = (dist == 0)
+    hasexact = exact.any(axis=1)
+    wgts[hasexact] = exact[hasexact]
+    zpts[~found] = 0.
+    with np.errstate(invalid='ignore'):
+        zz = (wgts * zpts).sum(axis=1) / wgts.sum(axis=1)
+    return zz.reshape(ygrid.size, xgrid.size)
+
+class TriCache(object):
+    """Cache of Delaunay triangulations keyed by the XY coordinates
+
+    Gridding again the same (X, Y) points with a different intensity
+    column (e.g. a new normalization) reuses the stored
+    triangulation. For linear interpolation also the barycentric
+    weights of the grid nodes are stored, thus the new map is a
+    simple weighted sum of the intensities.
+
+    Usage
+    -----
+    >>> tc = TriCache()
+    >>> x, y, zz1 = gridxyz(xcol, ycol, zcol1, xystep=0.1, tricache=tc)
+    >>> x, y, zz2 = gridxyz(xcol, ycol, zcol2, xystep=0.1, tricache=tc)
+    """
+
+    def __init__(self, maxsize=4):
+        """maxsize : [4] number of triangulations kept in memory"""
+        self.maxsize = maxsize
+        self._tris = OrderedDict()
+        self._wgts = OrderedDict()
+
+    def clear(self):
+        """empty the cache"""
+        self._tris.clear()
+        self._wgts.clear()
+
+    def key(self, xcol, ycol):
+        """hash key for the given XY columns"""
+        sha = hashlib.sha1()
+        for col in (xcol, ycol):
+            col = np.ascontiguousarray(col, dtype=np.float64)
+            sha.update(str(col.shape).encode())
+            sha.update(col.tobytes())
+        return sha.hexdigest()
+
+    def _store(self, cache, key, value):
+        cache[key] = value
+        while len(cache) > self.maxsize:
+            cache.popitem(last=False)
+
+    def get_tri(self, xcol, ycol):
+        """scipy.spatial.Delaunay triangulation of the XY points"""
+        key = self.key(xcol, ycol)
+        if key in self._tris:
+            self._tris[key] = self._tris.pop(key) # most recently used
+        else:
+            from scipy.spatial import Delaunay
+            self._store(self._tris, key, Delaunay(np.column_stack((xcol, ycol))))
+        return self._tris[key]
+
+    def get_weights(self, xcol, ycol, xgrid, ygrid):
+        """vertices and barycentric weights of the grid nodes (-1
+        vertices for nodes outside the convex hull)"""
+        key = (self.key(xcol, ycol), self.key(xgrid, ygrid))
+        if key in self._wgts:
+            self._wgts[key] = self._wgts.pop(key)
+            return self._wgts[key]
+        tri = self.get_tri(xcol, ycol)
+        xx, yy = np.meshgrid(xgrid, ygrid)
+        pts = np.column_stack((xx.ravel(), yy.ravel()))
+        simplex = tri.find_simplex(pts)
+        trans = tri.transform[simplex]
+        bary = np.einsum('ijk,ik->ij', trans[:, :2, :], pts - trans[:, 2, :])
+        wgts = np.column_stack((bary, 1. - bary.sum(axis=1)))
+        verts = tri.simplices[simplex]
+        verts[simplex < 0] = -1
+        self._store(self._wgts, key, (verts, wgts))
+        return verts, wgts
+
+    def interp(self, xcol, ycol, zcol, xgrid, ygrid, method='linear'):
+        """interpolate zcol on the grid using the cached triangulation"""
+        if (method == 'linear'):
+            verts, wgts = self.get_weights(xcol, ycol, xgrid, ygrid)
+            zz = (np.asarray(zcol)[verts] * wgts).sum(axis=1)
+            zz[verts[:, 0] < 0] = np.nan
+            return zz.reshape(ygrid.size, xgrid.size)
+        elif (method == 'cubic'):
+            from scipy.interpolate import CloughTocher2DInterpolator
+            ip = CloughTocher2DInterpolator(self.get_tri(xcol, ycol), zcol)
+            return ip(xgrid[None,:], ygrid[:,None])
+        else:
+            raise NameError("method '{0}' does not use a triangulation".format(method))
+
+def gridxyz(xcol, ycol, zcol, xystep=None, lib='scipy', method='cubic',
+            knn=4, radius=None, power=2., tricache=None):
     """ grid (X, Y, Z) 1D data on a 2D regular mesh
     
     Parameters
@@ -21,7 +170,23 @@ def gridxyz(xcol, ycol, zcol, xystep=None, lib='scipy', method='cubic'):
     lib : library used for griddata
           [scipy]
           matplotlib
+          binning : fast 2D histogram, average of the points in each
+                    bin centered at the grid nodes (no interpolation)
+          kdtree : nearest neighbor ('nearest') or inverse distance
+                   weighted ('idw') interpolation of the closest points
+          scans : the map is a stack of 1D scans, see gridxyz_scans()
     method : interpolation method
+    knn : [4] number of neighbors used by 'kdtree' with method='idw'
+    radius : [None] maximum distance of the neighbors used by 'kdtree'
+             (None: no limit)
+    power : [2.] power of the inverse distance weights used by 'kdtree'
+    tricache : [None] TriCache object storing the triangulation (and
+               interpolation weights) of the XY points for 'scipy'
+               with method 'linear' or 'cubic'
+
+    Empty bins ('binning') or nodes without neighbors ('kdtree') are
+    given as NaN: the fastest choice is 'binning' (for dense maps),
+    'kdtree' with method='idw' gives a smoother map.
     
     Returns
     -------
@@ -36,9 +201,7 @@ def gridxyz(xcol, ycol, zcol, xystep=None, lib='scipy', method='cubic'):
         xystep = 0.05
         warnings.warn("'xystep' not given: using a default value of {0}".format(xystep))
     #create the XY meshgrid and interpolate the Z on the grid
-    xgrid = np.linspace(xcol.min(), xcol.max(), (xcol.max()-xcol.min())/xystep)
-    ygrid = np.linspace(ycol.min(), ycol.max(), (ycol.max()-ycol.min())/xystep)
-    xx, yy = np.meshgrid(xgrid, ygrid)
+    xgrid, ygrid = _get_xygrid(xcol, ycol, xystep)
     if ('matplotlib' in lib.lower()):
         try:
             from matplotlib.mlab import griddata
@@ -48,6 +211,7 @@ def gridxyz(xcol, ycol, zcol, xystep=None, lib='scipy', method='cubic'):
         if not (method == 'nn' or method == 'nearest'):
             warnings.warn("method {0} not supported by {1}".format(method, lib))
         print("Gridding data with {0}...".format(lib))
+        xx, yy = np.meshgrid(xgrid, ygrid)
         zz = griddata(xcol, ycol, zcol, xx, yy)
         return xgrid, ygrid, zz
     elif ('scipy' in lib.lower()):
@@ -57,15 +221,272 @@ def gridxyz(xcol, ycol, zcol, xystep=None, lib='scipy', method='cubic'):
             print("Error: cannot load griddata from Scipy")
             return
         print("Gridding data with {0}...".format(lib))
-        zz = griddata((xcol, ycol), zcol, (xgrid[None,:], ygrid[:,None]), method=method)
+        if (tricache is not None) and (method in ('linear', 'cubic')):
+            zz = tricache.interp(xcol, ycol, zcol, xgrid, ygrid, method=method)
+        else:
+            zz = griddata((xcol, ycol), zcol, (xgrid[None,:], ygrid[:,None]), method=method)
+        return xgrid, ygrid, zz
+    elif ('bin' in lib.lower()) or ('hist' in lib.lower()):
+        print("Gridding data with {0}...".format(lib))
+        zz = _grid_binning(xcol, ycol, zcol, xgrid, ygrid)
+        return xgrid, ygrid, zz
+    elif ('kdtree' in lib.lower()):
+        if not (method in ('nn', 'nearest', 'idw')):
+            warnings.warn("method {0} not supported by {1}: using 'idw'".format(method, lib))
+            method = 'idw'
+        print("Gridding data with {0}...".format(lib))
+        zz = _grid_kdtree(xcol, ycol, zcol, xgrid, ygrid, method=method,
+                          knn=knn, radius=radius, power=power)
+        return xgrid, ygrid, zz
+    elif ('scans' in lib.lower()):
+        print("Gridding data with {0}...".format(lib))
+        return gridxyz_scans(xcol, ycol, zcol, xystep=xystep)
+    else:
+        raise ValueError("lib '{0}' unknown".format(lib))
+
+def _scans_on_grid(scol, pcol, zcol, sgrid):
+    """interpolate each scan on a common grid
+
+    A scan is a contiguous piece of the columns at constant position
+    (pcol), scanning along scol. Scans repeated at the same position
+    are averaged.
+
+    Returns
+    -------
+    ppos : 1D array, sorted positions of the scans
+    zs : 2D array, shape (len(ppos), len(sgrid)), scans on sgrid (NaN
+         outside the scanned range)
+    """
+    ibounds = np.concatenate(([0], np.flatnonzero(np.diff(pcol) != 0) + 1, [pcol.size]))
+    ppos, iscan = np.unique(pcol[ibounds[:-1]], return_inverse=True)
+    if (ppos.size < 2):
+        raise NameError("at least two scans at different positions are required")
+    zsum = np.zeros((ppos.size, sgrid.size))
+    nsum = np.zeros((ppos.size, sgrid.size))
+    for i0, i1, isc in zip(ibounds[:-1], ibounds[1:], iscan):
+        isort = np.argsort(scol[i0:i1], kind='mergesort')
+        zscan = np.interp(sgrid, scol[i0:i1][isort], zcol[i0:i1][isort],
+                          left=np.nan, right=np.nan)
+        good = np.isfinite(zscan)
+        zsum[isc, good] += zscan[good]
+        nsum[isc, good] += 1
+    with np.errstate(invalid='ignore'):
+        return ppos, zsum / nsum
+
+def _interp_pos(ppos, zs, pq):
+    """linear interpolation of the scans across their positions
+
+    Parameters
+    ----------
+    ppos, zs : see _scans_on_grid()
+    pq : 1D array of positions, or 2D array of shape (nq, zs.shape[1])
+         giving the positions for each column of zs
+
+    Returns
+    -------
+    2D array of shape (len(pq), zs.shape[1]), NaN outside ppos range
+    """
+    pq = np.asarray(pq, dtype=float)
+    i1 = np.clip(np.searchsorted(ppos, pq), 1, ppos.size - 1)
+    i0 = i1 - 1
+    w = (pq - ppos[i0]) / (ppos[i1] - ppos[i0])
+    if (pq.ndim == 1):
+        z0, z1 = zs[i0], zs[i1]
+        w = w[:, None]
+        outside = ((pq < ppos[0]) | (pq > ppos[-1]))[:, None]
+    else:
+        icol = np.arange(zs.shape[1])[None, :]
+        z0, z1 = zs[i0, icol], zs[i1, icol]
+        outside = (pq < ppos[0]) | (pq > ppos[-1])
+    return np.where(outside, np.nan, z0 * (1. - w) + z1 * w)
+
+def gridxyz_scans(xcol, ycol, zcol, xystep=None, et=False):
+    """ grid (X, Y, Z) 1D data composed of a stack of 1D scans
+
+    This is the case of maps collected as 1D scans at different
+    positions of a motor (e.g. SpecfileData.get_map()): each scan is
+    interpolated on the common grid with np.interp, then the scans are
+    linearly interpolated across their positions. No triangulation is
+    required and the cost is linear with the number of points.
+
+    Parameters
+    ----------
+    xcol, ycol, zcol : 1D arrays repesenting the map (z is the
+                       intensity); the scans are contiguous pieces at
+                       constant y (or constant x, detected
+                       automatically)
+    xystep : the step size of the XY grid
+    et : [False] if True, grid also the energy transfer plane, that is,
+         (x, x-y), directly from the interpolated scans
+
+    Returns
+    -------
+    xgrid, ygrid : 1D arrays giving abscissa and ordinate of the map
+    zz : 2D array with the gridded intensity map
+    if et:
+    etgrid : 1D array giving the energy transfer (ordinate)
+    ezz : 2D array with the gridded intensity map on (xgrid, etgrid)
+    """
+    if xystep is None:
+        xystep = 0.05
+        warnings.warn("'xystep' not given: using a default value of {0}".format(xystep))
+    xgrid, ygrid = _get_xygrid(xcol, ycol, xystep)
+    # scans along x at fixed y positions (or vice versa)
+    alongx = (np.count_nonzero(np.diff(ycol)) <= np.count_nonzero(np.diff(xcol)))
+    if alongx:
+        ypos, zs = _scans_on_grid(xcol, ycol, zcol, xgrid)
+        zz = _interp_pos(ypos, zs, ygrid)
+    else:
+        xpos, zs = _scans_on_grid(ycol, xcol, zcol, ygrid)
+        zz = _interp_pos(xpos, zs, xgrid).T
+    if not et:
         return xgrid, ygrid, zz
+    etcol = xcol - ycol
+    etgrid = _get_xygrid(xcol, etcol, xystep)[1]
+    if alongx:
+        # each scan is a diagonal line in the (x, et) plane: for each
+        # x, the scan at y gives the intensity at et = x - y
+        ezz = _interp_pos(ypos, zs, xgrid[None, :] - etgrid[:, None])
+    else:
+        xpos, ezs = _scans_on_grid(etcol, xcol, zcol, etgrid)
+        ezz = _interp_pos(xpos, ezs, xgrid).T
+    return xgrid, ygrid, zz, etgrid, ezz
+
+def _grid_tile(task):
+    """grid the points of a single tile (used by gridxyz_tiled)
+
+    Parameters
+    ----------
+    task : tuple (islc, xcol, ycol, zcol, xgrid, ygrid, lib, method, kws)
+
+    Returns
+    -------
+    islc, zz : the slices of the tile in the full grid and its map
+    """
+    islc, xcol, ycol, zcol, xgrid, ygrid, lib, method, kws = task
+    zz = np.full((ygrid.size, xgrid.size), np.nan)
+    if (xcol.size < 3):
+        return islc, zz
+    if ('kdtree' in lib.lower()):
+        zz = _grid_kdtree(xcol, ycol, zcol, xgrid, ygrid, method=method, **kws)
+    else:
+        from scipy.interpolate import griddata
+        try:
+            from scipy.spatial import QhullError
+        except ImportError:
+            from scipy.spatial.qhull import QhullError
+        try:
+            zz = griddata((xcol, ycol), zcol, (xgrid[None,:], ygrid[:,None]), method=method)
+        except QhullError:
+            # degenerate (e.g. collinear) points in the tile: left NaN
+            pass
+    return islc, zz
+
+TILED_METHODS = {'scipy' : ('nearest', 'linear', 'cubic'),
+                 'kdtree' : ('nn', 'nearest', 'idw'),
+                 'binning' : None}
+
+def _tiled_lib(lib, method):
+    """validated library name for gridxyz_tiled (NameError if not supported)"""
+    _lib = lib.lower()
+    if ('bin' in _lib) or ('hist' in _lib):
+        return 'binning'
+    if ('kdtree' in _lib):
+        _lib = 'kdtree'
+    elif ('scipy' in _lib):
+        _lib = 'scipy'
+    else:
+        raise NameError("lib '{0}' not supported by gridxyz_tiled".format(lib))
+    if method not in TILED_METHODS[_lib]:
+        raise NameError("method '{0}' not supported by {1}: use one of {2}".format(method, _lib, TILED_METHODS[_lib]))
+    return _lib
+
+def gridxyz_tiled(xcol, ycol, zcol, xystep=None, lib='scipy', method='linear',
+                  tile=256, halo=8, nproc=1, outfile=None, **kws):
+    """ grid (X, Y, Z) 1D data on a 2D regular mesh, tile by tile
+
+    The output grid is split in tiles of (tile x tile) nodes. For each
+    tile, only the scattered points inside the tile extended by a halo
+    are selected (via a KD-tree) and gridded independently, optionally
+    in parallel processes. The result is written into a preallocated
+    array or a memory-mapped .npy file, thus the memory needed is given
+    by the tiles and not by the full grid.
+
+    Parameters
+    ----------
+    xcol, ycol, zcol : 1D arrays repesenting the map (z is the intensity)
+    xystep : the step size of the XY grid (as in gridxyz())
+    lib : [scipy] or kdtree or binning (see gridxyz(), 'binning' is not
+          tiled as it does not need it), NameError for other libraries
+    method : ['linear'] interpolation method, see TILED_METHODS
+    tile : [256] number of grid nodes on each side of a tile
+    halo : [8] extra grid steps around each tile where the scattered
+           points are also taken (it must be larger than the distance
+           between the scattered points to reproduce the full gridding
+           at the tile borders)
+    nproc : [1] number of parallel processes
+    outfile : [None] if given, the map is written into this .npy file
+              (memory-mapped, see numpy.lib.format.open_memmap)
+    **kws : passed to the 'kdtree' library (knn, radius, power)
+
+    Returns
+    -------
+    xgrid, ygrid : 1D arrays giving abscissa and ordinate of the map
+    zz : 2D array (or numpy.memmap) with the gridded intensity map
+    """
+    from scipy.spatial import cKDTree
+    lib = _tiled_lib(lib, method)
+    if xystep is None:
+        xystep = 0.05
+        warnings.warn("'xystep' not given: using a default value of {0}".format(xystep))
+    xgrid, ygrid = _get_xygrid(xcol, ycol, xystep)
+    if outfile is not None:
+        zz = np.lib.format.open_memmap(outfile, mode='w+', dtype=np.float64,
+                                       shape=(ygrid.size, xgrid.size))
+    else:
+        zz = np.empty((ygrid.size, xgrid.size))
+    print("Gridding data with {0} in tiles of {1}x{1}...".format(lib, tile))
+    if (lib == 'binning'):
+        zz[:] = _grid_binning(xcol, ycol, zcol, xgrid, ygrid)
+        return xgrid, ygrid, zz
+    tree = cKDTree(np.column_stack((xcol, ycol)))
+    # halo from the actual grid steps (linspace, not exactly xystep)
+    steps = [(_g[-1] - _g[0]) / (_g.size - 1) for _g in (xgrid, ygrid) if (_g.size > 1)]
+    rhalo = halo * max(steps + [xystep])
+    def _tasks():
+        for iy0 in range(0, ygrid.size, tile):
+            for ix0 in range(0, xgrid.size, tile):
+                islc = (slice(iy0, iy0+tile), slice(ix0, ix0+tile))
+                xg, yg = xgrid[islc[1]], ygrid[islc[0]]
+                # points in the tile box (+ halo), Chebyshev distance
+                cen = ((xg[0] + xg[-1]) / 2., (yg[0] + yg[-1]) / 2.)
+                rad = max(xg[-1] - xg[0], yg[-1] - yg[0]) / 2. + rhalo
+                ipts = tree.query_ball_point(cen, rad, p=np.inf)
+                yield (islc, xcol[ipts], ycol[ipts], zcol[ipts], xg, yg,
+                       lib, method, kws)
+    if (nproc > 1):
+        import multiprocessing
+        pool = multiprocessing.Pool(nproc)
+        try:
+            for islc, zt in pool.imap_unordered(_grid_tile, _tasks()):
+                zz[islc] = zt
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in _tasks():
+            islc, zt = _grid_tile(task)
+            zz[islc] = zt
+    if outfile is not None:
+        zz.flush()
+    return xgrid, ygrid, zz
 
 ### LARCH ###
-def gridxyz_larch(xcol, ycol, zcol, xystep=None, method='cubic', lib='scipy', _larch=None):
+def gridxyz_larch(xcol, ycol, zcol, xystep=None, method='cubic', lib='scipy', _larch=None, **kws):
     """ Larch equivalent of gridxyz() """
     if _larch is None:
         raise Warning("Larch broken?")
-    return gridxyz(xcol, ycol, zcol, xystep=xystep, method=method, lib=lib)
+    return gridxyz(xcol, ycol, zcol, xystep=xystep, method=method, lib=lib, **kws)
 gridxyz_larch.__doc__ += gridxyz.__doc__
 
 def registerLarchPlugin():
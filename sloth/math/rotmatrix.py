@@ -15,82 +15,77 @@ Code downloaded from
 import numpy as np
 import math
 
-def rotation_matrix_numpy(axis, theta):
-    """ return the rotation matrix using numpy
+def rotation_matrices(axes, thetas):
+    """ return the rotation matrices for arrays of axes and angles
 
     Parameters
     ----------
-    axis : numpy.array([x,y,z])
-    theta : rotation angle in radians
-    """
-    mat = np.eye(3,3)
-    axis = axis/math.sqrt(np.dot(axis, axis))
-    a = math.cos(theta/2.)
-    b, c, d = -axis*math.sin(theta/2.)
+    axes : array (..., 3), rotation axes (not normalized)
+    thetas : array (...), rotation angles in radians
 
-    return np.array([[a*a+b*b-c*c-d*d, 2*(b*c-a*d), 2*(b*d+a*c)],
-                  [2*(b*c+a*d), a*a+c*c-b*b-d*d, 2*(c*d-a*b)],
-                  [2*(b*d-a*c), 2*(c*d+a*b), a*a+d*d-b*b-c*c]])
+    axes and thetas are broadcasted together
 
-def rotation_matrix_weave(axis, theta, mat=None):
-    """ return the rotation matrix using Weave
-    (~20x faster than numpy)
+    Returns
+    -------
+    mats : array (..., 3, 3)
+    """
+    axes = np.asarray(axes, dtype=float)
+    thetas = np.asarray(thetas, dtype=float)
+    axes = axes / np.sqrt(np.einsum('...i,...i->...', axes, axes))[..., None]
+    a = np.cos(thetas/2.)
+    bcd = -axes * np.sin(thetas/2.)[..., None]
+    a, bcd = np.broadcast_arrays(a[..., None], bcd)
+    a = a[..., 0]
+    b, c, d = bcd[..., 0], bcd[..., 1], bcd[..., 2]
+    aa, bb, cc, dd = a*a, b*b, c*c, d*d
+    bc, ad, bd, ac, cd, ab = b*c, a*d, b*d, a*c, c*d, a*b
+    return np.stack((np.stack((aa+bb-cc-dd, 2*(bc-ad), 2*(bd+ac)), axis=-1),
+                     np.stack((2*(bc+ad), aa+cc-bb-dd, 2*(cd-ab)), axis=-1),
+                     np.stack((2*(bd-ac), 2*(cd+ab), aa+dd-bb-cc), axis=-1)),
+                    axis=-2)
+
+def rotation_matrix_numpy(axis, theta):
+    """ return the rotation matrix using numpy
 
     Parameters
     ----------
     axis : numpy.array([x,y,z])
     theta : rotation angle in radians
     """
-    if mat == None:
-        mat = np.eye(3,3)
-        
-    support = "#include <math.h>"
-    code = """
-    double x = sqrt(axis[0] * axis[0] + axis[1] * axis[1] + axis[2] * axis[2]);
-    double a = cos(theta / 2.0);
-    double b = -(axis[0] / x) * sin(theta / 2.0);
-    double c = -(axis[1] / x) * sin(theta / 2.0);
-    double d = -(axis[2] / x) * sin(theta / 2.0);
-    
-    mat[0] = a*a + b*b - c*c - d*d;
-    mat[1] = 2 * (b*c - a*d);
-    mat[2] = 2 * (b*d + a*c);
-    
-    mat[3*1 + 0] = 2*(b*c+a*d);
-    mat[3*1 + 1] = a*a+c*c-b*b-d*d;
-    mat[3*1 + 2] = 2*(c*d-a*b);
-    
-    mat[3*2 + 0] = 2*(b*d-a*c);
-    mat[3*2 + 1] = 2*(c*d+a*b);
-    mat[3*2 + 2] = a*a+d*d-b*b-c*c;
-    """
+    return rotation_matrices(axis, theta)
 
-    weave.inline(code, ['axis', 'theta', 'mat'], support_code=support,
-                 libraries = ['m'])
+def rotate_points(arr, axes, thetas):
+    """ rotate points (..., 3) around axes (..., 3) by thetas (...)
 
-    return mat
+    all the arguments are broadcasted together, e.g. (N, 3) points
+    around one axis by one angle or by N angles
+
+    Returns
+    -------
+    np.array (..., 3)
+    """
+    return np.einsum('...ij,...j->...i', rotation_matrices(axes, thetas),
+                     np.asarray(arr, dtype=float))
 
 def rotate(arr, axis, theta, method='numpy'):
-    """ rotate array around axis by theta with 'numpy' or 'weave'
+    """ rotate array around axis by theta
     
     Arguments
     ---------
-    arr : np.array([x,y,z])
+    arr : np.array([x,y,z]) or array of points (N, 3)
     axis : np.array([x,y,z])
     theta : in radians
-    method : 'numpy' or 'weave'
+    method : 'numpy' (the 'weave' method has been removed)
 
     Returns
     -------
-    np.array([x,y,z])
+    np.array([x,y,z]) or (N, 3)
 
     """
     if (method == 'numpy'):
-        return np.dot(rotation_matrix_numpy(axis,theta),arr)
-    elif (method == 'weave'):
-        return np.dot(rotation_matrix_weave(axis,theta),arr)
+        return rotate_points(arr, axis, theta)
     else:
-        raise NameError("method for rotation matrix is 'numpy' or 'weave'")
+        raise NameError("method for rotation matrix is 'numpy'")
 
 if __name__ == '__main__':
     v = np.array([3,5,0])
@@ -99,5 +94,5 @@ if __name__ == '__main__':
 
     print("Rotation with Numpy:")
     print(np.dot(rotation_matrix_numpy(axis,theta),v))
-    print("Rotation with Scipy.Weave:")
-    print(np.dot(rotation_matrix_weave(axis,theta),v))
+    print("Batched rotation:")
+    print(rotate_points(np.array([v, 2*v]), axis, theta))
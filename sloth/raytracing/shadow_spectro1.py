@@ -1323,8 +1323,8 @@ class ShadowSpectro1(object):
         aXoff : float
                 analyser center offset in X [cm]
         """
-        _offXYZ = self.rc.get_ana_pos(aXoff) - self.rc.get_ana_pos(0.)
         _chi = self.rc.get_chi(aXoff)
+        _offXYZ = self.rc.get_ana_pos(_chi) - self.rc.get_ana_pos(0.)
         self.move_mirr(move=True, offXYZ=_offXYZ, rotXYZ=np.array([0., _chi, 0.]), **kws)
         
         #self.run()
@@ -12,13 +12,78 @@ TODO
 from __future__ import print_function, division
 
 import os, sys
+import hashlib
 import numpy as np
 from matplotlib import cm
 
 # Larch & friends
-from ..math.gridxyz import gridxyz
+from ..math.gridxyz import gridxyz, gridxyz_scans, TriCache
+from ..math.convolution2D import conv2d_ops, conv2d
 from ..io.specfile_reader import _str2rng as str2rng
 from ..io.specfile_reader import SpecfileData
+from ..io.columnfile_reader import load_columns
+from ..io.array_container import write_arrays, ArrayContainer
+
+# arrays saved/loaded by RixsData.save()/load()
+SESSION_ARRAYS = ('xcol', 'ycol', 'etcol', 'zcol',
+                  'x', 'y', 'zz',
+                  'ex', 'et', 'ezz')
+
+def _get_cmap(name):
+    """colormap object from its name"""
+    try:
+        import matplotlib
+        return matplotlib.colormaps[name]
+    except (AttributeError, ImportError):
+        return cm.get_cmap(name)
+
+def _kwsd_to_json(obj):
+    """kwsd -> JSON-serializable (colormaps stored by name)"""
+    if isinstance(obj, dict):
+        return dict((key, _kwsd_to_json(val)) for key, val in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_kwsd_to_json(val) for val in obj]
+    if hasattr(obj, 'name') and hasattr(obj, 'N'):
+        return {'__cmap__' : obj.name}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+def _kwsd_from_json(obj):
+    """inverse of _kwsd_to_json"""
+    if isinstance(obj, dict):
+        if '__cmap__' in obj:
+            return _get_cmap(obj['__cmap__'])
+        return dict((key, _kwsd_from_json(val)) for key, val in obj.items())
+    if isinstance(obj, list):
+        return tuple(_kwsd_from_json(val) for val in obj)
+    return obj
+
+def _grid_coords(grid, values, eps=1E-6):
+    """fractional index of 'values' on a regular 1D grid (the grid
+    edges within eps steps are snapped, not to lose them to rounding)"""
+    nmax = grid.size - 1
+    coords = (np.asarray(values, dtype=float) - grid[0]) * (nmax / (grid[-1] - grid[0]))
+    coords = np.where((coords < 0) & (coords > -eps), 0., coords)
+    return np.where((coords > nmax) & (coords < nmax + eps), nmax, coords)
+
+def _sample_plane(xgrid, ygrid, zz, xq, yq):
+    """bilinear interpolation of a gridded plane at the (xq, yq)
+    points (arrays of any shape), NaN outside the grid"""
+    from scipy.ndimage import map_coordinates
+    xq, yq = np.broadcast_arrays(xq, yq)
+    coords = np.array([_grid_coords(ygrid, yq).ravel(),
+                       _grid_coords(xgrid, xq).ravel()])
+    zq = map_coordinates(np.asarray(zz, dtype=float), coords, order=1,
+                         mode='constant', cval=np.nan)
+    return zq.reshape(xq.shape)
+
+def _width_offsets(width, step):
+    """offsets used to average over an integration width"""
+    if (width is None) or (width <= 0):
+        return np.zeros(1)
+    nw = int(round(width / step)) + 1
+    return np.linspace(-width/2., width/2., nw)
 
 class RixsData(object):
     """RIXS plane object"""
@@ -32,6 +97,64 @@ class RixsData(object):
         if label is None:
             label = 'rd{0}'.format(hex(id(self)))
         self.label = label
+        # triangulations of (x, y) and (x, et) reused by self.gridxyz()
+        self.tricache = TriCache()
+        # convolution operators of self.broaden()
+        self._conv_ops = {}
+
+    def __getattr__(self, name):
+        """arrays of a loaded session are read at first access"""
+        session = self.__dict__.get('_session')
+        if (session is None) or (name not in SESSION_ARRAYS) or (name not in session):
+            raise AttributeError(name)
+        arr = session[name]
+        setattr(self, name, arr)
+        return arr
+
+    def save(self, fname, fmt=None, compress=True):
+        """save the session (raw columns, gridded planes, label and
+        kwsd) to a single file
+
+        Parameters
+        ----------
+        fname : str, file name (.npz or .h5/.hdf5, the latter requires h5py)
+        fmt : str, [None -> from extension] 'npz' or 'h5'
+        compress : boolean, [True] compress the arrays; with
+                   compress=False they are memory-mapped by load()
+        """
+        arrs = {}
+        for name in SESSION_ARRAYS:
+            try:
+                arr = getattr(self, name)
+            except AttributeError:
+                continue
+            if arr is not None:
+                arrs[name] = arr
+        attrs = {'label' : self.label,
+                 'kwsd' : _kwsd_to_json(self.kwsd)}
+        write_arrays(fname, arrs, attrs=attrs, fmt=fmt, compress=compress)
+        print('Saved {0}'.format(fname))
+
+    def load(self, fname, fmt=None):
+        """load a session written by self.save()
+
+        Only label and kwsd are read immediately, the arrays (see
+        SESSION_ARRAYS) at first access
+        """
+        session = ArrayContainer(fname, fmt=fmt)
+        for name in SESSION_ARRAYS:
+            self.__dict__.pop(name, None)
+        if self.__dict__.get('_session') is not None:
+            self._session.close()
+        self._session = session
+        # caches of the previous data
+        self._conv_ops = {}
+        self.tricache = TriCache()
+        self.label = session.attrs.get('label', self.label)
+        kwsd = session.attrs.get('kwsd', None)
+        if kwsd is not None:
+            self.kwsd = _kwsd_from_json(kwsd)
+        print('Loaded {0}'.format(fname))
 
     def getkwsd(self):
         """ return a dictionary of dictionaries with keywords arguments:
@@ -119,6 +242,8 @@ class RixsData(object):
                           'cont_levels': 100,
                           'cont_labels': None,
                           'cont_labelformat': '%.3f',
+                          'cont_cache' : 16,
+                          'decimate' : True,
                           'origin': 'lower',
                           'lcuts' : False,
                           'xcut' : None,
@@ -133,10 +258,14 @@ class RixsData(object):
         """load data from a 3 columns ASCII file assuming the format: e_in,
         e_out, signal
 
+        The file is parsed once and cached in a binary sidecar
+        (fname.npy), memory-mapped at the next loads (disable with
+        cache=False keyword argument), see io.columnfile_reader
+
         """
-      
+        cache = kws.get('cache', True)
         try:
-            self.dat = np.loadtxt(fname)
+            self.dat = load_columns(fname, cache=cache)
             print('Loaded {0}'.format(fname))
         except:
             print('Error in loading {0}'.format(fname))
@@ -157,19 +286,31 @@ class RixsData(object):
         xystep = kws.get('xystep', self.kwsd['grid']['xystep'])
         method = kws.get('method', self.kwsd['grid']['method'])
         lib = kws.get('lib', self.kwsd['grid']['lib'])
+        # new grid: the convolution operators are not valid anymore
+        self._conv_ops = {}
+
+        if ('scans' in lib.lower()):
+            # both planes from the same interpolated scans
+            _grids = gridxyz_scans(self.xcol, self.ycol, self.zcol,
+                                   xystep=xystep, et=True)
+            self.x, self.y, self.zz = _grids[:3]
+            self.ex, self.et, self.ezz = self.x, _grids[3], _grids[4]
+            return
 
         self.x, self.y, self.zz = gridxyz(self.xcol,
                                           self.ycol,
                                           self.zcol,
                                           xystep=xystep,
                                           method=method,
-                                          lib=lib)
+                                          lib=lib,
+                                          tricache=self.tricache)
         self.ex, self.et, self.ezz = gridxyz(self.xcol,
                                              self.etcol,
                                              self.zcol,
                                              xystep=xystep,
                                              method=method,
-                                             lib=lib)
+                                             lib=lib,
+                                             tricache=self.tricache)
         
     def load_spec_map(self, **kws):
         """load the plane from SPEC file
@@ -208,19 +349,210 @@ class RixsData(object):
         self.etcol = self.xcol-self.ycol # energy transfer
 
     def crop(self, x1, y1, x2, y2, **kws):
-        """crop the plane in given range (x1, y1) -> (x2, y2)"""
-        xystep = kws.get('xystep', self.kwsd['spec']['xystep'])
-        from matplotlib.mlab import griddata
+        """crop the plane in given range (x1, y1) -> (x2, y2)
+
+        By default the cropped planes are views (slices, no copy) of
+        the gridded ones:
+
+        self.xcrop, self.ycrop, self.zzcrop : of self.x, self.y, self.zz
+        self.excrop, self.etcrop, self.ezzcrop : of self.ex, self.et,
+                                                  self.ezz, in the energy
+                                                  transfer range
+                                                  (x2-y2) -> (x1-y1)
+        self.crop_roi : dictionary with the crop range and the slices
+                        in the gridded planes ('xy' and 'et', as
+                        (yslice, xslice) tuples)
+
+        Re-gridding from the (x, y, z) columns happens only if a
+        'xystep' finer than the current grid step is given (keyword
+        argument); 'method' is then the scipy griddata method
+        ['linear'].
+        """
+        xystep = kws.get('xystep', None)
+        step = self.x[1] - self.x[0]
+        if (xystep is not None) and (xystep < step * (1 - 1e-6)):
+            return self._crop_regrid(x1, y1, x2, y2, xystep,
+                                     method=kws.get('method', 'linear'))
+        def _slc(grid, v1, v2):
+            return slice(np.searchsorted(grid, min(v1, v2), side='left'),
+                         np.searchsorted(grid, max(v1, v2), side='right'))
+        ixs = _slc(self.x, x1, x2)
+        iys = _slc(self.y, y1, y2)
+        iexs = _slc(self.ex, x1, x2)
+        iets = _slc(self.et, x2-y2, x1-y1)
+        self.xcrop = self.x[ixs]
+        self.ycrop = self.y[iys]
+        self.zzcrop = self.zz[iys, ixs]
+        self.excrop = self.ex[iexs]
+        self.etcrop = self.et[iets]
+        self.ezzcrop = self.ezz[iets, iexs]
+        self.crop_roi = {'x1' : x1, 'y1' : y1, 'x2' : x2, 'y2' : y2,
+                         'xystep' : step,
+                         'xy' : (iys, ixs),
+                         'et' : (iets, iexs)}
+        return
+
+    def _crop_regrid(self, x1, y1, x2, y2, xystep, method='linear'):
+        """crop by re-gridding the (x, y, z) columns with a finer step,
+        only the points around the crop range are used"""
+        from scipy.interpolate import griddata
         self.xcrop = np.arange(x1, x2, xystep)
         self.ycrop = np.arange(y1, y2, xystep)
-        _xx, _yy = np.meshgrid(self.xcrop, self.ycrop)
         self.excrop = np.arange(x1, x2, xystep)
-        self.etcrop = np.arange(x2-y2, x1-y1, xystep)
-        _exx, _et = np.meshgrid(self.excrop, self.etcrop)
-        self.zzcrop = griddata(self.xcol, self.ycol, self.zcol, _xx, _yy)
-        self.ezzcrop = griddata(self.xcol, self.etcol, self.zcol, _exx, _et)
+        et1, et2 = min(x2-y2, x1-y1), max(x2-y2, x1-y1)
+        self.etcrop = np.arange(et1, et2, xystep)
+        # margin of one grid step of the current grid
+        mrg = self.x[1] - self.x[0]
+        inx = (self.xcol >= x1-mrg) & (self.xcol <= x2+mrg)
+        def _regrid(ycol, ymin, ymax, xgrid, ygrid):
+            sel = inx & (ycol >= ymin-mrg) & (ycol <= ymax+mrg)
+            if (np.count_nonzero(sel) < 3):
+                return np.full((ygrid.size, xgrid.size), np.nan)
+            return griddata((self.xcol[sel], ycol[sel]), self.zcol[sel],
+                            (xgrid[None,:], ygrid[:,None]), method=method)
+        self.zzcrop = _regrid(self.ycol, y1, y2, self.xcrop, self.ycrop)
+        self.ezzcrop = _regrid(self.etcol, et1, et2, self.excrop, self.etcrop)
+        self.crop_roi = {'x1' : x1, 'y1' : y1, 'x2' : x2, 'y2' : y2,
+                         'xystep' : xystep,
+                         'xy' : None,
+                         'et' : None}
         return
 
+    def broaden(self, fwhm_x, fwhm_y, kernel='gaussian', et=False, **kws):
+        """2D broadening of the gridded plane with separable
+        (energy-dependent) kernels, see sloth.math.convolution2D
+
+        Parameters
+        ----------
+        fwhm_x, fwhm_y : float or array of size self.x/self.y
+                         (self.ex/self.et if et=True), full width half
+                         maximum of the kernel along each axis
+        kernel : 'gaussian' or 'lorentzian' (or a tuple for (x, y))
+        et : [False] broaden the energy transfer plane (self.ezz)
+             instead of self.zz
+        **kws : 'kwidth', 'nan' (see conv2d_ops() and conv2d())
+
+        Returns
+        -------
+        zconv : 2D array with the broadened plane
+
+        The convolution operators are cached, thus broadening again
+        the same grid with the same widths (e.g. after a new
+        normalization) costs only two matrix products.
+        """
+        kwidth = kws.get('kwidth', 1.5)
+        nan = kws.get('nan', 0.)
+        if et:
+            x, y, zz = self.ex, self.et, self.ezz
+        else:
+            x, y, zz = self.x, self.y, self.zz
+        # keyed on the grid values: the same sizes do not mean the same grid
+        key = (et, str(kernel), kwidth,
+               hashlib.sha1(np.asarray(x, dtype=float).tobytes()).hexdigest(),
+               hashlib.sha1(np.asarray(y, dtype=float).tobytes()).hexdigest(),
+               np.asarray(fwhm_x, dtype=float).tobytes(),
+               np.asarray(fwhm_y, dtype=float).tobytes())
+        if not key in self._conv_ops:
+            self._conv_ops[key] = conv2d_ops(x, y, fwhm_x, fwhm_y,
+                                             kernel=kernel, kwidth=kwidth)
+        kx, ky = self._conv_ops[key]
+        return conv2d(zz, kx, ky, nan=nan)
+
+    def _cuts(self, xgrid, ygrid, zz, pos, along, width):
+        """cuts at constant x (along='y') or y (along='x') positions"""
+        pos = np.asarray(pos, dtype=float)
+        if (along == 'y'):
+            step, grid = xgrid[1] - xgrid[0], ygrid
+        else:
+            step, grid = ygrid[1] - ygrid[0], xgrid
+        offs = _width_offsets(width, step)
+        # shape: (ncuts, noffsets, npoints)
+        cpos = pos.reshape(-1, 1, 1) + offs[None, :, None]
+        gpos = grid[None, None, :]
+        if (along == 'y'):
+            zq = _sample_plane(xgrid, ygrid, zz, cpos, gpos)
+        else:
+            zq = _sample_plane(xgrid, ygrid, zz, gpos, cpos)
+        zcut = np.mean(zq, axis=1)
+        if (pos.ndim == 0):
+            zcut = zcut[0]
+        return grid, zcut
+
+    def cut_cie(self, xcuts, width=0.):
+        """constant incident energy cut(s) from the gridded plane
+
+        Parameters
+        ----------
+        xcuts : float or array of floats, incident energies
+        width : float, [0.] integration width (the cut is averaged in
+                xcut +/- width/2)
+
+        Returns
+        -------
+        y, zcuts : 1D array of emitted energies and the cuts (1D
+                   array or 2D array of shape (len(xcuts), len(y)))
+
+        The cuts are read from self.zz by bilinear interpolation (NaN
+        outside the grid), all in one call, without re-gridding.
+        """
+        return self._cuts(self.x, self.y, self.zz, xcuts, 'y', width)
+
+    def cut_cee(self, ycuts, width=0.):
+        """constant emission energy cut(s) from the gridded plane,
+        returns x, zcuts (see cut_cie)"""
+        return self._cuts(self.x, self.y, self.zz, ycuts, 'x', width)
+
+    def cut_cet(self, etcuts, width=0.):
+        """constant energy transfer cut(s) from the energy transfer
+        plane, returns ex, zcuts (see cut_cie)"""
+        return self._cuts(self.ex, self.et, self.ezz, etcuts, 'x', width)
+
+    def cut_line(self, p0, p1, npts=None, width=0., et=False):
+        """line profile(s) between the points p0 and p1
+
+        Parameters
+        ----------
+        p0, p1 : (x, y) start/end points, or arrays of shape (ncuts, 2)
+        npts : int, [None] number of points (None: one per grid step)
+        width : float, [0.] integration width perpendicular to the line
+        et : [False] use the energy transfer plane (p0/p1 are (ex, et))
+
+        Returns
+        -------
+        dist, xq, yq, zcuts : distance from p0, coordinates of the
+                              points and the profiles, arrays of shape
+                              (npts,) or (ncuts, npts)
+        """
+        if et:
+            xgrid, ygrid, zz = self.ex, self.et, self.ezz
+        else:
+            xgrid, ygrid, zz = self.x, self.y, self.zz
+        p0 = np.asarray(p0, dtype=float)
+        p1 = np.asarray(p1, dtype=float)
+        single = (p0.ndim == 1) and (p1.ndim == 1)
+        p0, p1 = np.broadcast_arrays(np.atleast_2d(p0), np.atleast_2d(p1))
+        step = xgrid[1] - xgrid[0]
+        vect = p1 - p0
+        length = np.sqrt((vect**2).sum(axis=1))
+        if npts is None:
+            npts = int(np.ceil(length.max() / step)) + 1
+        tt = np.linspace(0., 1., npts)
+        xq = p0[:, 0, None] + vect[:, 0, None] * tt[None, :]
+        yq = p0[:, 1, None] + vect[:, 1, None] * tt[None, :]
+        dist = length[:, None] * tt[None, :]
+        # unit vector perpendicular to each line
+        with np.errstate(invalid='ignore', divide='ignore'):
+            perp = np.column_stack((-vect[:, 1], vect[:, 0])) / length[:, None]
+        perp = np.nan_to_num(perp)
+        offs = _width_offsets(width, step)
+        zq = _sample_plane(xgrid, ygrid, zz,
+                           xq[:, None, :] + offs[None, :, None] * perp[:, 0, None, None],
+                           yq[:, None, :] + offs[None, :, None] * perp[:, 1, None, None])
+        zcuts = np.mean(zq, axis=1)
+        if single:
+            return dist[0], xq[0], yq[0], zcuts[0]
+        return dist, xq, yq, zcuts
+
     def norm(self, zz):
         """normalization to max-min"""
         return zz/(np.nanmax(zz)-np.nanmin(zz))
@@ -13,6 +13,16 @@ TODO (Update: 2013-11-27)
      e.g. move in a separate method the line cuts
 - [] interactive cuts with mouse selection
 
+Large planes
+------------
+With kwsd['plot']['decimate'] (default), 1D-gridded planes are shown
+at screen resolution: each block of pixels is replaced by its min or
+max (whichever is farther from the block mean, thus peaks and dips
+survive) and the contour lines are computed on the block-averaged
+plane. Zooming refines only the visible region. Contour paths are
+cached per (plane, levels, region), up to kwsd['plot']['cont_cache']
+entries.
+
 """
 
 __author__ = "Mauro Rovezzi"
@@ -22,12 +32,78 @@ __organization__ = "European Synchrotron Radiation Facility"
 __year__ = "2011-2015"
 
 import sys, os, copy
+import warnings
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
 from matplotlib import cm
 from matplotlib.ticker import MaxNLocator, AutoLocator
+from matplotlib.collections import LineCollection
 import numpy as np
 
+HAS_CONTOURPY = False
+try:
+    import contourpy
+    HAS_CONTOURPY = True
+except ImportError:
+    pass
+
+def _blocks(arr, fy, fx):
+    """view of a 2D array as (ny, fy, nx, fx) blocks, padded with NaN"""
+    ny, nx = -(-arr.shape[0] // fy), -(-arr.shape[1] // fx)
+    if (ny*fy, nx*fx) != arr.shape:
+        _arr = np.empty((ny*fy, nx*fx))
+        _arr.fill(np.nan)
+        _arr[:arr.shape[0], :arr.shape[1]] = arr
+        arr = _arr
+    return arr.reshape(ny, fy, nx, fx)
+
+def decimate2d(zz, fy, fx, mode='minmax'):
+    """reduce a 2D array by (fy, fx) blocks
+
+    Parameters
+    ----------
+    zz : 2D array
+    fy, fx : int, block size along rows and columns
+    mode : str
+           'minmax' : block min or max, whichever is farther from the
+                      block mean (min/max preserving)
+           'mean' : block mean
+
+    Returns
+    -------
+    zzd : 2D array (ceil(ny/fy), ceil(nx/fx))
+    """
+    if (fy <= 1) and (fx <= 1):
+        return np.asarray(zz, dtype=float)
+    blk = _blocks(np.asarray(zz, dtype=float), fy, fx)
+    with warnings.catch_warnings():
+        # all-NaN blocks
+        warnings.simplefilter('ignore', RuntimeWarning)
+        bmean = np.nanmean(blk, axis=(1, 3))
+        if mode == 'mean':
+            return bmean
+        elif mode == 'minmax':
+            bmin = np.nanmin(blk, axis=(1, 3))
+            bmax = np.nanmax(blk, axis=(1, 3))
+            return np.where((bmax-bmean) >= (bmean-bmin), bmax, bmin)
+        else:
+            raise NameError('wrong decimation mode: {0}'.format(mode))
+
+def _decimate_grid(v, f):
+    """block centers of a 1D grid"""
+    if f <= 1:
+        return np.asarray(v, dtype=float)
+    return decimate2d(np.asarray(v, dtype=float)[None, :], 1, f, mode='mean')[0]
+
+def _contour_segments(x, y, zz, levels):
+    """contour lines of a plane as a list of (n, 2) arrays"""
+    zz = np.ma.masked_invalid(zz)
+    cg = contourpy.contour_generator(x, y, zz, line_type='Separate')
+    segs = []
+    for level in levels:
+        segs.extend(cg.lines(level))
+    return segs
+
 class RixsDataPlotter(object):
     """ plotter for a RixsData object """
     def __init__(self, rd):
@@ -37,6 +113,94 @@ class RixsDataPlotter(object):
             return
         self.kwsd = copy.deepcopy(rd.kwsd)
         self.rd = rd
+        self._cids = []
+        self.clear_cache()
+
+    def clear_cache(self):
+        """clear cached z limits and contour paths (e.g. if a plane
+        has been modified in place)"""
+        self._zlims = None
+        self._cont_cache = []
+
+    def _get_zlims(self, zz):
+        """nanmin/nanmax of zz, cached for the same plane object"""
+        if (self._zlims is not None) and (self._zlims[0] is zz):
+            return self._zlims[1:]
+        try:
+            zzmin, zzmax = np.nanmin(zz), np.nanmax(zz)
+        except:
+            zzmin, zzmax = np.min(zz), np.max(zz)
+        self._zlims = (zz, zzmin, zzmax)
+        return zzmin, zzmax
+
+    def _get_segments(self, key, zz, xd, yd, zzd, levels, maxsize):
+        """contour paths, cached by (plane, levels, region, decimation)"""
+        for _key, _zz, _segs in self._cont_cache:
+            if (_key == key) and (_zz is zz):
+                return _segs
+        segs = _contour_segments(xd, yd, zzd, levels)
+        if maxsize:
+            self._cont_cache.append((key, zz, segs))
+            del self._cont_cache[:-int(maxsize)]
+        return segs
+
+    def _get_view(self, force=False):
+        """decimated image and contours of the visible region (the
+        full plane if the limits are outside the data), None if the
+        region did not change (unless force)"""
+        v = self._view
+        x, y, zz = v['x'], v['y'], v['zz']
+        ax = self.plane
+        (xlo, xhi), (ylo, yhi) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+        j0 = max(np.searchsorted(x, xlo) - 1, 0)
+        j1 = min(np.searchsorted(x, xhi) + 1, x.size)
+        i0 = max(np.searchsorted(y, ylo) - 1, 0)
+        i1 = min(np.searchsorted(y, yhi) + 1, y.size)
+        if (j1 - j0 < 2) or (i1 - i0 < 2):
+            # empty view: full plane
+            j0, j1, i0, i1 = 0, x.size, 0, y.size
+        bbox = ax.get_window_extent()
+        fx = max(int(np.ceil((j1-j0) / max(bbox.width, 1.))), 1)
+        fy = max(int(np.ceil((i1-i0) / max(bbox.height, 1.))), 1)
+        roi = (i0, i1, j0, j1, fy, fx)
+        if (roi == v.get('roi')) and (not force):
+            return None
+        v['roi'] = roi
+        _zz = zz[i0:i1, j0:j1]
+        view = {'img' : decimate2d(_zz, fy, fx, mode='minmax'),
+                'extent' : (x[j0], x[j1-1], y[i0], y[i1-1]),
+                'segs' : None}
+        if v['lines'] and HAS_CONTOURPY:
+            xd, yd = _decimate_grid(x[j0:j1], fx), _decimate_grid(y[i0:i1], fy)
+            if (xd.size > 1) and (yd.size > 1):
+                key = (roi, v['levels'].tobytes())
+                view['segs'] = self._get_segments(key, zz, xd, yd,
+                                                  decimate2d(_zz, fy, fx, mode='mean'),
+                                                  v['levels'], v['cont_cache'])
+        return view
+
+    def _refine(self, ax=None):
+        """xlim/ylim callback: redo the visible region at screen resolution"""
+        view = self._get_view()
+        if view is None:
+            return
+        self.contf.set_data(view['img'])
+        self.contf.set_extent(view['extent'])
+        if (view['segs'] is not None) and isinstance(self.cont, LineCollection):
+            self.cont.set_segments(view['segs'])
+        self.fig.canvas.draw_idle()
+
+    def _disconnect(self):
+        """remove the zoom callbacks of the previous plot"""
+        for ax, cid in self._cids:
+            ax.callbacks.disconnect(cid)
+        self._cids = []
+
+    def set_cmap(self, cmap):
+        """change the colormap of the plane without recomputing it"""
+        self.kwsd['plot']['cmap'] = cmap
+        self.contf.set_cmap(cmap)
+        self.fig.canvas.draw_idle()
 
     def updatekwsd(self, kwsd):
         """ update plot parameters """
@@ -99,6 +263,9 @@ class RixsDataPlotter(object):
         cont_type = kws.get('cont_type', self.kwsd['plot']['cont_type'])
         cont_levels = kws.get('cont_levels', self.kwsd['plot']['cont_levels'])
         cont_lwidths = kws.get('cont_lwidths', self.kwsd['plot']['cont_lwidths'])
+        # keys missing in kwsd of old sessions
+        decimate = kws.get('decimate', self.kwsd['plot'].get('decimate', True))
+        cont_cache = kws.get('cont_cache', self.kwsd['plot'].get('cont_cache', 16))
 
         # NOTE: np.nanmin/np.nanmax fails with masked arrays! better
         #       to work with MaskedArray for zz
@@ -110,10 +277,7 @@ class RixsDataPlotter(object):
         #        manual check against 'nan' instead of the masked
         #        array solution
 
-        try:
-            zzmin, zzmax = np.nanmin(zz), np.nanmax(zz)
-        except:
-            zzmin, zzmax = np.min(zz), np.max(zz)
+        zzmin, zzmax = self._get_zlims(zz)
 
         if cbar_norm0:
             # normalize colors around 0
@@ -157,13 +321,35 @@ class RixsDataPlotter(object):
             self.plane.set_ylim(ymin, ymax)
 
         # contour mode: 'contf' or 'imshow'
-        if cont_imshow:
+        lines = ('line' in cont_type.lower())
+        self.cont = None
+        self._disconnect()
+        if cont_imshow and decimate and (_xyshape == 1):
+            # screen resolution, refined on zoom
+            self._view = {'x' : x, 'y' : y, 'zz' : zz,
+                          'levels' : levels,
+                          'lines' : lines,
+                          'cont_cache' : cont_cache}
+            if not (xmin and xmax):
+                self.plane.set_xlim(x.min(), x.max())
+            if not (ymin and ymax):
+                self.plane.set_ylim(y.min(), y.max())
+            view = self._get_view(force=True)
+            self.contf = self.plane.imshow(view['img'], origin='lower', extent=view['extent'],
+                                           cmap=cmap, norm=norm)
+            if lines and (view['segs'] is not None):
+                self.cont = LineCollection(view['segs'], colors='k', linewidths=cont_lwidths)
+                self.plane.add_collection(self.cont, autolim=False)
+                lines = False
+            self._cids = [(self.plane, self.plane.callbacks.connect(_evt, self._refine))
+                          for _evt in ('xlim_changed', 'ylim_changed')]
+        elif cont_imshow:
             self.contf = self.plane.imshow(zz, origin='lower', extent=extent, cmap=cmap, norm=norm)
         else:
             self.contf = self.plane.contourf(x, y, zz, levels, cmap=cm.get_cmap(cmap, len(levels)-1), norm=norm)
        
-        if 'line' in cont_type.lower():
-            self.cont = self.plane.contour(x, y, zz, levels, colors = 'k', hold='on', linewidths=cont_lwidths)
+        if lines:
+            self.cont = self.plane.contour(x, y, zz, levels, colors = 'k', linewidths=cont_lwidths)
         if x_nticks:
             self.plane.xaxis.set_major_locator(MaxNLocator(int(x_nticks)))
         else:
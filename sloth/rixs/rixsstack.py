@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Stack of RIXS planes on a shared grid (e.g. temperature or pressure
+series)
+
+The planes are stored in one contiguous 3D array, zzs[n, y, x], thus
+normalizations, difference maps, averages and integrated absolute
+differences (IAD) are computed for the whole stack at once. The array
+is a view of a buffer grown geometrically (amortized O(1) copies per
+appended plane).
+
+Usage
+-----
+>>> rs = RixsStack()
+>>> for fn in fnames:
+...     rs.append_lazy(fn, label=fn) # loaded only when needed
+>>> rs.norm('area')
+>>> iad = rs.iad(ref=0)
+
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+from .rixsdata import RixsData, _sample_plane
+from ..io.array_container import ArrayContainer
+
+class RixsStack(object):
+    """Stack of RIXS planes on a shared (x, y) grid"""
+
+    def __init__(self, x=None, y=None, label=None):
+        """
+        Parameters
+        ----------
+        x, y : 1D arrays, [None] shared grid; if None, it is taken
+               from the first plane
+        label : str, [None] label of the stack
+        """
+        if label is None:
+            label = 'rs{0}'.format(hex(id(self)))
+        self.label = label
+        self.x = x
+        self.y = y
+        self.labels = []
+        self._loaders = []
+        self._loaded = []
+        self._buf = None # (capacity, ny, nx), self._zzs = self._buf[:len(self)]
+        self._zzs = None
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def __getitem__(self, idx):
+        """plane(s) at idx (loaded if needed)"""
+        idxs = np.arange(len(self))[idx]
+        for i in np.atleast_1d(idxs):
+            self._load(i)
+        return self._zzs[idx]
+
+    def append(self, rd, label=None, et=False):
+        """append a plane
+
+        Parameters
+        ----------
+        rd : RixsData object or tuple (x, y, zz)
+        label : str, [None -> rd.label or number of the plane]
+        et : [False] take the energy transfer plane of RixsData
+        """
+        self._append(rd, label=label, et=et)
+        self._load(len(self)-1)
+
+    def append_lazy(self, loader, label=None, et=False):
+        """append a plane loaded only when needed
+
+        Parameters
+        ----------
+        loader : callable returning a RixsData object or a tuple (x, y,
+                 zz), or file name of a .npz/.h5 file containing 'x',
+                 'y', 'zz' arrays (e.g. written by RixsData.save(),
+                 then 'ex', 'et', 'ezz' if et=True)
+        """
+        self._append(loader, label=label, et=et)
+
+    def _append(self, src, label=None, et=False):
+        if label is None:
+            label = getattr(src, 'label', str(len(self)))
+        self.labels.append(label)
+        self._loaders.append((src, et))
+        self._loaded.append(False)
+        if self._buf is not None:
+            nplanes = len(self)
+            if nplanes > self._buf.shape[0]:
+                _buf = np.empty((2 * self._buf.shape[0], self.y.size, self.x.size))
+                _buf[:nplanes-1] = self._buf[:nplanes-1]
+                self._buf = _buf
+            self._zzs = self._buf[:nplanes]
+
+    def _get_plane(self, src, et):
+        """(x, y, zz) of a plane source"""
+        if isinstance(src, str):
+            names = ('ex', 'et', 'ezz') if et else ('x', 'y', 'zz')
+            with ArrayContainer(src) as dat:
+                return tuple(np.array(dat[name]) for name in names)
+        if callable(src):
+            src = src()
+        if isinstance(src, RixsData):
+            if et:
+                return src.ex, src.et, src.ezz
+            return src.x, src.y, src.zz
+        return src
+
+    def _load(self, idx):
+        """load the plane at idx on the shared grid"""
+        if self._loaded[idx]:
+            return
+        if (self.x is None) and (idx != 0):
+            # the shared grid is the one of the first plane
+            self._load(0)
+        src, et = self._loaders[idx]
+        x, y, zz = self._get_plane(src, et)
+        if self.x is None:
+            self.x, self.y = np.asarray(x), np.asarray(y)
+        if self._buf is None:
+            self._buf = np.empty((len(self), self.y.size, self.x.size))
+            self._zzs = self._buf
+        if (np.array_equal(x, self.x) and np.array_equal(y, self.y)):
+            self._zzs[idx] = zz
+        else:
+            # bilinear interpolation on the shared grid
+            self._zzs[idx] = _sample_plane(x, y, zz, self.x[None, :], self.y[:, None])
+        self._loaded[idx] = True
+
+    @property
+    def zzs(self):
+        """3D array (nplanes, ny, nx) with all the planes"""
+        for idx, loaded in enumerate(self._loaded):
+            if not loaded:
+                self._load(idx)
+        return self._zzs
+
+    def _area(self):
+        """area of a grid cell"""
+        return abs((self.x[1]-self.x[0]) * (self.y[1]-self.y[0]))
+
+    def norm(self, kind='max-min', inplace=True):
+        """normalize all the planes
+
+        Parameters
+        ----------
+        kind : str
+               'max-min' : zz/(max-min) (as RixsData.norm)
+               'max' : zz/max
+               'minmax' : (zz-min)/(max-min)
+               'area' : zz/integral
+        inplace : [True] normalize the stack itself, otherwise return
+                  the normalized planes
+
+        Returns
+        -------
+        zzs : normalized 3D array
+        """
+        zzs = self.zzs
+        zmax = np.nanmax(zzs, axis=(1, 2))[:, None, None]
+        zmin = np.nanmin(zzs, axis=(1, 2))[:, None, None]
+        if (kind == 'max-min'):
+            nzzs = zzs / (zmax - zmin)
+        elif (kind == 'max'):
+            nzzs = zzs / zmax
+        elif (kind == 'minmax'):
+            nzzs = (zzs - zmin) / (zmax - zmin)
+        elif (kind == 'area'):
+            nzzs = zzs / (np.nansum(zzs, axis=(1, 2))[:, None, None] * self._area())
+        else:
+            raise NameError("normalization '{0}' unknown".format(kind))
+        if inplace:
+            self._zzs[:] = nzzs
+            return self._zzs
+        return nzzs
+
+    def diff(self, ref=0):
+        """difference maps with respect to the plane at index 'ref'
+        (3D array)"""
+        zzs = self.zzs
+        return zzs - zzs[ref][None, :, :]
+
+    def average(self, weights=None):
+        """(weighted) average plane, NaNs are ignored"""
+        zzs = self.zzs
+        if weights is None:
+            weights = np.ones(len(self))
+        wgts = np.asarray(weights, dtype=float)[:, None, None] * np.isfinite(zzs)
+        with np.errstate(invalid='ignore'):
+            return np.nansum(zzs * wgts, axis=0) / wgts.sum(axis=0)
+
+    def iad(self, ref=0):
+        """integrated absolute difference (IAD) of each plane with
+        respect to the plane at index 'ref' (1D array)"""
+        return np.nansum(np.abs(self.diff(ref=ref)), axis=(1, 2)) * self._area()
+
+if __name__ == '__main__':
+    pass
@@ -9,9 +9,29 @@ logger = logging.getLogger(__name__)
 
 def suite():
     from . import test_version
+    from . import test_convolution1D
+    from . import test_gridxyz
+    from . import test_rixsdata
+    from . import test_rixsdata_plotter
+    from . import test_rixsstack
+    from . import test_dthetaxz
+    from . import test_rowland
+    from . import test_geometry3D
+    from . import test_reflections
+    from . import test_columnfile_reader
 
     test_suite = unittest.TestSuite()
     test_suite.addTest(test_version.suite())
+    test_suite.addTest(test_convolution1D.suite())
+    test_suite.addTest(test_gridxyz.suite())
+    test_suite.addTest(test_rixsdata.suite())
+    test_suite.addTest(test_rixsdata_plotter.suite())
+    test_suite.addTest(test_rixsstack.suite())
+    test_suite.addTest(test_dthetaxz.suite())
+    test_suite.addTest(test_rowland.suite())
+    test_suite.addTest(test_geometry3D.suite())
+    test_suite.addTest(test_reflections.suite())
+    test_suite.addTest(test_columnfile_reader.suite())
 
     return test_suite
 
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test the columns file reader"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from sloth.io import columnfile_reader
+from sloth.io.columnfile_reader import load_columns, _sidecar_name
+
+DATA = np.array([[1., 2., 3.], [4., 5., 6.5], [7., np.nan, -9E-3]])
+
+class TestColumnfileReader(unittest.TestCase):
+
+    def setUp(self):
+        self.wdir = tempfile.mkdtemp()
+        self.flags = (columnfile_reader.HAS_PANDAS, columnfile_reader.HAS_NPCREADER)
+
+    def tearDown(self):
+        columnfile_reader.HAS_PANDAS, columnfile_reader.HAS_NPCREADER = self.flags
+        shutil.rmtree(self.wdir)
+
+    def _write(self, name, text):
+        fname = os.path.join(self.wdir, name)
+        with open(fname, 'w') as f:
+            f.write(text)
+        return fname
+
+    def _backends(self):
+        """(HAS_PANDAS, HAS_NPCREADER) flags of the available backends"""
+        backends = [(False, False)]
+        if self.flags[1]:
+            backends.append((False, True))
+        if self.flags[0]:
+            backends.append((True, self.flags[1]))
+        return backends
+
+    def test_parse(self):
+        good = self._write('good.dat', '# e_in e_out signal\n1 2 3\n\n4 5 6.5\n# comment\n7 nan -9E-3\n')
+        ragged = self._write('ragged.dat', '1 2 3\n4 5\n6 7 8\n')
+        long = self._write('long.dat', '1 2 3\n4 5 6 7\n')
+        # same number of values as a 3x3 array
+        ragged2 = self._write('ragged2.dat', '1 2 3\n4 5\n6 7 8 9\n')
+        empty = self._write('empty.dat', '# e_in e_out signal\n')
+        for flags in self._backends():
+            columnfile_reader.HAS_PANDAS, columnfile_reader.HAS_NPCREADER = flags
+            dat = load_columns(good, cache=False)
+            self.assertEqual(dat.shape, (3, 3))
+            self.assertTrue(np.allclose(dat, DATA, equal_nan=True))
+            self.assertRaises(ValueError, load_columns, ragged, cache=False)
+            self.assertRaises(ValueError, load_columns, long, cache=False)
+            self.assertRaises(ValueError, load_columns, ragged2, cache=False)
+            dat = load_columns(empty)
+            self.assertEqual(dat.shape, (0, 0))
+            self.assertFalse(os.path.isfile(_sidecar_name(empty)))
+
+    def test_sidecar(self):
+        fname = self._write('data.dat', '1 2 3\n4 5 6.5\n7 nan -9E-3\n')
+        fcache = _sidecar_name(fname)
+        dat = load_columns(fname)
+        self.assertTrue(os.path.isfile(fcache))
+        self.assertEqual(os.path.getmtime(fcache), os.path.getmtime(fname))
+        self.assertTrue(isinstance(dat, np.memmap))
+        # reused: the sidecar is not parsed again
+        np.save(fcache, np.zeros((1, 3)))
+        os.utime(fcache, (os.path.getmtime(fname),) * 2)
+        self.assertTrue(np.all(load_columns(fname) == 0.))
+        self.assertTrue(np.allclose(load_columns(fname, cache=False), DATA, equal_nan=True))
+        # invalidated: new modification time of the ASCII file
+        self._write('data.dat', '1 2\n3 4\n')
+        mtime = os.path.getmtime(fcache) + 10.
+        os.utime(fname, (mtime, mtime))
+        dat = load_columns(fname)
+        self.assertTrue(np.allclose(dat, [[1., 2.], [3., 4.]]))
+        self.assertEqual(os.path.getmtime(fcache), mtime)
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestColumnfileReader))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test convolution1D"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from sloth.math.convolution1D import FdmnesConv, FdmnesConvRunner
+from sloth.math.convolution1D import conv_operator
+from sloth.math.convolution2D import conv2d_xyz
+
+# stand-in for the fdmnes executable: copies the calculation file to
+# the convolution output file, as declared in convfile.txt
+FAKE_FDMNES = """
+import sys
+with open('fdmfile.txt') as f:
+    assert 'convfile.txt' in f.read()
+with open('convfile.txt') as f:
+    lines = [line.strip() for line in f.readlines()]
+fn_in = lines[lines.index('Calculation') + 1]
+fn_out = lines[lines.index('Conv_out') + 1]
+if 'fail' in fn_in:
+    sys.exit(3)
+with open(fn_in) as fin, open(fn_out, 'w') as fout:
+    fout.write(fin.read())
+"""
+
+class TestFdmnesConvRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.exe = os.path.join(self.tmpdir, 'fake_fdmnes.py')
+        with open(self.exe, 'w') as f:
+            f.write(FAKE_FDMNES)
+        self.fns = []
+        for calc in ('calc1', 'calc2', 'calc_fail'):
+            fn = os.path.join(self.tmpdir, '{0}.txt'.format(calc))
+            with open(fn, 'w') as f:
+                f.write('{0}\n'.format(calc))
+            self.fns.append(fn)
+        self.outdir = os.path.join(self.tmpdir, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _run(self, nproc):
+        runner = FdmnesConvRunner(exe=[sys.executable, self.exe],
+                                  nproc=nproc, outdir=self.outdir)
+        for fn in self.fns:
+            runner.add(FdmnesConv(fn_in=fn))
+        cwd = os.listdir(os.getcwd())
+        results = runner.run(showInfos=False)
+        self.assertEqual(cwd, os.listdir(os.getcwd()))
+        return runner, results
+
+    def test_serial(self):
+        runner, results = self._run(1)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(runner.get_failed()), 1)
+        for res, calc in zip(results[:2], ('calc1', 'calc2')):
+            self.assertIsNone(res['error'])
+            self.assertEqual(os.path.basename(res['fn_out']),
+                             '{0}_conv.txt'.format(calc))
+            with open(res['fn_out']) as f:
+                self.assertEqual(f.read().strip(), calc)
+            self.assertIsNone(res['wdir'])
+        self.assertIsNone(results[2]['fn_out'])
+        self.assertEqual(results[2]['returncode'], 3)
+
+    def test_parallel(self):
+        runner, results = self._run(3)
+        self.assertEqual([res['error'] is None for res in results],
+                         [True, True, False])
+        self.assertEqual(sorted(os.listdir(self.outdir)),
+                         ['calc1_conv.txt', 'calc2_conv.txt'])
+
+    def test_same_name(self):
+        subdir = os.path.join(self.tmpdir, 'sub')
+        os.makedirs(subdir)
+        fn = os.path.join(subdir, 'calc1.txt')
+        shutil.copyfile(self.fns[0], fn)
+        runner = FdmnesConvRunner(exe=[sys.executable, self.exe],
+                                  nproc=1, outdir=self.outdir)
+        runner.add(self.fns[0])
+        self.assertRaises(ValueError, runner.add, fn)
+        self.assertRaises(ValueError, runner.add, FdmnesConv(fn_in=self.fns[0]))
+        self.assertEqual(len(runner.jobs), 1)
+
+class TestConvOperator(unittest.TestCase):
+
+    def test_normalized(self):
+        e = np.linspace(0, 50, 501)
+        for kernel in ('gaussian', 'lorentzian'):
+            kop = conv_operator(e, np.linspace(0., 3., e.size), kernel=kernel)
+            self.assertTrue(np.allclose(kop.sum(axis=1), 1.))
+            # zero width is the identity
+            self.assertEqual(kop[0, 0], 1.)
+
+    def test_conv2d_rows_columns(self):
+        x = np.linspace(0, 10, 80)
+        y = np.linspace(0, 5, 60)
+        zz = np.random.rand(y.size, x.size)
+        fwhm_y = np.linspace(0.1, 0.3, y.size)
+        zconv = conv2d_xyz(x, y, zz, 0.2, fwhm_y)
+        kx, ky = conv_operator(x, 0.2), conv_operator(y, fwhm_y)
+        zrows = np.array([kx.dot(row) for row in zz])
+        zloop = np.array([ky.dot(col) for col in zrows.T]).T
+        self.assertTrue(np.allclose(zconv, zloop))
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestConvOperator))
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestFdmnesConvRunner))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test dthetaxz"""
+
+import os
+import math
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import numpy.ma as ma
+
+from sloth.inst.dthetaxz import dThetaXZ, dThetaXZs, getDthetaDats, getDthetaDatsAnalytic
+from sloth.inst.dthetaxz import getMeshMasked, MeshSpans
+from sloth.inst.dthetaxz_sweep import DthetaxzSweep
+
+CASES = ['Jn', 'Js', 'SphJn', 'SphJs', 'TorJs', 'Js45focus', 'JsFocus',
+         'Berreman', 'JnFocus']
+ANGLES = [15., 35., 55., 75.]
+
+def _circ_mesh(rc=0.1, nsteps=201):
+    x0 = np.linspace(-rc, rc, nsteps)
+    xx, zz = np.meshgrid(x0, x0)
+    mask = (xx**2 + zz**2 >= rc**2)
+    return ma.array(xx, mask=mask), ma.array(zz, mask=mask)
+
+class TestDthetaxz(unittest.TestCase):
+
+    def setUp(self):
+        self.mxx, self.mzz = _circ_mesh()
+
+    def test_batch(self):
+        x, z = self.mxx.data, self.mzz.data
+        dth = dThetaXZs(x, z, ANGLES, CASES)
+        self.assertEqual(dth.shape, (len(CASES), len(ANGLES)) + x.shape)
+        for ic, cs in enumerate(CASES):
+            for ith, th in enumerate(ANGLES):
+                self.assertTrue(np.allclose(dth[ic, ith], dThetaXZ(x, z, th, case=cs)))
+        self.assertRaises(NameError, dThetaXZ, x, z, 45., 'unknown')
+
+    def test_dats(self):
+        wrc = 1.25E-4
+        dd = getDthetaDats(self.mxx, self.mzz, wrc=wrc, cases=CASES,
+                           angles=ANGLES, chunk=1000)
+        cell = (self.mxx.data[0][1]-self.mxx.data[0][0])**2
+        for cs in CASES:
+            for ith, th in enumerate(ANGLES):
+                dth = dThetaXZ(self.mxx, self.mzz, th, case=cs)
+                sa = np.sum(np.abs(dth) <= wrc)*cell/math.sin(np.deg2rad(th))
+                self.assertAlmostEqual(dd[cs]['sa'][ith], sa)
+
+    def test_spans(self):
+        for mask in ('circular', 'rectangular'):
+            mxx, mzz = getMeshMasked(mask=mask, r1p=500., cryst_x=50.,
+                                     cryst_z=12.5, csteps=201j)
+            ms = MeshSpans(mask=mask, r1p=500., cryst_x=50., cryst_z=12.5,
+                           csteps=201j)
+            self.assertEqual(ms.npoints, mxx.count())
+            dd = getDthetaDats(mxx, mzz, cases=CASES, angles=ANGLES)
+            ds = getDthetaDats(ms, None, cases=CASES, angles=ANGLES, chunk=999)
+            for cs in CASES:
+                self.assertTrue(np.allclose(dd[cs]['sa'], ds[cs]['sa']))
+                self.assertTrue(np.allclose(dd[cs]['eres'], ds[cs]['eres']))
+
+    def test_analytic(self):
+        mxx, mzz = _circ_mesh(nsteps=1001)
+        dd = getDthetaDats(mxx, mzz, cases=CASES, angles=ANGLES)
+        da = getDthetaDatsAnalytic(mask='circular', r1p=500., cryst_x=50.,
+                                   cases=CASES, angles=ANGLES)
+        for cs in CASES:
+            self.assertTrue(np.allclose(da[cs]['sa'], dd[cs]['sa'], rtol=5E-3))
+            self.assertTrue(np.allclose(da[cs]['eres'], dd[cs]['eres'], rtol=2E-2))
+            self.assertTrue(np.all(np.array(da[cs]['sa_err']) < 1E-6))
+
+    def test_sweep(self):
+        wdir = tempfile.mkdtemp()
+        try:
+            sw = DthetaxzSweep(os.path.join(wdir, 'sweep.dat'), nproc=1)
+            grid = {'mask' : ['circular'], 'r1p' : [500.], 'csteps' : [201],
+                    'case' : CASES[:2], 'angle' : ANGLES[:2]}
+            self.assertEqual(sw.run(grid, showInfos=False), 4)
+            grid['angle'] = ANGLES
+            self.assertEqual(sw.run(grid, showInfos=False), 4)
+            res = sw.load()
+            self.assertEqual(res['sa'].size, 8)
+            dd = getDthetaDats(self.mxx, self.mzz, cases=[1], angles=ANGLES)
+            sel = (res['case'] == 1)
+            self.assertTrue(np.allclose(np.sort(res['sa'][sel]), np.sort(dd[1]['sa'])))
+            # interrupted while writing: truncated last line
+            with open(sw.fname, 'r') as f:
+                lines = f.readlines()
+            # cut after the first value, before the last one and in the
+            # middle of the last number (still a valid float)
+            for last in (lines[-1][:20], lines[-1].rsplit(None, 1)[0],
+                         lines[-1][:-6]):
+                with open(sw.fname, 'w') as f:
+                    f.write(''.join(lines[:-1]) + last)
+                self.assertEqual(sw.load()['sa'].size, 7)
+                self.assertEqual(len(sw.done()), 7)
+                self.assertEqual(sw.run(grid, showInfos=False), 1)
+                res = sw.load()
+                self.assertEqual(res['sa'].size, 8)
+                with open(sw.fname, 'r') as f:
+                    self.assertEqual(f.readlines(), lines)
+                sel = (res['case'] == 1)
+                self.assertTrue(np.allclose(np.sort(res['sa'][sel]), np.sort(dd[1]['sa'])))
+        finally:
+            shutil.rmtree(wdir)
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestDthetaxz))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
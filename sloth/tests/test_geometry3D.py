@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test geometry3D"""
+
+import unittest
+import numpy as np
+
+from sloth.math.geometry3D import (circle_3p, plane_3p, angle_3p,
+                                   point_on_plane_projection, point_plane_distance,
+                                   fit_plane, fit_circle)
+from sloth.math.rotmatrix import rotate_points
+
+def _arc(npts=30, R=1000., cen=(3., -2., 5.), noise=0.):
+    t = np.linspace(0.1, 0.6, npts)
+    pts = np.column_stack((R*np.cos(t), R*np.sin(t), np.zeros_like(t)))
+    pts = rotate_points(pts, [1., 2., 3.], 0.7) + np.array(cen)
+    if noise > 0:
+        pts += np.random.RandomState(0).normal(scale=noise, size=pts.shape)
+    return pts
+
+class TestGeometry3D(unittest.TestCase):
+
+    def test_batch(self):
+        pts = np.random.RandomState(1).normal(size=(10, 4, 3))
+        A, B, C, D = [pts[:, i] for i in range(4)]
+        R, P = circle_3p(A, B, C)
+        planes = plane_3p(A, B, C)
+        angs = angle_3p(A, B, C)
+        proj = point_on_plane_projection(D, planes, test=True)
+        self.assertEqual(R.shape, (10,))
+        self.assertEqual(proj.shape, (10, 3))
+        for i in range(10):
+            _R, _P = circle_3p(A[i], B[i], C[i])
+            self.assertAlmostEqual(R[i], _R)
+            self.assertTrue(np.allclose(P[i], _P))
+            self.assertTrue(np.allclose(planes[i], plane_3p(A[i], B[i], C[i])))
+            self.assertAlmostEqual(angs[i], angle_3p(A[i], B[i], C[i]))
+            self.assertTrue(np.allclose(proj[i], point_on_plane_projection(D[i], planes[i])))
+        self.assertTrue(np.allclose(point_plane_distance(proj, planes), 0.))
+
+    def test_fit(self):
+        pts = _arc()
+        R, P = fit_circle(pts)
+        _R, _P = circle_3p(pts[0], pts[15], pts[-1])
+        self.assertAlmostEqual(R, 1000.)
+        self.assertAlmostEqual(R, _R)
+        self.assertTrue(np.allclose(P, _P))
+        plane, dists = fit_plane(pts, retAll=True)
+        self.assertTrue(np.allclose(dists, 0.))
+        R, P, plane, res = fit_circle(_arc(noise=0.05), retAll=True)
+        self.assertTrue(abs(R - 1000.) < 10.)
+        self.assertTrue(np.std(res) < 0.1)
+        self.assertRaises(NameError, fit_plane, pts[:2])
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestGeometry3D))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test gridxyz"""
+
+import unittest
+import numpy as np
+
+from sloth.math.gridxyz import gridxyz, gridxyz_scans, gridxyz_tiled, TriCache
+
+def _plane(x, y):
+    return 2. * x + 3. * y + 1.
+
+class TestGridxyz(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.xcol = rng.uniform(0., 10., 20000)
+        self.ycol = rng.uniform(0., 5., 20000)
+        self.zcol = _plane(self.xcol, self.ycol)
+
+    def _check(self, lib, method, atol, **kws):
+        x, y, zz = gridxyz(self.xcol, self.ycol, self.zcol, xystep=0.25,
+                           lib=lib, method=method, **kws)
+        self.assertEqual(zz.shape, (y.size, x.size))
+        ref = _plane(x[None, :], y[:, None])
+        good = np.isfinite(zz)
+        self.assertTrue(good.mean() > 0.8)
+        self.assertTrue(np.allclose(zz[good], ref[good], atol=atol))
+        return x, y, zz
+
+    def test_scipy(self):
+        self._check('scipy', 'linear', 1e-6)
+
+    def test_binning(self):
+        self._check('binning', None, 0.6)
+
+    def test_binning_nan(self):
+        x0, y0, zz0 = gridxyz(self.xcol, self.ycol, self.zcol, xystep=0.25, lib='binning')
+        xcol, ycol, zcol = self.xcol.copy(), self.ycol.copy(), self.zcol.copy()
+        nans = np.zeros(xcol.size, dtype=bool)
+        nans[[3, 100, 5000]] = True
+        xcol[3], ycol[100], zcol[5000] = np.nan, np.nan, np.nan
+        x, y, zz = gridxyz(xcol, ycol, zcol, xystep=0.25, lib='binning')
+        ref = gridxyz(self.xcol[~nans], self.ycol[~nans], self.zcol[~nans],
+                      xystep=0.25, lib='binning')[2]
+        self.assertTrue(np.all(np.isfinite(x)) and np.all(np.isfinite(y)))
+        self.assertEqual(zz.shape, zz0.shape)
+        self.assertTrue(np.allclose(zz, ref, equal_nan=True))
+        self.assertRaises(ValueError, gridxyz, xcol, ycol, zcol, xystep=0.25, lib='unknown')
+
+    def test_kdtree(self):
+        self._check('kdtree', 'idw', 0.5, knn=6)
+        self._check('kdtree', 'nearest', 0.5)
+
+    def test_kdtree_radius(self):
+        xcol = np.array([0., 1., 5.])
+        ycol = np.array([0., 1., 5.])
+        zcol = np.array([1., 2., 3.])
+        x, y, zz = gridxyz(xcol, ycol, zcol, xystep=1., lib='kdtree',
+                           method='idw', knn=2, radius=0.1)
+        self.assertEqual(zz[0, 0], 1.)
+        self.assertEqual(zz[-1, -1], 3.)
+        self.assertTrue(np.isnan(zz[0, -1]))
+
+    def test_tricache(self):
+        tc = TriCache(maxsize=1)
+        for method in ('linear', 'cubic'):
+            x, y, zz0 = gridxyz(self.xcol, self.ycol, self.zcol, xystep=0.25,
+                                method=method)
+            x, y, zz1 = gridxyz(self.xcol, self.ycol, self.zcol, xystep=0.25,
+                                method=method, tricache=tc)
+            x, y, zz2 = gridxyz(self.xcol, self.ycol, 2*self.zcol, xystep=0.25,
+                                method=method, tricache=tc)
+            self.assertTrue(np.allclose(zz0, zz1, equal_nan=True))
+            self.assertTrue(np.allclose(2*zz0, zz2, equal_nan=True))
+        self.assertEqual(len(tc._tris), 1)
+
+    def test_scans(self):
+        ypos = np.arange(0., 5., 0.2)
+        xcol = np.concatenate([np.linspace(0., 10., 101) for _ in ypos])
+        ycol = np.repeat(ypos, 101)
+        zcol = _plane(xcol, ycol)
+        x, y, zz, et, ezz = gridxyz_scans(xcol, ycol, zcol, xystep=0.25, et=True)
+        self.assertTrue(np.allclose(zz, _plane(x[None, :], y[:, None])))
+        good = np.isfinite(ezz)
+        ref = _plane(x[None, :], x[None, :] - et[:, None])
+        self.assertTrue(np.allclose(ezz[good], ref[good]))
+        # scans along y (at constant x) give the transposed map
+        y2, x2, zz2 = gridxyz_scans(ycol, xcol, zcol, xystep=0.25)
+        self.assertTrue(np.allclose(zz2, zz.T))
+
+    def test_tiled(self):
+        x, y, zz = gridxyz(self.xcol, self.ycol, self.zcol, xystep=0.1,
+                           method='linear')
+        xt, yt, zzt = gridxyz_tiled(self.xcol, self.ycol, self.zcol,
+                                    xystep=0.1, method='linear', tile=16)
+        self.assertTrue(np.allclose(zz, zzt, equal_nan=True))
+        xt, yt, zzp = gridxyz_tiled(self.xcol, self.ycol, self.zcol,
+                                    xystep=0.1, method='linear', tile=16, nproc=2)
+        self.assertTrue(np.allclose(zz, zzp, equal_nan=True))
+        xt, yt, zzk = gridxyz_tiled(self.xcol, self.ycol, self.zcol, xystep=0.1,
+                                    lib='kdtree', method='idw', tile=16, nproc=2)
+        self.assertTrue(np.all(np.isfinite(zzk)))
+
+    def test_tiled_errors(self):
+        for lib, method in (('scipy', 'nn'), ('scans', 'linear'),
+                            ('matplotlib', 'nn'), ('kdtree', 'cubic')):
+            self.assertRaises(NameError, gridxyz_tiled, self.xcol, self.ycol,
+                              self.zcol, xystep=0.1, lib=lib, method=method)
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestGridxyz))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
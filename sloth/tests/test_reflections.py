@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test reflections catalogues"""
+
+import os
+import shutil
+import tempfile
+import itertools
+import pickle
+import unittest
+import numpy as np
+
+from sloth.utils.bragg import bragg_th, d_cubic, SI_ALAT, HKL_MAX
+from sloth.utils.bragg import d_hexagonal, d_monoclinic, d_triclinic, d_metric
+from sloth.utils.reflections import (get_catalogue, find_reflections,
+                                     sf_flags, SF_ALLOWED, SF_WEAK, SF_FORBIDDEN)
+from sloth.io import crystals_reader
+from sloth.io.crystals_reader import CRYSTALS_DAT, load_crystals, get_crystal
+
+class TestReflections(unittest.TestCase):
+
+    def test_query(self):
+        enes = [8040., 8905., 9572.]
+        tab = find_reflections(enes, thetamin=65., crystals='Si', sfmin=SF_ALLOWED)
+        for ene in enes:
+            ref = []
+            for hkl in itertools.combinations_with_replacement(range(HKL_MAX), 3):
+                if (sum(hkl) == 0) or (sf_flags([hkl], 'diamond')[0] < SF_ALLOWED):
+                    continue
+                th = bragg_th(d_cubic(SI_ALAT, hkl), ene)
+                if th >= 65.:
+                    ref.append(th)
+            sel = (tab['energy'] == ene)
+            self.assertTrue(np.allclose(np.sort(tab['theta'][sel]), np.sort(ref)))
+            self.assertTrue(np.all(np.diff(tab['theta'][tab['energy'] == ene]) <= 0))
+
+    def test_dspacing(self):
+        hkl = np.random.RandomState(0).randint(-6, 7, size=(100, 3))
+        hkl[0] = 0
+        for dfun, args, cell in ((d_cubic, (5.43,), (5.43, 5.43, 5.43, 90., 90., 90.)),
+                                 (d_hexagonal, (4.9, 5.4), (4.9, 4.9, 5.4, 90., 90., 120.)),
+                                 (d_monoclinic, (4., 5., 6., 100.), (4., 5., 6., 90., 100., 90.)),
+                                 (d_triclinic, (4., 5., 6., 80., 100., 110.), (4., 5., 6., 80., 100., 110.))):
+            ds = dfun(*args, hkl=hkl)
+            self.assertEqual(ds.shape, (100,))
+            self.assertEqual(ds[0], 0.)
+            self.assertTrue(np.allclose(ds, d_metric(*cell, hkl=hkl)))
+            self.assertAlmostEqual(ds[1], dfun(*args, hkl=tuple(hkl[1])))
+
+    def test_flags(self):
+        flags = sf_flags([(1, 1, 1), (2, 0, 0), (2, 2, 0), (2, 1, 0)], 'zincblende')
+        self.assertEqual(list(flags), [SF_ALLOWED, SF_WEAK, SF_ALLOWED, SF_FORBIDDEN])
+        self.assertTrue(get_catalogue('Ge') is get_catalogue('Ge'))
+        self.assertRaises(NameError, get_catalogue, 'unknown')
+
+    def test_sio2(self):
+        cat = get_catalogue('SiO2')
+        flags = dict((tuple(hkl), sf) for hkl, sf in zip(cat.hkl, cat.sf))
+        self.assertEqual(flags[(0, 0, 1)], SF_FORBIDDEN)
+        self.assertEqual(flags[(0, 0, 2)], SF_FORBIDDEN)
+        self.assertEqual(flags[(0, 0, 3)], SF_ALLOWED)
+        tab = find_reflections([2000., 4000., 6000.], thetamin=20., crystals='SiO2')
+        hkls = set(zip(tab['h'], tab['k'], tab['l']))
+        self.assertFalse((0, 0, 1) in hkls)
+        self.assertFalse((0, 0, 2) in hkls)
+        self.assertTrue((0, 0, 3) in hkls)
+        # no cache file written next to the packaged crystals file
+        self.assertFalse(os.path.isfile(CRYSTALS_DAT + '.pkl'))
+
+    def test_crystals_dat(self):
+        wdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(wdir, 'crystals.dat')
+            shutil.copy(CRYSTALS_DAT, fname)
+            index = load_crystals(fname)
+            self.assertTrue(os.path.isfile(fname + '.pkl'))
+            self.assertTrue(load_crystals(fname) is index)
+            si = get_crystal('si', fname=fname)
+            self.assertEqual(si['system'], 'cubic')
+            self.assertEqual(si['atoms'].size, 8)
+            self.assertEqual(get_crystal('AlphaQuartz', fname=fname)['cell'][5], 120.)
+            self.assertRaises(NameError, get_crystal, 'unknown', fname=fname)
+            # from the sidecar file (as in a new session)
+            crystals_reader._INDEX.pop(fname)
+            index2 = load_crystals(fname)
+            self.assertFalse(index2 is index)
+            self.assertEqual(sorted(index2.keys()), sorted(index.keys()))
+            # a foreign pickle with the same modification time is ignored
+            mtime = os.path.getmtime(fname)
+            with open(fname + '.pkl', 'wb') as f:
+                pickle.dump({'Si' : None}, f)
+            os.utime(fname + '.pkl', (mtime, mtime))
+            crystals_reader._INDEX.pop(fname)
+            self.assertEqual(get_crystal('Si', fname=fname)['atoms'].size, 8)
+            # changes are read only if reloaded
+            with open(fname, 'r') as f:
+                text = f.read()
+            with open(fname, 'w') as f:
+                f.write(text.replace('#EOF', '#S 999 NewCrystal\n#UCELL 1 2 3 90 90 90\n'
+                                     '14 1. 0. 0. 0.\n#EOF'))
+            os.utime(fname, (mtime + 10., mtime + 10.))
+            self.assertRaises(NameError, get_crystal, 'NewCrystal', fname=fname)
+            self.assertTrue('NewCrystal' in load_crystals(fname, reload=True))
+            self.assertEqual(get_crystal('newcrystal', fname=fname)['cell'][2], 3.)
+        finally:
+            shutil.rmtree(wdir)
+        # flags from the atoms of the diamond structure
+        cat = get_catalogue('Si_NIST', hkl_max=12)
+        self.assertTrue(np.array_equal(cat.sf, sf_flags(cat.hkl, 'diamond')))
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestReflections))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
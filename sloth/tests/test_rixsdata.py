@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test RixsData sessions"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from sloth.rixs.rixsdata import RixsData
+from sloth.rixs.rixsstack import RixsStack
+
+class TestRixsDataSession(unittest.TestCase):
+
+    def setUp(self):
+        self.wdir = tempfile.mkdtemp()
+        rd = RixsData(label='test')
+        rd.x = np.linspace(0., 1., 11)
+        rd.y = np.linspace(0., 2., 21)
+        rd.zz = rd.x[None, :] * rd.y[:, None]
+        rd.kwsd['grid']['xystep'] = 0.1
+        self.rd = rd
+
+    def tearDown(self):
+        shutil.rmtree(self.wdir)
+
+    def _check(self, fname, compress):
+        fname = os.path.join(self.wdir, fname)
+        self.rd.save(fname, compress=compress)
+        rd = RixsData()
+        rd.load(fname)
+        self.assertEqual(rd.label, 'test')
+        self.assertEqual(rd.kwsd['grid']['xystep'], 0.1)
+        self.assertEqual(rd.kwsd['plot']['cmap'].name,
+                         self.rd.kwsd['plot']['cmap'].name)
+        self.assertEqual(isinstance(rd.zz, np.memmap), not compress)
+        self.assertTrue(np.allclose(rd.zz, self.rd.zz))
+        self.assertRaises(AttributeError, getattr, rd, 'ezz')
+        return fname
+
+    def test_npz(self):
+        self._check('session.npz', True)
+        fname = self._check('session_mmap.npz', False)
+        # reload: previous session closed, caches reset
+        rd = RixsData()
+        rd.load(fname)
+        session = rd._session
+        rd.broaden(0.1, 0.2)
+        rd.tricache.get_tri(np.random.rand(10), np.random.rand(10))
+        rd.load(fname)
+        self.assertTrue(session._npz.zip is None)
+        self.assertFalse(rd._session is session)
+        self.assertEqual(len(rd._conv_ops), 0)
+        self.assertEqual(len(rd.tricache._tris), 0)
+        self.assertTrue(np.allclose(rd.zz, self.rd.zz))
+        rs = RixsStack()
+        rs.append_lazy(fname)
+        self.assertTrue(np.allclose(rs[0], self.rd.zz))
+
+class TestRixsDataBroaden(unittest.TestCase):
+
+    def setUp(self):
+        rd = RixsData()
+        rd.x = np.linspace(0., 10., 51)
+        rd.y = np.linspace(0., 20., 41)
+        rd.zz = np.zeros((rd.y.size, rd.x.size))
+        rd.zz[20, 25] = 1.
+        self.rd = rd
+
+    def test_grid_change(self):
+        rd = self.rd
+        z1 = rd.broaden(1., 2.)
+        self.assertTrue(np.allclose(rd.broaden(1., 2.), z1))
+        self.assertEqual(len(rd._conv_ops), 1)
+        # same sizes, different steps: new operators
+        rd.x = np.linspace(0., 5., 51)
+        rd.y = np.linspace(0., 10., 41)
+        z2 = rd.broaden(1., 2.)
+        self.assertEqual(len(rd._conv_ops), 2)
+        ref = RixsData()
+        ref.x, ref.y, ref.zz = rd.x, rd.y, rd.zz
+        self.assertTrue(np.allclose(z2, ref.broaden(1., 2.)))
+        self.assertFalse(np.allclose(z1, z2))
+
+def _plane(x, y):
+    """analytic plane z = a*x + b*y"""
+    return 2. * x + 3. * y
+
+class TestRixsDataCuts(unittest.TestCase):
+
+    def setUp(self):
+        rd = RixsData()
+        rd.x = np.linspace(7000.1, 7010.3, 35)
+        rd.y = np.linspace(6400., 6405.7, 58)
+        rd.zz = _plane(rd.x[None, :], rd.y[:, None])
+        rd.ex = rd.x
+        rd.et = np.linspace(594.4, 610.3, 54)
+        rd.ezz = _plane(rd.ex[None, :], rd.et[:, None])
+        self.rd = rd
+
+    def test_cuts(self):
+        rd = self.rd
+        # edge and inner points, bilinear interpolation is exact
+        xcuts = [rd.x[0], 7005.05, rd.x[-1]]
+        y, zcuts = rd.cut_cie(xcuts)
+        self.assertTrue(np.array_equal(y, rd.y))
+        self.assertEqual(zcuts.shape, (3, rd.y.size))
+        self.assertTrue(np.allclose(zcuts, _plane(np.array(xcuts)[:, None], y[None, :])))
+        ycuts = [rd.y[0], 6402.22, rd.y[-1]]
+        x, zcuts = rd.cut_cee(ycuts)
+        self.assertTrue(np.allclose(zcuts, _plane(x[None, :], np.array(ycuts)[:, None])))
+        x, zcut = rd.cut_cet(rd.et[-1])
+        self.assertEqual(zcut.shape, rd.ex.shape)
+        self.assertTrue(np.allclose(zcut, _plane(x, rd.et[-1])))
+        # the average over a symmetric width of a plane is the central value
+        y, zcut = rd.cut_cie(7005.05, width=1.)
+        self.assertTrue(np.allclose(zcut, _plane(7005.05, y)))
+        # outside the grid
+        y, zcut = rd.cut_cie(rd.x[-1] + 1.)
+        self.assertTrue(np.all(np.isnan(zcut)))
+
+    def test_cut_line(self):
+        rd = self.rd
+        p0, p1 = (rd.x[0], rd.y[0]), (rd.x[-1], rd.y[-1])
+        dist, xq, yq, zcut = rd.cut_line(p0, p1)
+        self.assertTrue(np.allclose((xq[0], yq[0]), p0))
+        self.assertTrue(np.allclose((xq[-1], yq[-1]), p1))
+        self.assertTrue(np.isclose(dist[-1], np.hypot(p1[0]-p0[0], p1[1]-p0[1])))
+        self.assertTrue(np.allclose(zcut, _plane(xq, yq)))
+        # many lines at once, with a width
+        p0 = [(7001., 6401.), (7002., 6404.)]
+        p1 = [(7009., 6405.), (7008., 6401.)]
+        dist, xq, yq, zcuts = rd.cut_line(p0, p1, npts=20, width=0.5)
+        self.assertEqual(zcuts.shape, (2, 20))
+        self.assertTrue(np.allclose(zcuts, _plane(xq, yq)))
+        dist, xq, yq, zcut = rd.cut_line((6990., 6402.), (6995., 6402.), npts=5)
+        self.assertTrue(np.all(np.isnan(zcut)))
+
+class TestRixsDataCrop(unittest.TestCase):
+
+    def setUp(self):
+        rd = RixsData()
+        rd.x = np.linspace(7000., 7010., 101)
+        rd.y = np.linspace(6400., 6406., 61)
+        rd.zz = _plane(rd.x[None, :], rd.y[:, None])
+        rd.ex = rd.x
+        rd.et = np.linspace(594., 610., 161)
+        rd.ezz = _plane(rd.ex[None, :], rd.et[:, None])
+        # (x, y, z) columns on the same grid
+        xx, yy = np.meshgrid(rd.x, rd.y)
+        rd.xcol, rd.ycol = xx.ravel(), yy.ravel()
+        rd.zcol = _plane(rd.xcol, rd.ycol)
+        rd.etcol = rd.xcol - rd.ycol
+        self.rd = rd
+
+    def test_view(self):
+        rd = self.rd
+        rd.crop(7002.05, 6401., 7004., 6403.55)
+        self.assertTrue(np.shares_memory(rd.zzcrop, rd.zz))
+        self.assertTrue(np.shares_memory(rd.ezzcrop, rd.ezz))
+        self.assertTrue(np.allclose(rd.xcrop[[0, -1]], [7002.1, 7004.]))
+        self.assertTrue(np.allclose(rd.ycrop[[0, -1]], [6401., 6403.5]))
+        self.assertTrue(np.allclose(rd.etcrop[[0, -1]], [600.5, 601.]))
+        self.assertEqual(rd.zzcrop.shape, (rd.ycrop.size, rd.xcrop.size))
+        self.assertEqual(rd.ezzcrop.shape, (rd.etcrop.size, rd.excrop.size))
+        self.assertTrue(np.allclose(rd.zzcrop, _plane(rd.xcrop[None, :], rd.ycrop[:, None])))
+        iys, ixs = rd.crop_roi['xy']
+        self.assertTrue(np.array_equal(rd.x[ixs], rd.xcrop))
+        # the same step is not a re-gridding
+        rd.crop(7004., 6403.55, 7002.05, 6401., xystep=0.1)
+        self.assertTrue(np.shares_memory(rd.zzcrop, rd.zz))
+        self.assertTrue(np.allclose(rd.xcrop[[0, -1]], [7002.1, 7004.]))
+
+    def test_regrid(self):
+        rd = self.rd
+        rd.crop(7002., 6401., 7004., 6403., xystep=0.02)
+        self.assertFalse(np.shares_memory(rd.zzcrop, rd.zz))
+        self.assertTrue(rd.crop_roi['xy'] is None)
+        self.assertEqual(rd.crop_roi['xystep'], 0.02)
+        self.assertTrue(np.allclose(np.diff(rd.xcrop), 0.02))
+        self.assertTrue(np.allclose(np.diff(rd.ycrop), 0.02))
+        self.assertTrue(np.isclose(rd.xcrop[0], 7002.))
+        self.assertTrue(rd.xcrop[-1] < 7004.)
+        self.assertEqual(rd.zzcrop.shape, (rd.ycrop.size, rd.xcrop.size))
+        self.assertTrue(np.allclose(rd.zzcrop, _plane(rd.xcrop[None, :], rd.ycrop[:, None])))
+        self.assertEqual(rd.ezzcrop.shape, (rd.etcrop.size, rd.excrop.size))
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRixsDataSession))
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRixsDataBroaden))
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRixsDataCuts))
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRixsDataCrop))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test RixsDataPlotter"""
+
+import unittest
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from sloth.rixs.rixsdata import RixsData
+from sloth.rixs.rixsdata_plotter import (RixsDataPlotter, decimate2d,
+                                         HAS_CONTOURPY)
+
+class TestRixsDataPlotter(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.linspace(0., 10., 501)
+        self.y = np.linspace(0., 5., 301)
+        self.zz = np.sin(self.x)[None, :] * np.cos(self.y)[:, None]
+        self.rp = RixsDataPlotter(RixsData())
+
+    def tearDown(self):
+        plt.close('all')
+
+    def test_decimate(self):
+        zz = np.zeros((10, 9))
+        zz[3, 4] = 5.
+        zz[7, 1] = -5.
+        zzd = decimate2d(zz, 4, 4)
+        self.assertEqual(zzd.shape, (3, 3))
+        self.assertEqual(zzd[0, 1], 5.)
+        self.assertEqual(zzd[1, 0], -5.)
+        zzm = decimate2d(np.arange(16.).reshape(4, 4), 2, 2, mode='mean')
+        self.assertTrue(np.allclose(zzm, [[2.5, 4.5], [10.5, 12.5]]))
+        # NaN padding of the last blocks
+        self.assertEqual(decimate2d(np.ones((5, 5)), 2, 2, mode='mean')[-1, -1], 1.)
+        self.assertRaises(NameError, decimate2d, zz, 2, 2, 'median')
+
+    @unittest.skipUnless(HAS_CONTOURPY, 'contourpy not installed')
+    def test_cont_cache(self):
+        rp, zz = self.rp, self.zz
+        levels = np.linspace(-1., 1., 5)
+        segs = rp._get_segments('a', zz, self.x, self.y, zz, levels, 2)
+        self.assertTrue(rp._get_segments('a', zz, self.x, self.y, zz, levels, 2) is segs)
+        rp._get_segments('b', zz, self.x, self.y, zz, levels, 2)
+        rp._get_segments('c', zz, self.x, self.y, zz, levels, 2)
+        self.assertEqual([key for key, _zz, _segs in rp._cont_cache], ['b', 'c'])
+        # another plane with the same key is not taken from the cache
+        self.assertFalse(rp._get_segments('c', zz.copy(), self.x, self.y, zz, levels, 2) is segs)
+
+    def test_view(self):
+        rp = self.rp
+        rp.plot(self.x, self.y, self.zz, xmin=2., xmax=4., ymin=1., ymax=2.)
+        ext = rp.contf.get_extent()
+        self.assertTrue((ext[0] <= 2.) and (ext[0] > 1.9) and (ext[1] >= 4.) and (ext[1] < 4.1))
+        self.assertTrue((ext[2] <= 1.) and (ext[3] >= 2.))
+        ax0, cids0 = rp.plane, [cid for ax, cid in rp._cids]
+        # limits outside the data: full plane
+        rp.plot(self.x, self.y, self.zz, xmin=20., xmax=30., replace=False)
+        self.assertEqual(tuple(rp.contf.get_extent()), (0., 10., 0., 5.))
+        self.assertEqual(len(rp._cids), 2)
+        for cid in cids0:
+            self.assertFalse(cid in ax0.callbacks.callbacks.get('xlim_changed', {}))
+            self.assertFalse(cid in ax0.callbacks.callbacks.get('ylim_changed', {}))
+        # zoom refines the view
+        rp.plane.set_xlim(1., 2.)
+        ext = rp.contf.get_extent()
+        self.assertTrue((ext[0] <= 1.) and (ext[1] >= 2.) and (ext[1] < 2.1))
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRixsDataPlotter))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test RixsStack"""
+
+import unittest
+import numpy as np
+
+from sloth.rixs.rixsdata import RixsData
+from sloth.rixs.rixsstack import RixsStack
+
+def _plane(x, y, scale=1.):
+    """analytic plane z = scale * (2x + 3y) on the (x, y) grid"""
+    return x, y, scale * (2. * x[None, :] + 3. * y[:, None])
+
+class TestRixsStack(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.linspace(0., 1., 11)
+        self.y = np.linspace(0., 2., 21)
+
+    def test_lazy(self):
+        calls = []
+        def loader(i):
+            def _load():
+                calls.append(i)
+                return _plane(self.x, self.y, scale=i+1.)
+            return _load
+        rs = RixsStack()
+        for i in range(3):
+            rs.append_lazy(loader(i), label='p{0}'.format(i))
+        self.assertEqual(len(rs), 3)
+        self.assertEqual(calls, [])
+        self.assertTrue(np.allclose(rs[1], _plane(self.x, self.y, scale=2.)[2]))
+        # plane 0 first, for the shared grid
+        self.assertEqual(calls, [0, 1])
+        zzs = rs.zzs
+        self.assertEqual(zzs.shape, (3, self.y.size, self.x.size))
+        self.assertEqual(sorted(calls), [0, 1, 2])
+        rs.zzs
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(rs.labels, ['p0', 'p1', 'p2'])
+
+    def test_append(self):
+        rs = RixsStack()
+        nplanes = 37
+        for i in range(nplanes):
+            if i % 2:
+                rs.append(_plane(self.x, self.y, scale=i+1.))
+            else:
+                rs.append_lazy(lambda i=i: _plane(self.x, self.y, scale=i+1.))
+        self.assertEqual(len(rs), nplanes)
+        self.assertEqual(rs.zzs.shape[0], nplanes)
+        for i in range(nplanes):
+            self.assertTrue(np.allclose(rs[i], _plane(self.x, self.y, scale=i+1.)[2]))
+        # a RixsData object and its label
+        rd = RixsData(label='rd')
+        rd.x, rd.y, rd.zz = _plane(self.x, self.y)
+        rs.append(rd)
+        self.assertEqual(rs.labels[-1], 'rd')
+        self.assertTrue(np.allclose(rs[-1], rd.zz))
+        self.assertTrue(np.isclose(rs.iad(ref=0)[-1], 0.))
+
+    def test_first_grid(self):
+        rs = RixsStack()
+        xc, yc = np.linspace(-0.5, 1.5, 5), np.linspace(-1., 3., 9)
+        rs.append_lazy(lambda: _plane(xc, yc))
+        rs.append_lazy(lambda: _plane(self.x, self.y))
+        # the grid of plane 0 even if plane 1 is loaded first
+        zz = rs[1]
+        self.assertTrue(np.array_equal(rs.x, xc))
+        self.assertTrue(np.array_equal(rs.y, yc))
+        self.assertEqual(zz.shape, (yc.size, xc.size))
+        self.assertTrue(np.allclose(rs[0], _plane(xc, yc)[2]))
+
+    def test_regrid(self):
+        rs = RixsStack(x=self.x, y=self.y)
+        # coarser and wider grid: bilinear interpolation is exact for a plane
+        xc, yc = np.linspace(-0.5, 1.5, 5), np.linspace(-1., 3., 9)
+        rs.append(_plane(xc, yc))
+        rs.append(_plane(self.x, self.y))
+        self.assertTrue(np.allclose(rs[0], rs[1]))
+        # smaller grid: NaN outside
+        xs = np.linspace(0., 0.5, 6)
+        rs.append(_plane(xs, self.y))
+        zz = rs[2]
+        self.assertTrue(np.allclose(zz[:, self.x <= 0.5], rs[1][:, self.x <= 0.5]))
+        self.assertTrue(np.all(np.isnan(zz[:, self.x > 0.5 + 1E-9])))
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRixsStack))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
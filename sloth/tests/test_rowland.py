@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test Rowland circle geometry"""
+
+import os
+import sys
+import math
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from sloth.inst.rowland import RcHoriz, RcVert, theta_from_ene, ene_from_theta
+from sloth.inst.rowland import LayoutError, RowlandCircle, write_trajectory
+from sloth.inst.rowland import dth_from_ene
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+D_SI444 = 0.7838 # \AA
+
+class TestRowland(unittest.TestCase):
+
+    def setUp(self):
+        self.rc = RcHoriz(Rm=500., theta0=75., d=D_SI444, showInfos=False)
+
+    def test_vectorized(self):
+        rc = self.rc
+        enes = np.linspace(8200., 8400., 21)
+        thetas = rc.get_theta(enes)
+        self.assertEqual(thetas.shape, enes.shape)
+        for ene, th in zip(enes, thetas):
+            self.assertAlmostEqual(th, math.degrees(math.asin(rc.get_ene()*math.sin(rc.rtheta0)/ene)))
+        self.assertTrue(np.allclose(ene_from_theta(theta_from_ene(enes, D_SI444), D_SI444), enes))
+        edeltas = np.linspace(-5., 5., 11)
+        for meth in (rc.get_dth, rc.get_az_off, rc.get_ay_off):
+            offs = meth(edeltas)
+            self.assertTrue(np.allclose(offs, [meth(ede) for ede in edeltas]))
+        azs = rc.get_az_off(edeltas)
+        # NOTE: get_ene_off(get_az_off(ede)) is -ede
+        self.assertTrue(np.allclose(rc.get_ene_off(azs), -edeltas, atol=1e-2))
+        self.assertRaises(NameError, rc.get_theta, 100.)
+
+    def test_infos(self):
+        rc = RcHoriz(Rm=500., theta0=75., d=D_SI444, showInfos=False)
+        rc.showInfos = True
+        rtheta0, Rm = math.radians(60.), 1000.
+        stdout = sys.stdout
+        sys.stdout = out = StringIO()
+        try:
+            rc.get_az_off(2., rtheta0=rtheta0, Rm=Rm)
+        finally:
+            sys.stdout = stdout
+        lines = out.getvalue().splitlines()
+        # infos from the given arguments, not from the stored ones
+        dth = float(dth_from_ene(2., rtheta0, D_SI444))
+        self.assertTrue(np.isclose(float(lines[0].split()[3]), dth*1e6, atol=0.1))
+        self.assertTrue(np.isclose(float(lines[1].split('=')[-1]), dth * 2 * Rm * math.sin(rtheta0)))
+
+    def test_trajectory(self):
+        kws = dict(Rm=500., d=D_SI444, aWext=32., rSext=10., aL=97., showInfos=False)
+        enes = np.linspace(8200., 8400., 5)
+        aN = [-1, 0, 1, 2]
+        for rc in (RcHoriz(**kws), RcVert(**kws)):
+            cols, tab = rc.get_trajectory(enes, aN=aN)
+            self.assertEqual(tab.shape, (enes.size, 8 + 6*len(aN)))
+            for ene, row in zip(enes, tab):
+                rc.set_theta0(rc.get_theta(ene), showInfos=False)
+                self.assertTrue(np.allclose(row[5:8], rc.get_det_pos()))
+                for n in aN:
+                    chi = rc.get_chi2(n)
+                    icol = cols.index('chi{0}'.format(n))
+                    self.assertAlmostEqual(row[icol], chi)
+                    self.assertAlmostEqual(row[icol+2], rc.get_sag_off(rc.get_axoff(chi)))
+                    self.assertTrue(np.allclose(row[icol+3:icol+6], rc.get_ana_pos(chi)))
+                    # offset -> chi, as in the callers of get_ana_pos()
+                    self.assertAlmostEqual(rc.get_chi(rc.get_axoff(chi)), chi)
+                chis = [rc.get_chi2(n) for n in aN]
+                apos = rc.get_ana_pos(chis)
+                self.assertEqual(apos.shape, (len(aN), 3))
+                for chi, pos in zip(chis, apos):
+                    self.assertTrue(np.allclose(pos, rc.get_ana_pos(chi)))
+
+    def test_write_trajectory(self):
+        rc = RcVert(Rm=500., d=D_SI444, showInfos=False)
+        wdir = tempfile.mkdtemp()
+        try:
+            fname = os.path.join(wdir, 'traj.spec')
+            for ititle, title in enumerate(('a', 'b')):
+                cols, tab = rc.get_trajectory(np.linspace(8200., 8400., 3), aN=[0, 1])
+                self.assertEqual(write_trajectory(fname, cols, tab, title=title), ititle+1)
+            with open(fname) as f:
+                scans = [line.strip() for line in f if line.startswith('#S ')]
+            self.assertEqual(scans, ['#S 1 a', '#S 2 b'])
+        finally:
+            shutil.rmtree(wdir)
+        # no XYZ frame in the base class
+        self.assertRaises(NameError, RowlandCircle(Rm=500., d=D_SI444, showInfos=False).get_trajectory, [8300.])
+
+    def test_lut(self):
+        rc = RcVert(Rm=500., d=D_SI444, showInfos=False)
+        ths = np.linspace(46., 84., 101)
+        for motor in ('p', 'Rs', 'dz', 'ay', 'az'):
+            pos = rc.get_motor(motor, np.radians(ths))
+            thi = rc.get_theta_from_motor(motor, pos, thrange=(45., 85.), tol=1e-6)
+            self.assertTrue(np.allclose(thi, ths, atol=1e-6))
+        # cached per geometry
+        self.assertTrue(rc.get_lut('p', thrange=(45., 85.), tol=1e-6) is
+                        rc.get_lut('p', thrange=(45., 85.), tol=1e-6))
+        self.assertRaises(NameError, rc.get_lut, 'dz', thrange=(15., 85.))
+
+    def test_layout(self):
+        rc = RcHoriz(Rm=500., d=D_SI444, aW=25., aWext=32., rSext=10., aL=97.,
+                     bender=(40., 60., 28.), showInfos=False)
+        aN = [3, 4, 5, 6]
+        ths = [45., 65., 80.]
+        lay = rc.get_layout(aN, theta=ths)
+        self.assertEqual(lay['bender_axoff'].shape, (len(aN), len(ths)))
+        for ith, th in enumerate(ths):
+            rc.set_theta0(th, showInfos=False)
+            for ia, n in enumerate(aN):
+                chi = rc.get_chi2(n)
+                self.assertAlmostEqual(lay['chi'][ia, ith], chi)
+                self.assertAlmostEqual(lay['sagoff'][ia, ith], rc.get_sag_off(rc.get_axoff(chi)))
+                self.assertAlmostEqual(lay['ana_dist'][ia, ith], rc.get_ana_dist(chi, n))
+        # reference values from the scalar get_bender_pos() (before
+        # the vectorized version), rows aN, columns theta
+        ref_axoff = [[107.69633309817021, 102.29272404956464, 100.94372418757597],
+                     [146.0295502020164, 138.4259740166095, 136.49980276201043],
+                     [183.81027905728553, 174.35907107416773, 171.91326049773528],
+                     [220.89558004191937, 210.04005883201688, 207.14709589773966]]
+        ref_sagoff = [[-29.818253065195414, -33.96660243644561, -34.91813524756489],
+                      [-22.01130280980506, -29.38907982231585, -31.080068275647676],
+                      [-11.862384986441917, -23.441138807484172, -26.094840811197244],
+                      [0.5901029858413622, -16.131379639903244, -19.967661633330792]]
+        self.assertTrue(np.allclose(lay['bender_axoff'], ref_axoff, rtol=0, atol=1E-9))
+        self.assertTrue(np.allclose(lay['bender_sagoff'], ref_sagoff, rtol=0, atol=1E-9))
+        rc.set_theta0(ths[1], showInfos=False)
+        self.assertTrue(np.allclose(rc.get_bender_pos(aN[2]), (ref_axoff[2][1], ref_sagoff[2][1])))
+        self.assertRaises(LayoutError, rc.get_layout, [1, 2, 3], theta=ths)
+        lay = rc.get_layout([1, 2, 3], theta=ths, errors='nan')
+        self.assertTrue(np.all(np.isnan(lay['bender_axoff'][:2])))
+
+def suite():
+    test_suite = unittest.TestSuite()
+    test_suite.addTest(
+        unittest.defaultTestLoader.loadTestsFromTestCase(TestRowland))
+    return test_suite
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
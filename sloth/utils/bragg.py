@@ -40,14 +40,12 @@ def bragg_ev(d, theta, n=1):
 
 def theta_b(wlen, d, n=1):
     """return the Bragg angle, $\theta_{B}$, (deg) for a given wavelength
-    (\AA$^{-1}$) and d-spacing (\AA)"""
-    if not (d == 0):
-        try:
-            return np.rad2deg( np.arcsin( ( ( wlen * n ) / ( 2 * d ) ) ) )
-        except:
-            return 0
-    else:
-        return 0
+    (\AA$^{-1}$) and d-spacing (\AA), 0 where d is 0 and NaN where
+    the reflection is not reachable"""
+    d = np.asarray(d, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        theta = np.rad2deg( np.arcsin( ( ( wlen * n ) / ( 2 * d ) ) ) )
+    return np.where(d == 0, 0., theta)[()]
 
 def bragg_th(d, ene, n=1):
     """return the Bragg angle, $\theta_{B}$, (deg) for a given energy (eV) and d-spacing (\AA)"""
@@ -66,49 +64,58 @@ def de_bragg(theta, dth):
     return dth * cotdeg(theta)
 
 def sqrt1over(d2m):
-    if (d2m == 0):
-        return 0
-    else:
-        return np.sqrt( 1 / d2m )
+    """1/sqrt(d2m), 0 where d2m is 0 (scalar or array)"""
+    d2m = np.asarray(d2m, dtype=float)
+    inv = np.zeros_like(d2m)
+    np.divide(1., d2m, out=inv, where=(d2m != 0))
+    return np.sqrt(inv)[()]
+
+def _hkl(hkl):
+    """h, k, l from a (h, k, l) tuple or a (N, 3) array of reflections"""
+    hkl = np.asarray(hkl, dtype=float)
+    return hkl[..., 0], hkl[..., 1], hkl[..., 2]
+
+# NOTE: the d_* functions accept a single hkl or (N, 3) arrays of
+# reflections (returning (N) d-spacings), (0, 0, 0) gives 0
     
 def d_cubic(a, hkl, **kws):
     """d-spacing for a cubic lattice"""
-    h, k, l = hkl[0], hkl[1], hkl[2]
+    h, k, l = _hkl(hkl)
     d2m = (h**2 + k**2 + l**2) / a**2
     return sqrt1over(d2m)
 
 def d_tetragonal(a, c, hkl, **kws):
     """d-spacing for a tetragonal lattice"""
-    h, k, l = hkl[0], hkl[1], hkl[2]
+    h, k, l = _hkl(hkl)
     d2m = ( h**2 + k**2 ) / a**2 + ( l**2 / c**2 )
-    return np.sqrt( 1 / d2m )
+    return sqrt1over(d2m)
 
 def d_orthorhombic(a, b, c, hkl, **kws):
     """d-spacing for an orthorhombic lattice"""
-    h, k, l = hkl[0], hkl[1], hkl[2]
+    h, k, l = _hkl(hkl)
     d2m = ( h**2 / a**2 ) + ( k**2 / b**2 ) + ( l**2 / c**2 )
     return sqrt1over(d2m)
 
 def d_hexagonal(a, c, hkl, **kws):
     """d-spacing for an hexagonal lattice"""
-    h, k, l = hkl[0], hkl[1], hkl[2]
+    h, k, l = _hkl(hkl)
     d2m = 4./3. * ( ( h**2 + h * k + k**2 ) / a**2 ) + ( l**2 / c**2 )
     return sqrt1over(d2m)
 
 def d_monoclinic(a, b, c, beta, hkl, **kws):
     """d-spacing for a monoclinic lattice"""
-    h, k, l = hkl[0], hkl[1], hkl[2]
+    h, k, l = _hkl(hkl)
     rbeta = np.deg2rad(beta)
     d2m = 1. / np.sin( rbeta )**2 \
           * ( ( h**2 / a**2 ) \
-              + ( ( h**2 * np.sin( rbeta )**2 ) / b**2 ) \
+              + ( ( k**2 * np.sin( rbeta )**2 ) / b**2 ) \
               + ( l**2 / c**2 ) \
               - ( (2 * h * l * np.cos( rbeta ) / ( a * c ) ) ) )
     return sqrt1over(d2m)
 
 def d_triclinic(a, b, c, alpha, beta, gamma, hkl, **kws):
     """d-spacing for a triclinic lattice"""
-    h, k, l = hkl[0], hkl[1], hkl[2]
+    h, k, l = _hkl(hkl)
     ralpha = np.deg2rad(alpha)
     rbeta = np.deg2rad(beta)
     rgamma = np.deg2rad(gamma)
@@ -126,9 +133,35 @@ def d_triclinic(a, b, c, alpha, beta, gamma, hkl, **kws):
             + 2 * h * l * a * b**2 * c * ( cosralpha * cosrgamma - cosrbeta ) )
     return sqrt1over(d2m)
 
+def metric_tensor(a, b, c, alpha, beta, gamma):
+    r"""direct metric tensor G (3x3) of the unit cell (\AA, deg)"""
+    ca, cb, cg = [np.cos(np.deg2rad(ang)) for ang in (alpha, beta, gamma)]
+    return np.array([[a*a, a*b*cg, a*c*cb],
+                     [a*b*cg, b*b, b*c*ca],
+                     [a*c*cb, b*c*ca, c*c]])
+
+def d_metric(a, b, c, alpha, beta, gamma, hkl, **kws):
+    """d-spacing for any lattice system, from the reciprocal metric
+    tensor G* = G^-1: 1/d^2 = hkl G* hkl^T"""
+    gstar = np.linalg.inv(metric_tensor(a, b, c, alpha, beta, gamma))
+    hkl = np.asarray(hkl, dtype=float)
+    d2m = np.einsum('...i,ij,...j->...', hkl, gstar, hkl)
+    return sqrt1over(d2m)
+
+def get_cell(crystal):
+    """unit cell (a, b, c, alpha, beta, gamma) of a crystal in the
+    crystals file (data/crystals.dat, indexed once in memory)"""
+    from ..io.crystals_reader import get_crystal
+    return get_crystal(crystal)['cell']
+
+def d_crystal(crystal, hkl):
+    """d-spacing of a crystal in the crystals file (see get_cell)"""
+    return d_metric(*get_cell(crystal), hkl=hkl)
+
 def findhkl(energy, thetamin=65., crystal='all'):
     """findhkl: for a given energy (eV) finds the Si and Ge reflections
-    with relative Bragg angle
+    with relative Bragg angle (see reflections.find_reflections for
+    many energies and crystals at once)
 
     Usage
     =====
@@ -145,34 +178,17 @@ def findhkl(energy, thetamin=65., crystal='all'):
     """
     if energy is None:
         print(findhkl.__doc__)
+        return
 
-    import itertools
-    def _find_theta(crystal, alat):
-        def _structure_factor(idx):
-            """ fcc crystal: the structure factor is not 0 if h,k,l
-            are all odd or all even zincblende: as fcc but if all even
-            (0 is even) then h+k+l = 4n
-            """
-            #hkl = itertools.product(idx, idx, idx)
-            hkl = itertools.combinations_with_replacement(idx, 3)
-            for x in hkl:
-                # check all even
-                if (x[0]%2 == 0 and x[1]%2 == 0 and x[2]%2 == 0) and not ((x[0]+x[1]+x[2])%4 == 0):
-                    pass
-                else:
-                    theta = theta_b(ev2wlen(energy), d_cubic(alat, x))
-                    if (theta >= thetamin):
-                        print('{0}({1} {2} {3}), {4} {5:2.2f}'.format(crystal, x[0], x[1], x[2], 'Bragg', theta))
-        ###
-        _structure_factor(reversed(range(1, HKL_MAX, 2))) # all permutations of odd (h,k,l)
-        _structure_factor(reversed(range(0, HKL_MAX, 2))) # all permutations of even (h,k,l)
-    if crystal == 'Si':
-        _find_theta('Si', SI_ALAT)
-    elif crystal == 'Ge':
-        _find_theta('Ge', GE_ALAT)
+    from .reflections import find_reflections, SF_ALLOWED
+    if crystal in ('Si', 'Ge'):
+        crystals = [crystal]
     else:
-        _find_theta('Si', SI_ALAT)
-        _find_theta('Ge', GE_ALAT)
+        crystals = ['Si', 'Ge']
+    # precomputed catalogues (HKL_MAX), fcc/diamond allowed reflections
+    tab = find_reflections(energy, thetamin=thetamin, crystals=crystals, sfmin=SF_ALLOWED)
+    for row in tab:
+        print('{0}({1} {2} {3}), {4} {5:2.2f}'.format(row['crystal'], row['h'], row['k'], row['l'], 'Bragg', row['theta']))
 
 if __name__ == '__main__':
     pass
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Indexed catalogues of crystal reflections
+
+A catalogue (`ReflectionCatalogue`) stores all the reflections of a
+crystal up to a maximum hkl index as arrays sorted by d-spacing, with
+the Miller indices and a structure-factor flag (SF_*). A Bragg angle
+search for many energies at once is then a `searchsorted` on the
+d-spacings (theta >= thetamin <=> lambda/2 <= d <= lambda/(2
+sin(thetamin))) plus a vectorized arcsin on the selected reflections.
+
+Catalogues are built once per crystal and kept in memory (see
+get_catalogue). Crystals not in CRYSTALS are taken from the crystals
+file (data/crystals.dat, see sloth.io.crystals_reader), their flags are
+from the structure factors of the atoms in the cell (as for SiO2, with
+the atoms of AlphaQuartz).
+
+Usage
+-----
+>>> tab = find_reflections([8040., 8905., 9572.], thetamin=65.)
+>>> for row in tab: print(row['crystal'], row['h'], row['k'], row['l'], row['theta'])
+
+"""
+
+from __future__ import print_function, division
+
+import numpy as np
+
+from .bragg import (ev2wlen, d_metric, HKL_MAX, SI_ALAT, GE_ALAT, INSB_ALAT,
+                    SIO2_A, SIO2_C)
+from ..io.crystals_reader import get_crystal
+
+DEBUG = False
+
+### STRUCTURE FACTOR FLAGS ###
+SF_FORBIDDEN = 0
+SF_WEAK = 1    # e.g. zincblende all even h+k+l=4n+2: F = 4(fA-fB)
+SF_ALLOWED = 2
+SF_EPS = 1E-3  # |F|/F(000) below this is forbidden (sf_from_atoms, the
+               # atoms coordinates in crystals.dat have 4 digits)
+SF_WEAK_RATIO = 0.05  # |F|/F(000) below this is weak (sf_from_atoms)
+CHUNK_HKL = 20000  # reflections per chunk in sf_from_atoms
+
+### CRYSTALS ###
+# cell : (a, b, c, alpha, beta, gamma) in \AA and deg
+# system : lattice system, 'cubic' reflections are taken as h>=k>=l>=0
+#          (the d-spacings are from the metric tensor for all systems)
+# structure : extinction rule for the flags (None: all SF_ALLOWED)
+# atoms : name of the crystal in the crystals file whose atoms give the
+#         flags (see sf_from_atoms, structure is then ignored)
+CRYSTALS = {'Si' : {'cell' : (SI_ALAT, SI_ALAT, SI_ALAT, 90., 90., 90.),
+                    'system' : 'cubic', 'structure' : 'diamond'},
+            'Ge' : {'cell' : (GE_ALAT, GE_ALAT, GE_ALAT, 90., 90., 90.),
+                    'system' : 'cubic', 'structure' : 'diamond'},
+            'InSb' : {'cell' : (INSB_ALAT, INSB_ALAT, INSB_ALAT, 90., 90., 90.),
+                      'system' : 'cubic', 'structure' : 'zincblende'},
+            'SiO2' : {'cell' : (SIO2_A, SIO2_A, SIO2_C, 90., 90., 120.),
+                      'system' : 'hexagonal', 'atoms' : 'AlphaQuartz'}}
+
+TABLE_DTYPE = [('energy', 'f8'), ('crystal', 'U24'),
+               ('h', 'i4'), ('k', 'i4'), ('l', 'i4'),
+               ('d', 'f8'), ('theta', 'f8'), ('sf', 'i1')]
+
+_CATALOGUES = {}
+
+def sf_flags(hkl, structure=None):
+    """structure-factor flags (SF_*) of (N, 3) reflections for a given
+    structure: 'fcc', 'diamond', 'zincblende' or None (not checked)"""
+    hkl = np.asarray(hkl)
+    flags = np.full(hkl.shape[0], SF_ALLOWED, dtype=np.int8)
+    if structure is None:
+        return flags
+    structure = structure.lower()
+    if structure not in ('fcc', 'diamond', 'zincblende'):
+        raise NameError("structure '{0}' unknown".format(structure))
+    par = hkl % 2
+    odd, even = np.all(par == 1, axis=1), np.all(par == 0, axis=1)
+    flags[~(odd | even)] = SF_FORBIDDEN
+    if structure == 'fcc':
+        return flags
+    even4n2 = even & (hkl.sum(axis=1) % 4 != 0)
+    flags[even4n2] = SF_FORBIDDEN if (structure == 'diamond') else SF_WEAK
+    return flags
+
+def sf_from_atoms(hkl, atoms):
+    """structure-factor flags (SF_*) of (N, 3) reflections from the
+    atoms in the cell (structured array with 'Z', 'frac', 'x', 'y',
+    'z' fields, see crystals_reader), with f = Z (no angle dependence)
+    """
+    hkl = np.asarray(hkl, dtype=float)
+    fat = atoms['Z'] * atoms['frac']
+    xyz = np.column_stack((atoms['x'], atoms['y'], atoms['z']))
+    fabs = np.empty(hkl.shape[0])
+    for i0 in range(0, hkl.shape[0], CHUNK_HKL):
+        phase = 2 * np.pi * hkl[i0:i0+CHUNK_HKL].dot(xyz.T)
+        fabs[i0:i0+CHUNK_HKL] = np.hypot(np.cos(phase).dot(fat), np.sin(phase).dot(fat))
+    ratio = fabs / np.sum(fat)
+    flags = np.full(hkl.shape[0], SF_ALLOWED, dtype=np.int8)
+    flags[ratio < SF_WEAK_RATIO] = SF_WEAK
+    flags[ratio < SF_EPS] = SF_FORBIDDEN
+    return flags
+
+def _get_hkl(system, hkl_max):
+    """(N, 3) reflections with indices < hkl_max: one per family
+    h>=k>=l>=0 for 'cubic', otherwise the half space of all indices
+    (Friedel pairs counted once)"""
+    idx = np.arange(hkl_max)
+    if system == 'cubic':
+        h, k, l = np.meshgrid(idx, idx, idx, indexing='ij')
+        sel = (h >= k) & (k >= l) & (h > 0)
+        return np.column_stack((h[sel], k[sel], l[sel]))
+    idx = np.arange(-hkl_max+1, hkl_max)
+    h, k, l = [_i.ravel() for _i in np.meshgrid(idx, idx, idx, indexing='ij')]
+    sel = (h > 0) | ((h == 0) & (k > 0)) | ((h == 0) & (k == 0) & (l > 0))
+    return np.column_stack((h[sel], k[sel], l[sel]))
+
+class ReflectionCatalogue(object):
+    """reflections of a crystal sorted by d-spacing"""
+
+    def __init__(self, name, cell, system='cubic', structure=None, atoms=None,
+                 hkl_max=HKL_MAX):
+        """
+        Parameters
+        ----------
+        name : str, crystal name
+        cell : tuple, (a, b, c, alpha, beta, gamma) in \\AA and deg
+        system : str, ['cubic'] lattice system
+        structure : str, [None] extinction rule, see sf_flags()
+        atoms : structured array, [None] atoms in the cell, if given
+                the flags are from sf_from_atoms() (structure ignored)
+        hkl_max : int, [HKL_MAX] indices are < hkl_max
+
+        For non cubic systems, the reflections with the same d-spacing
+        (rounded to 1E-8 \\AA) are counted once (the one with the
+        highest flag)
+        """
+        self.name = name
+        self.cell = tuple(float(_p) for _p in cell)
+        self.system = system.lower()
+        self.structure = structure
+        hkl = _get_hkl(self.system, hkl_max)
+        d = d_metric(*self.cell, hkl=hkl)
+        if atoms is not None:
+            sf = sf_from_atoms(hkl, atoms)
+        else:
+            sf = sf_flags(hkl, structure)
+        if self.system != 'cubic':
+            dr = np.round(d, 8)
+            iord = np.lexsort((-sf, dr))
+            iu = iord[np.unique(dr[iord], return_index=True)[1]]
+            d, hkl, sf = d[iu], hkl[iu], sf[iu]
+        isort = np.argsort(d, kind='stable')
+        self.d = d[isort]
+        self.hkl = hkl[isort].astype(np.int32)
+        self.sf = sf[isort]
+        if DEBUG: print('DEBUG: {0} catalogue with {1} reflections'.format(name, self.d.size))
+
+    def __len__(self):
+        return self.d.size
+
+    def query(self, energies, thetamin=65., thetamax=90., sfmin=SF_WEAK):
+        """reflections with Bragg angle within [thetamin, thetamax] for
+        each energy
+
+        Parameters
+        ----------
+        energies : float or array of floats (eV)
+        thetamin, thetamax : floats, [65., 90.] Bragg angles range (deg)
+        sfmin : int, [SF_WEAK] minimum structure-factor flag
+
+        Returns
+        -------
+        tab : structured array (TABLE_DTYPE), sorted by energy and
+              decreasing Bragg angle
+        """
+        enes = np.atleast_1d(np.asarray(energies, dtype=float))
+        sel = (self.sf >= sfmin)
+        d, hkl, sf = self.d[sel], self.hkl[sel], self.sf[sel]
+        wlens = ev2wlen(enes)
+        # d is sorted: theta >= thetamin for d <= dmax, theta <= thetamax for d >= dmin
+        imin = np.searchsorted(d, wlens / (2. * np.sin(np.deg2rad(thetamax))), side='left')
+        imax = np.searchsorted(d, wlens / (2. * np.sin(np.deg2rad(thetamin))), side='right')
+        nsel = np.clip(imax - imin, 0, None)
+        ntot = int(nsel.sum())
+        iene = np.repeat(np.arange(enes.size), nsel)
+        # indices imin[i]...imax[i]-1 for each energy
+        ids = np.arange(ntot) - np.repeat(np.cumsum(nsel) - nsel, nsel) + np.repeat(imin, nsel)
+        tab = np.zeros(ntot, dtype=TABLE_DTYPE)
+        tab['energy'] = enes[iene]
+        tab['crystal'] = self.name
+        tab['h'], tab['k'], tab['l'] = hkl[ids, 0], hkl[ids, 1], hkl[ids, 2]
+        tab['d'] = d[ids]
+        tab['sf'] = sf[ids]
+        tab['theta'] = np.rad2deg(np.arcsin(np.clip(wlens[iene] / (2. * d[ids]), -1., 1.)))
+        # already by energy and increasing d (= decreasing theta)
+        return tab
+
+def get_catalogue(crystal, hkl_max=HKL_MAX):
+    """ReflectionCatalogue of a crystal in CRYSTALS or in the crystals
+    file (NameError if not found), built once"""
+    key = (crystal, hkl_max)
+    if key not in _CATALOGUES:
+        if crystal in CRYSTALS:
+            pars = dict(CRYSTALS[crystal])
+            if 'atoms' in pars:
+                pars['atoms'] = get_crystal(pars['atoms'])['atoms']
+            _CATALOGUES[key] = ReflectionCatalogue(crystal, hkl_max=hkl_max, **pars)
+        else:
+            crys = get_crystal(crystal)
+            _CATALOGUES[key] = ReflectionCatalogue(crys['name'], crys['cell'], system=crys['system'],
+                                                   atoms=crys['atoms'], hkl_max=hkl_max)
+    return _CATALOGUES[key]
+
+def find_reflections(energies, thetamin=65., thetamax=90., crystals=('Si', 'Ge'),
+                     sfmin=SF_WEAK):
+    """table of the reflections with Bragg angle >= thetamin for many
+    energies and crystals (see ReflectionCatalogue.query)
+
+    Returns
+    -------
+    tab : structured array (TABLE_DTYPE), sorted by energy, crystal and
+          decreasing Bragg angle
+    """
+    if isinstance(crystals, str):
+        crystals = [crystals]
+    tabs = [get_catalogue(crys).query(energies, thetamin=thetamin, thetamax=thetamax,
+                                      sfmin=sfmin) for crys in crystals]
+    tab = np.concatenate(tabs)
+    # stable sort: crystals order and decreasing theta are kept
+    return tab[np.argsort(tab['energy'], kind='stable')]
+
+if __name__ == '__main__':
+    pass